@@ -3,7 +3,7 @@ import asyncio
 from datetime import datetime, timedelta
 from typing import Union, Optional
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -15,9 +15,8 @@ from bot.keyboard.inline import (
     get_backup_list_keyboard, get_backup_info_keyboard
 )
 from bot.utils.messages import MessageTemplates
-from services.database import db
+from services.database import db, encode_cursor
 from services.api_monitor import api_monitor
-from services.backup_service import backup_service
 from bot.middlewares.i18n import i18n
 from core.config import settings
 from models.models import User, AdminLog, Generation, Transaction, SupportTicket
@@ -41,6 +40,9 @@ class AdminStates(StatesGroup):
 
 router = Router(name="admin")
 
+# Фоновые задачи обработчиков (ссылки держим до завершения)
+_background_tasks: set = set()
+
 # Декоратор для проверки админских прав
 def admin_only(func):
     """Декоратор для ограничения доступа только админам"""
@@ -87,6 +89,25 @@ async def admin_panel(message: Message, user: User, **kwargs):
         reply_markup=get_admin_keyboard(user.language_code or 'ru')
     )
 
+@router.message(F.text == "/reload_translations")
+@admin_only
+async def reload_translations(message: Message, **kwargs):
+    """Перечитать файлы переводов без перезапуска"""
+    import signal
+    from core.launcher import signal_all_workers
+    
+    # При нескольких воркерах перезагрузка придет сигналом и в этот процесс
+    if hasattr(signal, 'SIGHUP') and signal_all_workers(signal.SIGHUP):
+        await message.answer("🔄 Перезагрузка переводов отправлена всем воркерам")
+    else:
+        i18n.reload()
+        await message.answer(f"🔄 Переводы перезагружены: {', '.join(sorted(i18n.translations))}")
+    
+    await db.log_admin_action(
+        admin_id=message.from_user.id,
+        action="reload_translations"
+    )
+
 @router.callback_query(F.data == "admin_stats")
 @admin_only
 async def show_admin_stats(callback: CallbackQuery, **kwargs):
@@ -384,6 +405,192 @@ async def check_api_balance(callback: CallbackQuery, **kwargs):
         logger.error(f"Error checking API balance: {e}")
         await callback.answer("❌ Ошибка при проверке баланса", show_alert=True)
 
+@router.callback_query(F.data == "admin_diagnostics")
+@admin_only
+async def show_diagnostics(callback: CallbackQuery, **kwargs):
+    """Меню диагностики живого процесса"""
+    text = (
+        "🩺 <b>Диагностика</b>\n\n"
+        "🔥 <b>Профиль CPU</b> - семплирование стека event loop, "
+        "результат в формате collapsed stacks (flamegraph.pl, speedscope)\n"
+        "🧵 <b>Задачи asyncio</b> - все незавершенные задачи и где они ждут\n"
+        "🐢 <b>Запросы к БД</b> - время запросов по методам DatabaseService и ожидание пула"
+    )
+    
+    builder = InlineKeyboardBuilder()
+    for seconds in (10, 30, 60):
+        builder.button(text=f"🔥 Профиль {seconds} сек", callback_data=f"diag_profile_{seconds}")
+    builder.button(text="🧵 Задачи asyncio", callback_data="diag_tasks")
+    builder.button(text="🐢 Запросы к БД", callback_data="diag_queries")
+    builder.button(text="◀️ Назад", callback_data="admin_menu")
+    builder.adjust(3, 1, 1, 1)
+    
+    await callback.message.edit_text(text, reply_markup=builder.as_markup())
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("diag_profile_"))
+@admin_only
+async def run_cpu_profile(callback: CallbackQuery, **kwargs):
+    """Запустить семплирующий профайлер (результат придет документом)"""
+    from services.diagnostics import profiler
+    
+    try:
+        seconds = min(int(callback.data.split("_")[-1]), 120)
+    except ValueError:
+        await callback.answer("❌ Неверная длительность", show_alert=True)
+        return
+    
+    if profiler.is_running:
+        await callback.answer("⏳ Профилирование уже запущено", show_alert=True)
+        return
+    
+    # Профиль пишется в фоне: обработчик не держит очередь апдейтов на время записи
+    task = asyncio.create_task(
+        send_cpu_profile(callback.message, callback.from_user.id, seconds),
+        name=f"cpu-profile-{seconds}"
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    
+    await callback.answer(f"🔥 Профилирую {seconds} сек...")
+
+async def send_cpu_profile(message: Message, admin_id: int, seconds: int):
+    """Снять профиль и отправить его документом"""
+    from aiogram.types import BufferedInputFile
+    from services.diagnostics import profiler, format_folded, top_functions
+    
+    try:
+        result = await profiler.profile(seconds)
+    except RuntimeError:
+        await message.answer("⏳ Профилирование уже запущено")
+        return
+    except Exception as e:
+        logger.error(f"Error running profiler: {e}")
+        await message.answer("❌ Ошибка профилирования")
+        return
+    
+    total = result['samples'] or 1
+    top_lines = "\n".join(
+        f"{count * 100 / total:5.1f}% <code>{name}</code>"
+        for name, count in top_functions(result['stacks'], 8)
+    )
+    caption = (
+        f"🔥 <b>Профиль CPU</b> ({result['duration']:.0f} сек)\n"
+        f"Семплов: {result['samples']}, накладные расходы: {result['overhead_percent']:.2f}%\n\n"
+        f"<b>Топ по собственному времени:</b>\n{top_lines}"
+    )
+    
+    try:
+        filename = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+        await message.answer_document(
+            BufferedInputFile(format_folded(result['stacks']).encode('utf-8'), filename=filename),
+            caption=caption[:1024]
+        )
+    except Exception as e:
+        logger.error(f"Error sending profile: {e}")
+    
+    await db.log_admin_action(
+        admin_id=admin_id,
+        action="cpu_profile",
+        details={'seconds': seconds, 'samples': result['samples']}
+    )
+
+@router.callback_query(F.data == "diag_tasks")
+@admin_only
+async def dump_asyncio_tasks(callback: CallbackQuery, **kwargs):
+    """Дамп незавершенных asyncio-задач"""
+    from aiogram.types import BufferedInputFile
+    from services.diagnostics import dump_tasks
+    
+    await callback.answer("🧵 Собираю задачи...")
+    
+    snapshot = dump_tasks()
+    summary = "\n".join(
+        f"{count:4d}  <code>{name}</code>"
+        for name, count in snapshot['by_coroutine'].most_common(15)
+    )
+    caption = f"🧵 <b>Задачи asyncio</b>: {snapshot['total']}\n\n{summary}"
+    
+    filename = f"tasks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    await callback.message.answer_document(
+        BufferedInputFile(snapshot['text'].encode('utf-8'), filename=filename),
+        caption=caption[:1024]
+    )
+
+@router.callback_query(F.data.in_({"diag_queries", "diag_queries_reset"}))
+@admin_only
+async def show_query_stats(callback: CallbackQuery, **kwargs):
+    """Самые затратные запросы к БД в этом воркере"""
+    from html import escape
+    from services.query_stats import query_stats
+    
+    if callback.data == "diag_queries_reset":
+        query_stats.reset()
+    
+    report = query_stats.get_report(limit=8)
+    pool = report['pool_wait']
+    lines = [
+        "🐢 <b>Запросы к БД</b> (текущий воркер, "
+        f"с {datetime.fromtimestamp(report['since']).strftime('%d.%m %H:%M')})\n",
+        f"Запросов: {report['statements']}, время: {report['total_ms'] / 1000:.1f} сек",
+        f"Медленных (&gt; {report['slow_threshold_ms']:.0f} мс): {report['slow_total']}",
+        f"Ожидание пула: p50 {pool['p50_ms']} / p95 {pool['p95_ms']} / p99 {pool['p99_ms']} мс, "
+        f"макс {pool['max_ms']} мс"
+    ]
+    routing = db.get_read_routing_stats()
+    if routing['replica_configured']:
+        lag = routing['replica_lag']
+        lines.append(
+            f"Реплика: {'недоступна' if routing['replica_down'] else 'доступна'}, "
+            f"отставание {'?' if lag is None else f'{lag:.1f}'} сек"
+        )
+    for route, counters in routing['routes'].items():
+        lines.append(
+            f"  {escape(route)}: реплика {counters['replica']}, основная {counters['primary']}, "
+            f"fallback {counters['lagging'] + counters['unavailable']}"
+        )
+    lines.append("")
+    for item in report['queries']:
+        lines.append(
+            f"<b>{escape(item['method'])}</b> <code>{item['id']}</code>\n"
+            f"  {item['count']}× всего {item['total_ms']:.0f} мс, "
+            f"p50/p95/p99 {item['p50_ms']}/{item['p95_ms']}/{item['p99_ms']} мс, строк ~{item['avg_rows']}\n"
+            f"  <code>{escape(item['fingerprint'][:150])}</code>"
+        )
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔄 Обновить", callback_data="diag_queries")
+    builder.button(text="📄 Полный отчет", callback_data="diag_queries_file")
+    builder.button(text="🧹 Сбросить", callback_data="diag_queries_reset")
+    builder.button(text="◀️ Назад", callback_data="admin_diagnostics")
+    builder.adjust(2, 2)
+    
+    await callback.message.edit_text("\n".join(lines)[:4096], reply_markup=builder.as_markup())
+    await callback.answer()
+
+@router.callback_query(F.data == "diag_queries_file")
+@admin_only
+async def send_query_stats_file(callback: CallbackQuery, **kwargs):
+    """Все отпечатки запросов файлом"""
+    from aiogram.types import BufferedInputFile
+    from services.query_stats import query_stats
+    
+    report = query_stats.get_report(limit=query_stats.max_fingerprints)
+    text = "\n\n".join(
+        f"{item['id']} {item['method']}\n"
+        f"count={item['count']} total_ms={item['total_ms']} p50_ms={item['p50_ms']} "
+        f"p95_ms={item['p95_ms']} p99_ms={item['p99_ms']} max_ms={item['max_ms']} rows={item['rows']}\n"
+        f"{item['fingerprint']}"
+        for item in report['queries']
+    )
+    
+    await callback.answer()
+    filename = f"queries_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    await callback.message.answer_document(
+        BufferedInputFile((text or "no queries").encode('utf-8'), filename=filename),
+        caption=f"🐢 Запросов: {report['statements']}, отпечатков: {len(report['queries'])}"
+    )
+
 # Вспомогательные функции
 
 async def get_detailed_statistics() -> dict:
@@ -474,6 +681,7 @@ async def broadcast_to_users(bot, admin_id: int, message_id: int) -> int:
     """Выполнить рассылку сообщения (оптимизированная версия)"""
     success_count = 0
     failed_count = 0
+    processed = 0
     batch_size = 100  # Обрабатываем по 100 пользователей за раз
     
     # Получаем общее количество пользователей
@@ -483,9 +691,13 @@ async def broadcast_to_users(bot, admin_id: int, message_id: int) -> int:
     
     logger.info(f"Starting broadcast to {total_users} users")
     
-    # Обрабатываем пользователей батчами
-    for offset in range(0, total_users, batch_size):
-        users = await db.get_all_users(limit=batch_size, offset=offset)
+    # Обрабатываем пользователей батчами: курсор не сдвигается от новых регистраций
+    cursor = None
+    while True:
+        users = await db.get_all_users(limit=batch_size, after=cursor)
+        if not users:
+            break
+        cursor = encode_cursor(users[-1])
         
         for user in users:
             try:
@@ -500,9 +712,13 @@ async def broadcast_to_users(bot, admin_id: int, message_id: int) -> int:
                 failed_count += 1
                 logger.error(f"Broadcast error for user {user.telegram_id}: {e}")
         
+        processed += len(users)
+        logger.info(f"Broadcast progress: {processed}/{total_users}")
+        if len(users) < batch_size:
+            break
+        
         # Даем серверу отдохнуть между батчами
         await asyncio.sleep(1)
-        logger.info(f"Broadcast progress: {offset + len(users)}/{total_users}")
     
     logger.info(f"Broadcast completed: {success_count} success, {failed_count} failed")
     return success_count
@@ -529,6 +745,7 @@ async def process_credits_change(
                 user.total_spent += abs(amount)
             
             await session.commit()
+            db.invalidate_user_cache(user_id=user_id)
             
             # Логируем действие
             await db.log_admin_action(
@@ -603,12 +820,17 @@ def format_api_balance_message(balance_check: dict) -> str:
 
 # === BACKUP HANDLERS ===
 
+def get_backup_service():
+    """Сервис бэкапов: загружается при первом обращении, а не при старте бота"""
+    from services.backup_service import backup_service
+    return backup_service
+
 @router.callback_query(F.data == "admin_backup")
 @admin_only
 @ensure_user
 async def backup_menu(callback: CallbackQuery, user: User, **kwargs):
     """Меню управления бэкапами"""
-    stats = await backup_service.get_backup_stats()
+    stats = await get_backup_service().get_backup_stats()
     
     text = f"""
 💾 <b>Управление бэкапами базы данных</b>
@@ -653,7 +875,7 @@ async def backup_create_with_description(message: Message, state: FSMContext, us
     status_msg = await message.answer("⏳ Создание бэкапа... Пожалуйста, подождите.")
     
     try:
-        success, result_msg, file_path = await backup_service.create_backup(description)
+        success, result_msg, file_path = await get_backup_service().create_backup(description)
         
         if success:
             await status_msg.edit_text(
@@ -688,7 +910,7 @@ async def backup_list(callback: CallbackQuery, user: User, **kwargs):
     await callback.answer("🔄 Загрузка списка бэкапов...")
     
     try:
-        backups = await backup_service.list_backups()
+        backups = await get_backup_service().list_backups()
         
         if not backups:
             await callback.message.edit_text(
@@ -728,7 +950,7 @@ async def backup_info(callback: CallbackQuery, user: User, **kwargs):
     filename = callback.data.replace("backup_info_", "")
     
     try:
-        backups = await backup_service.list_backups()
+        backups = await get_backup_service().list_backups()
         backup = next((b for b in backups if b['filename'] == filename), None)
         
         if not backup:
@@ -763,7 +985,7 @@ async def backup_delete(callback: CallbackQuery, user: User, **kwargs):
     filename = callback.data.replace("backup_delete_", "")
     
     try:
-        success, message = await backup_service.delete_backup(filename)
+        success, message = await get_backup_service().delete_backup(filename)
         
         if success:
             await callback.answer("✅ Бэкап удален")
@@ -799,7 +1021,7 @@ async def backup_restore(callback: CallbackQuery, state: FSMContext):
     
     # Получаем информацию о бэкапе
     try:
-        backups = await backup_service.list_backups()
+        backups = await get_backup_service().list_backups()
         backup = next((b for b in backups if b['filename'] == filename), None)
         
         if not backup:
@@ -879,7 +1101,7 @@ async def backup_restore_confirm(message: Message, state: FSMContext, user: User
     await message.answer("🔄 Создание защитного бэкапа перед восстановлением...")
     
     try:
-        success, backup_msg, backup_path = await backup_service.create_backup(
+        success, backup_msg, backup_path = await get_backup_service().create_backup(
             f"Автобэкап перед восстановлением {filename}"
         )
         
@@ -905,7 +1127,7 @@ async def backup_restore_confirm(message: Message, state: FSMContext, user: User
     status_msg = await message.answer("⏳ <b>ВОССТАНОВЛЕНИЕ БАЗЫ ДАННЫХ...</b>\n\n⚠️ НЕ ПЕРЕЗАГРУЖАЙТЕ БОТА!")
     
     try:
-        success, result_msg = await backup_service.restore_backup(filename)
+        success, result_msg = await get_backup_service().restore_backup(filename)
         
         if success:
             # Логируем критическую операцию
@@ -956,7 +1178,7 @@ async def backup_restore_confirm(message: Message, state: FSMContext, user: User
 async def backup_stats(callback: CallbackQuery, user: User, **kwargs):
     """Статистика бэкапов"""
     try:
-        stats = await backup_service.get_backup_stats()
+        stats = await get_backup_service().get_backup_stats()
         
         text = f"""
 📊 <b>Статистика бэкапов</b>
@@ -1005,7 +1227,7 @@ async def backup_cleanup(callback: CallbackQuery, user: User, **kwargs):
     await callback.answer("🧹 Очистка старых бэкапов...")
     
     try:
-        deleted_count, message = await backup_service.cleanup_old_backups(days=7)
+        deleted_count, message = await get_backup_service().cleanup_old_backups(days=7)
         
         await callback.message.edit_text(
             text=message,
@@ -1626,7 +1848,7 @@ async def admin_users_menu(callback: CallbackQuery, **kwargs):
         user = await db.get_user(callback.from_user.id)
         _ = lambda key, **kwargs: i18n.get(key, user.language_code or 'ru', **kwargs)
         
-        async with db.async_session() as session:
+        async with db.read_session('admin_stats') as session:
             # Получаем статистику пользователей
             total_users_result = await session.execute(select(func.count(User.id)))
             total_users = total_users_result.scalar()
@@ -1697,38 +1919,49 @@ async def users_list(callback: CallbackQuery, **kwargs):
         user = await db.get_user(callback.from_user.id)
         _ = lambda key, **kwargs: i18n.get(key, user.language_code or 'ru', **kwargs)
         
-        list_type = callback.data.split("_")[-1]  # active, banned, admins, premium
-        page = 1  # TODO: добавить пагинацию
+        # users_list_<тип>[_<a|b><курсор>]: тип - active, banned, admins, premium
+        parts = callback.data.split("_", 3)
+        list_type = parts[2]
+        cursor = parts[3] if len(parts) > 3 else ""
+        after = cursor[1:] if cursor.startswith("a") else None
+        before = cursor[1:] if cursor.startswith("b") else None
         limit = 10
         
-        async with db.async_session() as session:
-            # Фильтрация по типу списка
-            if list_type == "active":
-                query = select(User).where(User.last_active >= datetime.now() - timedelta(days=30))
-                count_query = select(func.count(User.id)).where(User.last_active >= datetime.now() - timedelta(days=30))
-                title = "🟢 Активные пользователи (30 дней)"
-            elif list_type == "banned":
-                query = select(User).where(User.is_banned == True)
-                count_query = select(func.count(User.id)).where(User.is_banned == True)
-                title = "🚫 Заблокированные пользователи"
-            elif list_type == "admins":
-                query = select(User).where(User.is_admin == True)
-                count_query = select(func.count(User.id)).where(User.is_admin == True)
-                title = "⭐ Администраторы"
-            elif list_type == "premium":
-                query = select(User).where(User.is_premium == True)
-                count_query = select(func.count(User.id)).where(User.is_premium == True)
-                title = "💎 Premium пользователи"
-            else:
-                query = select(User)
-                count_query = select(func.count(User.id))
-                title = "👥 Все пользователи"
-            
-            # Получаем пользователей
-            query = query.order_by(User.created_at.desc()).limit(limit)
-            result = await session.execute(query)
-            users_list = result.scalars().all()
-            
+        # Фильтрация по типу списка
+        filters = {}
+        if list_type == "active":
+            active_since = datetime.now() - timedelta(days=30)
+            filters = {'active_since': active_since}
+            count_query = select(func.count(User.id)).where(User.last_active >= active_since)
+            title = "🟢 Активные пользователи (30 дней)"
+        elif list_type == "banned":
+            filters = {'only_banned': True}
+            count_query = select(func.count(User.id)).where(User.is_banned == True)
+            title = "🚫 Заблокированные пользователи"
+        elif list_type == "admins":
+            filters = {'only_admins': True}
+            count_query = select(func.count(User.id)).where(User.is_admin == True)
+            title = "⭐ Администраторы"
+        elif list_type == "premium":
+            filters = {'only_premium': True}
+            count_query = select(func.count(User.id)).where(User.is_premium == True)
+            title = "💎 Premium пользователи"
+        else:
+            count_query = select(func.count(User.id))
+            title = "👥 Все пользователи"
+        
+        # Получаем пользователей: лишняя строка в направлении перехода показывает,
+        # есть ли дальше еще страница; в обратную сторону страница есть всегда,
+        # раз мы пришли оттуда по курсору
+        users_list = await db.get_all_users(limit=limit + 1, after=after, before=before, **filters)
+        if before:
+            has_prev, has_next = len(users_list) > limit, True
+            users_list = users_list[-limit:]
+        else:
+            has_prev, has_next = bool(after), len(users_list) > limit
+            users_list = users_list[:limit]
+        
+        async with db.read_session('admin_stats') as session:
             count_result = await session.execute(count_query)
             total = count_result.scalar()
         
@@ -1754,8 +1987,19 @@ async def users_list(callback: CallbackQuery, **kwargs):
                 text += f"   Регистрация: {u.created_at.strftime('%d.%m.%Y') if u.created_at else 'Неизвестно'}\n\n"
         
         builder = InlineKeyboardBuilder()
-        builder.button(text="🔍 Поиск пользователя", callback_data="user_search")
-        builder.button(text="◀️ К управлению пользователями", callback_data="admin_users")
+        nav_buttons = []
+        if users_list and has_prev:
+            nav_buttons.append(InlineKeyboardButton(
+                text="◀️", callback_data=f"users_list_{list_type}_b{encode_cursor(users_list[0])}"
+            ))
+        if users_list and has_next:
+            nav_buttons.append(InlineKeyboardButton(
+                text="▶️", callback_data=f"users_list_{list_type}_a{encode_cursor(users_list[-1])}"
+            ))
+        if nav_buttons:
+            builder.row(*nav_buttons)
+        builder.row(InlineKeyboardButton(text="🔍 Поиск пользователя", callback_data="user_search"))
+        builder.row(InlineKeyboardButton(text="◀️ К управлению пользователями", callback_data="admin_users"))
         
         await callback.message.edit_text(text[:4096], reply_markup=builder.as_markup())  # Telegram limit
         
@@ -5,6 +5,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from bot.keyboard.inline import get_history_keyboard, get_back_keyboard
 from bot.utils.messages import MessageTemplates
+from bot.utils.screens import USER_STATISTICS
 from services.database import db
 from core.constants import STATUS_EMOJIS, GenerationStatus
 from bot.middlewares.i18n import i18n
@@ -16,8 +17,13 @@ router = Router(name="balance")
 
 @router.message(F.text == "/history")
 @router.callback_query(F.data == "history")
-async def show_history(update: Message | CallbackQuery, page: int = 1):
-    """Показать историю генераций"""
+async def show_history(
+    update: Message | CallbackQuery,
+    page: int = 1,
+    after: str | None = None,
+    before: str | None = None
+):
+    """Показать историю генераций (after/before - курсоры соседней страницы)"""
     user_id = update.from_user.id
     user = await db.get_user(user_id)
     
@@ -33,12 +39,14 @@ async def show_history(update: Message | CallbackQuery, page: int = 1):
     
     # Получаем генерации
     limit = 10
-    offset = (page - 1) * limit
-    generations = await db.get_user_generations(user.id, limit=limit, offset=offset)
+    if after or before:
+        generations = await db.get_user_generations(user.id, limit=limit, after=after, before=before)
+    else:
+        # Старые кнопки "history_page_N" без курсора
+        generations = await db.get_user_generations(user.id, limit=limit, offset=(page - 1) * limit)
     
-    # Получаем общее количество
-    stats = await db.get_user_statistics(user_id)
-    total_generations = stats.get('total_generations', 0)
+    # Получаем количество сохраненных генераций (user_stats считает и удаленные старые)
+    total_generations = await db.get_user_generations_count(user.id)
     total_pages = max(1, (total_generations + limit - 1) // limit)
     
     if not generations:
@@ -79,10 +87,17 @@ async def show_history(update: Message | CallbackQuery, page: int = 1):
 
 @router.callback_query(F.data.startswith("history_page_"))
 async def history_pagination(callback: CallbackQuery):
-    """Переход по страницам истории"""
+    """Переход по страницам истории: history_page_<номер>_<a|b><курсор>"""
     try:
-        page = int(callback.data.split("_")[2])
-        await show_history(callback, page=page)
+        parts = callback.data.split("_", 3)
+        page = int(parts[2])
+        cursor = parts[3] if len(parts) > 3 else ""
+        await show_history(
+            callback,
+            page=page,
+            after=cursor[1:] if cursor.startswith("a") else None,
+            before=cursor[1:] if cursor.startswith("b") else None
+        )
     except ValueError:
         await callback.answer(_('errors.navigation'), show_alert=True)
 
@@ -366,29 +381,24 @@ async def show_statistics(callback: CallbackQuery):
         days_since_reg = (datetime.utcnow() - user.created_at).days or 1
         avg_gen_per_day = stats.get('total_generations', 0) / days_since_reg
     
-    text = f"📊 <b>{_('statistics.title', default='Статистика')}</b>\n\n"
-    text += f"👤 <b>{_('statistics.profile', default='Профиль')}:</b>\n"
-    text += f"├ 🆔 ID: <code>{user.telegram_id}</code>\n"
-    text += f"├ 📅 {_('statistics.registration', default='Регистрация')}: {reg_date}\n"
-    text += f"└ 🌐 {_('statistics.language', default='Язык')}: {language_name}\n\n"
-    
-    text += f"💰 <b>{_('statistics.balance', default='Баланс')}:</b>\n"
-    text += f"├ 💳 {_('statistics.current', default='Текущий')}: {user.balance} {_('common.credits')}\n"
-    text += f"├ 📥 {_('statistics.total_bought', default='Куплено')}: {user.total_bought} {_('common.credits')}\n"
-    text += f"├ 🎁 {_('statistics.bonuses_received', default='Получено бонусов')}: {stats.get('total_bonuses', 0)} {_('common.credits')}\n"
-    text += f"└ 📤 {_('statistics.total_spent', default='Потрачено')}: {user.total_spent} {_('common.credits')}\n\n"
-    
-    text += f"🎬 <b>{_('statistics.generations', default='Генерации')}:</b>\n"
-    text += f"├ 📊 {_('statistics.total', default='Всего')}: {stats.get('total_generations', 0)}\n"
-    text += f"├ ✅ {_('statistics.successful', default='Успешных')}: {stats.get('successful_generations', 0)}\n"
-    text += f"├ ❌ {_('statistics.failed', default='Неудачных')}: {stats.get('total_generations', 0) - stats.get('successful_generations', 0)}\n"
-    text += f"├ ⭐ {_('statistics.avg_rating', default='Средняя оценка')}: {stats.get('average_rating', 0):.1f}/5\n"
-    text += f"└ 📈 {_('statistics.avg_per_day', default='В среднем в день')}: {avg_gen_per_day:.1f}\n\n"
-    
-    text += f"📈 <b>{_('statistics.activity', default='Активность')}:</b>\n"
-    text += f"├ 📅 {_('statistics.last_generation', default='Последняя генерация')}: {last_gen}\n"
-    text += f"├ 🔥 {_('statistics.current_streak', default='Текущая серия')}: {stats.get('current_streak', 0)} {_('common.days', default='дней')}\n"
-    text += f"└ 🏆 {_('statistics.max_streak', default='Максимальная серия')}: {stats.get('max_streak', 0)} {_('common.days', default='дней')}"
+    text = USER_STATISTICS.render(
+        user.language_code or 'ru',
+        telegram_id=user.telegram_id,
+        reg_date=reg_date,
+        language_name=language_name,
+        balance=user.balance,
+        total_bought=user.total_bought,
+        total_bonuses=stats.get('total_bonuses', 0),
+        total_spent=user.total_spent,
+        total_generations=stats.get('total_generations', 0),
+        successful_generations=stats.get('successful_generations', 0),
+        failed_generations=stats.get('total_generations', 0) - stats.get('successful_generations', 0),
+        average_rating=stats.get('average_rating', 0),
+        avg_per_day=avg_gen_per_day,
+        last_generation=last_gen,
+        current_streak=stats.get('current_streak', 0),
+        max_streak=stats.get('max_streak', 0)
+    )
     
     # Кнопки
     builder = InlineKeyboardBuilder()
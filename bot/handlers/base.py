@@ -2,10 +2,9 @@ import logging
 from typing import Tuple, Union, Optional
 from aiogram.types import Message, CallbackQuery
 from aiogram import Bot
-from models.models import User, AdminLog
+from models.models import User
 from services.database import db
 from bot.middlewares.i18n import get_translator
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -73,14 +72,12 @@ class BaseHandler:
             target_user_id: ID целевого пользователя (если применимо)
         """
         try:
-            admin_log = AdminLog(
-                admin_id=admin_id,
-                action=action,
-                details=details,
+            await db.log_admin_action(
+                admin_id,
+                action,
                 target_user_id=target_user_id,
-                timestamp=datetime.utcnow()
+                details=details or None
             )
-            await db.save_admin_log(admin_log)
             
             logger.info(f"Админ {admin_id} выполнил действие: {action} | {details}")
             
@@ -14,6 +14,7 @@ from bot.keyboard.inline import (
     get_generation_rating_keyboard, get_cancel_keyboard
 )
 from bot.utils.messages import MessageTemplates
+from bot.utils.screens import GENERATION_CONFIRMATION, GENERATION_STARTED, GENERATION_PROGRESS
 from services.database import db
 from services.wavespeed_api import get_wavespeed_api, GenerationRequest, calculate_generation_cost
 from services.api_monitor import api_monitor
@@ -675,41 +676,26 @@ async def show_generation_confirmation(message: Message, state: FSMContext):
         aspect_ratio = data.get('aspect_ratio', '16:9')
         audio_text = None
     
-    # Создаем красивое сообщение подтверждения
-    text = f"""
-{_("generation.beautiful.divider")}
-{_("generation.beautiful.create_title")}
-{_("generation.beautiful.ai_magic")}
-{_("generation.beautiful.divider")}
-
-{_("generation.beautiful.confirmation")}
-{_("generation.beautiful.generation_summary")}
-
-📋 <b>Параметры генерации:</b>
-├ 🎯 Режим: {mode_text}
-├ 🤖 Модель: {model_text}
-├ 📐 Разрешение: {resolution_text}
-├ ⏱️ Длительность: {duration_text}"""
-    
+    # Дополнительные параметры зависят от модели
+    extra_params = ""
     if data['model_type'] not in ["veo3", "veo3_fast"] and data['mode'] == 't2v':
-        text += f"\n├ 🖼️ Формат: {aspect_ratio}"
+        extra_params = f"\n├ 🖼️ Формат: {aspect_ratio}"
     elif data['model_type'] in ["veo3", "veo3_fast"]:
-        text += f"\n├ 🖼️ Формат: {aspect_ratio}"
-        text += f"\n├ 🎵 Аудио: {audio_text}"
-    
-    text += f"\n└ 💰 Стоимость: {cost} кредитов"
+        extra_params = f"\n├ 🖼️ Формат: {aspect_ratio}\n├ 🎵 Аудио: {audio_text}"
     
-    text += f"""
-
-📝 <b>Ваш промпт:</b>
-<i>"{data['prompt'][:300]}{'...' if len(data['prompt']) > 300 else ''}"</i>
-
-💰 <b>Баланс:</b> {balance} кредитов{balance_status}
-
-{_("generation.beautiful.all_set")}
-
-{_("generation.beautiful.divider")}
-"""
+    # Создаем красивое сообщение подтверждения
+    text = GENERATION_CONFIRMATION.render(
+        user.language_code or 'ru',
+        mode=mode_text,
+        model=model_text,
+        resolution=resolution_text,
+        duration=duration_text,
+        extra_params=extra_params,
+        cost=cost,
+        prompt=f"{data['prompt'][:300]}{'...' if len(data['prompt']) > 300 else ''}",
+        balance=balance,
+        balance_status=balance_status
+    )
     
     # Сохраняем стоимость
     await state.update_data(cost=cost, model=model_name)
@@ -747,22 +733,20 @@ async def confirm_generation(callback: CallbackQuery, state: FSMContext):
         return
     
     # Проверяем лимиты генерации
-    allowed, error_message = await GenerationThrottling.check_generation_limit(user_id)
+    allowed, error_message, reservation = await GenerationThrottling.check_generation_limit(user_id)
     if not allowed:
         await callback.answer(f"⏱ {error_message}", show_alert=True)
         return
     
     # Еще раз проверяем баланс пользователя
     if user.balance < data['cost']:
+        GenerationThrottling.cancel_generation_limit(user_id, reservation)
         await callback.answer("❌ Недостаточно кредитов!", show_alert=True)
         return
     
     try:
-        # Списываем кредиты
-        await db.update_user_balance(user.id, -data['cost'])
-        
-        # Создаем запись о генерации
-        generation = await db.create_generation(
+        # Списываем кредиты и создаем запись о генерации одной транзакцией
+        generation = await db.start_generation(
             user_id=user.id,
             mode=data['mode'],
             model=data['model'],
@@ -773,32 +757,26 @@ async def confirm_generation(callback: CallbackQuery, state: FSMContext):
             aspect_ratio=data.get('aspect_ratio', '16:9'),
             image_url=data.get('image_file_id')
         )
+        if generation is None:
+            # Баланс изменился после проверки (например, двойное нажатие)
+            GenerationThrottling.cancel_generation_limit(user_id, reservation)
+            await callback.answer("❌ Недостаточно кредитов!", show_alert=True)
+            return
         
         # Обновляем сообщение с красивым прогресс-баром
-        text = f"""
-{_("generation.beautiful.divider")}
-{_("generation.beautiful.processing_title")}
-{_("generation.beautiful.ai_working")}
-{_("generation.beautiful.divider")}
-
-🆔 <b>ID генерации:</b> <code>{generation.id}</code>
-💰 <b>Списано кредитов:</b> {data['cost']}
-
-{_("generation.beautiful.progress_processing")}
-{_("generation.beautiful.progress_bar")}
-
-{_("generation.beautiful.please_wait")}
-{_("generation.beautiful.eta")}
-
-{_("generation.beautiful.divider")}
-"""
+        text = GENERATION_STARTED.render(
+            user.language_code or 'ru',
+            generation_id=generation.id,
+            cost=data['cost']
+        )
         
         await callback.message.edit_text(text, parse_mode="HTML")
         
         await state.set_state(GenerationStates.processing)
         await callback.answer()
         
-        # Запускаем генерацию
+        # Запускаем генерацию (лимит откатывается, если она не состоится)
+        data['throttle_reservation'] = reservation
         asyncio.create_task(process_generation(
             callback.message,
             generation,
@@ -810,7 +788,7 @@ async def confirm_generation(callback: CallbackQuery, state: FSMContext):
         logger.error(f"Error confirming generation: {e}")
         
         # Отменяем лимит генерации при ошибке
-        GenerationThrottling.cancel_generation_limit(user_id)
+        GenerationThrottling.cancel_generation_limit(user_id, reservation)
         
         await callback.answer("❌ Ошибка создания генерации", show_alert=True)
         # Возвращаем состояние для повторной попытки
@@ -850,22 +828,17 @@ async def process_generation(message: Message, generation, data: dict, state: FS
         await db.update_generation_status(generation.id, GenerationStatus.PROCESSING)
         
         # Показываем начальное сообщение о прогрессе
-        initial_text = f"""
-{_("generation.beautiful.divider")}
-{_("generation.beautiful.processing_title")}
-{_("generation.beautiful.ai_working")}
-{_("generation.beautiful.divider")}
-
-🆔 <b>ID генерации:</b> <code>{generation.id}</code>
-💰 <b>Списано кредитов:</b> {data['cost']}
-
-⏳ <b>{_("generation.beautiful.progress_processing")}</b>
-░░░░░░░░░░ 0%
-
-⏱ <b>Прошло времени:</b> 0 сек
-
-{_("generation.beautiful.divider")}
-"""
+        lang = user.language_code or 'ru'
+        initial_text = GENERATION_PROGRESS.render(
+            lang,
+            generation_id=generation.id,
+            cost=data['cost'],
+            status_emoji="⏳",
+            status_text=_("generation.beautiful.progress_processing"),
+            progress_bar="░" * 10,
+            progress=0,
+            elapsed="0 сек"
+        )
         await message.edit_text(initial_text, parse_mode="HTML")
         
         # Небольшая задержка чтобы пользователь увидел начальный прогресс
@@ -919,22 +892,16 @@ async def process_generation(message: Message, generation, data: dict, state: FS
                         status_text = _("generation.beautiful.progress_complete")
                     
                     # Формируем красивое сообщение
-                    text = f"""
-{_("generation.beautiful.divider")}
-{_("generation.beautiful.processing_title")}
-{_("generation.beautiful.ai_working")}
-{_("generation.beautiful.divider")}
-
-🆔 <b>ID генерации:</b> <code>{generation.id}</code>
-💰 <b>Списано кредитов:</b> {data['cost']}
-
-{status_emoji} <b>{status_text}</b>
-{progress_bar} {progress}%
-
-⏱ <b>Прошло времени:</b> {MessageTemplates.format_time(int((progress / 100) * 60))}
-
-{_("generation.beautiful.divider")}
-"""
+                    text = GENERATION_PROGRESS.render(
+                        lang,
+                        generation_id=generation.id,
+                        cost=data['cost'],
+                        status_emoji=status_emoji,
+                        status_text=status_text,
+                        progress_bar=progress_bar,
+                        progress=progress,
+                        elapsed=MessageTemplates.format_time(int((progress / 100) * 60))
+                    )
                     
                     await message.edit_text(text, parse_mode="HTML")
                 except Exception as e:
@@ -1035,7 +1002,7 @@ async def process_generation(message: Message, generation, data: dict, state: FS
         # Отменяем лимит генерации при отмене через asyncio
         user = await db.get_user_by_id(generation.user_id)
         if user:
-            GenerationThrottling.cancel_generation_limit(user.telegram_id)
+            GenerationThrottling.cancel_generation_limit(user.telegram_id, data.get('throttle_reservation'))
         
         raise
     except Exception as e:
@@ -1054,7 +1021,7 @@ async def process_generation(message: Message, generation, data: dict, state: FS
         # Отменяем лимит генерации при неудачной генерации
         user = await db.get_user_by_id(generation.user_id)
         if user:
-            GenerationThrottling.cancel_generation_limit(user.telegram_id)
+            GenerationThrottling.cancel_generation_limit(user.telegram_id, data.get('throttle_reservation'))
         
         # Получаем язык пользователя (уже получен в начале функции)
         
@@ -1205,10 +1172,6 @@ async def cancel_generation(callback: CallbackQuery, state: FSMContext):
         await callback.answer(_('generation.cannot_cancel_processing', default="Генерация уже запущена, дождитесь завершения"), show_alert=True)
         return
     
-    # Если генерация была подтверждена но еще не запущена, отменяем лимит
-    if current_state == GenerationStates.confirming:
-        GenerationThrottling.cancel_generation_limit(callback.from_user.id)
-    
     await state.clear()
     
     user = await db.get_user(callback.from_user.id)
@@ -18,14 +18,11 @@ from services.database import db
 from services.utm_analytics import utm_service
 from core.constants import CREDIT_PACKAGES, SPECIAL_OFFERS
 from core.config import settings
-from bot.middlewares.i18n import I18n
+from bot.middlewares.i18n import i18n
 from models.models import TransactionTypeEnum, TransactionStatusEnum, Transaction, User
 
 logger = logging.getLogger(__name__)
 
-# Глобальная функция локализации
-i18n = I18n()
-
 router = Router(name="payment")
 
 # ⚠️ ВАЖНО: ПОРЯДОК ОБРАБОТЧИКОВ КРИТИЧЕН!
@@ -596,15 +593,17 @@ async def process_successful_payment(message: Message):
         
         logger.info(f"[process_successful_payment] Parsed: transaction_id={transaction_id}, package_id={package_id}")
         
-        # Завершаем транзакцию с сохранением telegram_charge_id
-        await db.complete_transaction(
-            transaction_id,
-            telegram_charge_id=payment.telegram_payment_charge_id
-        )
-        
-        # Получаем обновленного пользователя и транзакцию
-        user = await db.get_user(message.from_user.id)
-        transaction = await db.get_transaction(transaction_id)
+        # Завершение транзакции и чтение результата - одно соединение и одна транзакция
+        async with db.uow():
+            # Завершаем транзакцию с сохранением telegram_charge_id
+            await db.complete_transaction(
+                transaction_id,
+                telegram_charge_id=payment.telegram_payment_charge_id
+            )
+            
+            # Получаем обновленного пользователя и транзакцию
+            user = await db.get_user(message.from_user.id)
+            transaction = await db.get_transaction(transaction_id)
         
         if not user or not transaction:
             logger.error(f"[process_successful_payment] User or transaction not found after payment: user_id={message.from_user.id}, transaction_id={transaction_id}")
@@ -834,9 +833,6 @@ async def create_yookassa_payment(
 @ensure_user
 async def show_balance(update: Message | CallbackQuery, user: User, _, **kwargs):
     """Показать баланс пользователя"""
-    # Получаем статистику
-    stats = await db.get_user_statistics(user.telegram_id)
-    
     # Считаем бонусы
     bonuses = settings.WELCOME_BONUS_CREDITS  # Бонус новичка
     
@@ -1249,6 +1245,8 @@ async def process_successful_yookassa_payment(transaction, event_data: dict, bot
             
             await session.commit()
         
+        db.invalidate_user_cache(user_id=transaction.user_id)
+        
         # Получаем обновленные данные
         user = await db.get_user_by_id(transaction.user_id)
         if not user:
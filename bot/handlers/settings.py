@@ -6,15 +6,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from bot.middlewares.i18n import I18n, LanguageManager
+from bot.middlewares.i18n import i18n, LanguageManager
 from services.database import db
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
-# Глобальная функция локализации для настроек
-i18n = I18n()
-
 class SettingsStates(StatesGroup):
     changing_language = State()
 
@@ -9,8 +9,10 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from bot.keyboard.inline import get_main_menu, get_language_keyboard
 from bot.utils.messages import MessageTemplates
+from bot.utils.screens import MAIN_MENU, MAIN_MENU_NEW_USER
 from services.database import db
 from services.utm_analytics import utm_service
+from services.activity_recorder import activity_recorder
 from core.config import settings
 from core.constants import LANGUAGES, NEW_USER_BONUS
 from bot.middlewares.i18n import i18n
@@ -141,7 +143,7 @@ async def cmd_start(message: Message, state: FSMContext):
         user_lang = user.language_code or 'ru'
         
         # Обновляем последнюю активность
-        await db.update_user_activity(user_id)
+        activity_recorder.touch(user_id)
         
         # Показываем главное меню
         await show_main_menu(message, user)
@@ -206,10 +208,9 @@ async def show_main_menu(message_or_callback, user, new_message: bool = False):
     
     # Определяем приветствие (новый пользователь или возвращающийся)
     is_new_user = stats.get('total_generations', 0) == 0 and user.total_bought == 0
-    welcome_key = "menu.beautiful.welcome" if is_new_user else "menu.beautiful.welcome_back"
     
     # Форматируем время последнего видео
-    last_generation = stats.get('last_generation_date')
+    last_generation = stats.get('last_generation')
     if last_generation:
         # Конвертируем в UTC если нужно
         if last_generation.tzinfo is None:
@@ -236,30 +237,16 @@ async def show_main_menu(message_or_callback, user, new_message: bool = False):
     # Статус пользователя
     status = _("menu.beautiful.status_premium") if user.is_premium else _("menu.beautiful.status_active")
     
-    # Создаем красивое сообщение
-    text = f"""
-{_("menu.beautiful.divider")}
-{_(welcome_key, name=user_name)}
-{_("menu.beautiful.divider")}
-
-{_("menu.beautiful.dashboard")}
-
-{_("menu.beautiful.wallet")}
-💰 <b>{user.balance:,}</b> {_("menu.beautiful.credits_label")}
-{status}
-
-{_("menu.beautiful.video_stats")}
-🎬 <b>{stats.get('total_generations', 0)}</b> {_("menu.beautiful.videos_label")}
-📅 {_("menu.beautiful.last_video", time=time_str)}
-
-{_("menu.beautiful.divider")}
-"""
-    
-    # Добавляем специальное предложение для новичков
-    if is_new_user:
-        text += f"\n{_('menu.beautiful.special_offer')}\n\n"
-    
-    text += f"{_('menu.beautiful.quick_actions')}\n{_('menu.beautiful.lets_create')}"
+    # Создаем красивое сообщение (для новичков - со специальным предложением)
+    screen = MAIN_MENU_NEW_USER if is_new_user else MAIN_MENU
+    text = screen.render(
+        user.language_code or 'ru',
+        name=user_name,
+        balance=user.balance,
+        status=status,
+        total_generations=stats.get('total_generations', 0),
+        time=time_str
+    )
     
     keyboard = get_main_menu(user.language_code or 'ru', user.balance)
     
@@ -8,15 +8,14 @@ from aiogram.filters import StateFilter
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy import select, func
 
-from bot.middlewares.i18n import I18n
+from bot.middlewares.i18n import i18n
 from services.database import db
 from core.config import settings
 from models.models import SupportTicket, User
 
 logger = logging.getLogger(__name__)
 
-# Глобальная функция локализации для поддержки
-i18n = I18n()
+# Глобальная функция локализации для поддержки (общий экземпляр I18n)
 _ = lambda key, **kwargs: i18n.get(key, lang='ru', **kwargs)
 
 class SupportStates(StatesGroup):
@@ -1,6 +1,4 @@
 import logging
-import io
-import csv
 from datetime import datetime, timedelta
 from typing import List, Dict
 
@@ -643,6 +641,9 @@ async def export_campaign_data(callback: CallbackQuery):
             return
         
         # Создаем CSV с расширенными полями
+        import io
+        import csv
+        
         output = io.StringIO()
         
         # Определяем поля для детального экспорта
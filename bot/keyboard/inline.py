@@ -9,6 +9,7 @@ from core.constants import (
 
 # Импортируем i18n глобально для оптимизации
 from bot.middlewares.i18n import i18n as global_i18n
+from services.database import encode_cursor
 
 def get_language_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора языка"""
@@ -179,7 +180,7 @@ def get_history_keyboard(
         nav_buttons.append(
             InlineKeyboardButton(
                 text="◀️",
-                callback_data=f"history_page_{page-1}"
+                callback_data=f"history_page_{page-1}_b{encode_cursor(generations[0])}"
             )
         )
     
@@ -194,7 +195,7 @@ def get_history_keyboard(
         nav_buttons.append(
             InlineKeyboardButton(
                 text="▶️",
-                callback_data=f"history_page_{page+1}"
+                callback_data=f"history_page_{page+1}_a{encode_cursor(generations[-1])}"
             )
         )
     
@@ -278,9 +279,10 @@ def get_admin_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
     builder.button(text=f"🧩 UTM Аналитика", callback_data="utm_analytics")
     builder.button(text=f"💰 {_('admin.api_balance')}", callback_data="admin_api_balance")
     builder.button(text=f"📋 {_('admin.logs.title')}", callback_data="admin_logs")
+    builder.button(text=f"🩺 {_('admin.diagnostics.title', default='Диагностика')}", callback_data="admin_diagnostics")
     builder.button(text=f"◀️ {_('menu.main_menu')}", callback_data="back_to_menu")
     
-    builder.adjust(2, 2, 2, 2, 2, 1)
+    builder.adjust(2, 2, 2, 2, 2, 1, 1)
     return builder.as_markup()
 
 def get_support_keyboard(language: str = "ru") -> InlineKeyboardMarkup:
@@ -4,10 +4,20 @@ from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Message, CallbackQuery
 
 from services.database import db
+from services.user_context import bind_current_user, reset_current_user
+from services.subscription_cache import subscription_cache
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+
+def is_subscription_required() -> bool:
+    """Включена ли обязательная подписка на канал"""
+    return bool(settings.CHANNEL_USERNAME)
+
+
 class AuthMiddleware(BaseMiddleware):
     """Middleware для проверки авторизации и банов"""
     
@@ -45,10 +55,10 @@ class AuthMiddleware(BaseMiddleware):
             logger.warning(f"Banned user {user.id} tried to access bot")
             return
         
-        # Проверяем обязательную подписку на канал (если настроено и канал существует)
-        if (getattr(settings, 'CHANNEL_USERNAME', None) and 
-            settings.CHANNEL_USERNAME.strip() and
-            settings.CHANNEL_USERNAME != 'None'):
+        # Проверяем обязательную подписку на канал (если настроено и канал существует).
+        # Кнопку "Я подписался" пропускаем - ее обработчик сам делает свежую проверку
+        is_recheck = isinstance(event, CallbackQuery) and event.data == "check_subscription"
+        if is_subscription_required() and not is_recheck:
             try:
                 if not await self.check_subscription(event, user.id):
                     return
@@ -56,23 +66,33 @@ class AuthMiddleware(BaseMiddleware):
                 # Если канал не найден или другая ошибка - пропускаем проверку
                 logger.warning(f"Subscription check skipped for user {user.id}: {e}")
         
-        # Добавляем пользователя в контекст
+        # Добавляем пользователя в контекст: хендлеры получают его через
+        # data['db_user'] или db.get_user() без повторного запроса к БД
         data['db_user'] = db_user
+        token = bind_current_user(db_user)
         
         # Продолжаем обработку
-        return await handler(event, data)
+        try:
+            return await handler(event, data)
+        finally:
+            reset_current_user(token)
     
     async def check_subscription(self, event: TelegramObject, user_id: int) -> bool:
-        """Проверка подписки на обязательный канал"""
+        """Проверка подписки на обязательный канал (с кешированием результата)"""
         try:
-            # Проверяем статус пользователя в канале
-            member = await event.bot.get_chat_member(
-                chat_id=f"@{settings.CHANNEL_USERNAME}",
-                user_id=user_id
-            )
+            is_member = await subscription_cache.get(settings.CHANNEL_USERNAME, user_id)
+            
+            if is_member is None:
+                # Проверяем статус пользователя в канале
+                member = await event.bot.get_chat_member(
+                    chat_id=f"@{settings.CHANNEL_USERNAME}",
+                    user_id=user_id
+                )
+                is_member = member.status in MEMBER_STATUSES
+                await subscription_cache.set(settings.CHANNEL_USERNAME, user_id, is_member)
             
             # Проверяем, является ли пользователь участником
-            if member.status not in ["member", "administrator", "creator"]:
+            if not is_member:
                 subscription_message = (
                     "📢 <b>Требуется подписка</b>\n\n"
                     f"Для использования бота необходимо подписаться на канал:\n"
@@ -168,18 +188,31 @@ class PermissionMiddleware(BaseMiddleware):
 
 # Обработчик проверки подписки
 from aiogram import Router, F
-from aiogram.types import CallbackQuery
+from aiogram.types import CallbackQuery, ChatMemberUpdated
 
 subscription_router = Router()
 
+@subscription_router.chat_member()
+async def channel_member_updated(update: ChatMemberUpdated):
+    """Обновление кеша подписки при вступлении/выходе из канала"""
+    if not is_subscription_required():
+        return
+    
+    if (update.chat.username or "").lower() != settings.CHANNEL_USERNAME.lower():
+        return
+    
+    await subscription_cache.set(
+        settings.CHANNEL_USERNAME,
+        update.new_chat_member.user.id,
+        update.new_chat_member.status in MEMBER_STATUSES
+    )
+
 @subscription_router.callback_query(F.data == "check_subscription")
 async def check_subscription_callback(callback: CallbackQuery):
     """Проверка подписки после нажатия кнопки"""
     user_id = callback.from_user.id
     
-    if not (getattr(settings, 'CHANNEL_USERNAME', None) and 
-            settings.CHANNEL_USERNAME.strip() and
-            settings.CHANNEL_USERNAME != 'None'):
+    if not is_subscription_required():
         await callback.message.edit_text(
             "✅ <b>Проверка подписки отключена</b>\n\n"
             "Вы можете использовать все функции бота.\n"
@@ -189,13 +222,16 @@ async def check_subscription_callback(callback: CallbackQuery):
         return
     
     try:
-        # Проверяем подписку
+        # Пользователь утверждает, что подписался - сбрасываем кеш и проверяем заново
+        await subscription_cache.invalidate(settings.CHANNEL_USERNAME, user_id)
         member = await callback.bot.get_chat_member(
             chat_id=f"@{settings.CHANNEL_USERNAME}",
             user_id=user_id
         )
+        is_member = member.status in MEMBER_STATUSES
+        await subscription_cache.set(settings.CHANNEL_USERNAME, user_id, is_member)
         
-        if member.status in ["member", "administrator", "creator"]:
+        if is_member:
             # Подписка подтверждена
             await callback.message.edit_text(
                 "✅ <b>Спасибо за подписку!</b>\n\n"
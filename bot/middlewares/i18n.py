@@ -1,13 +1,67 @@
 import json
 import os
 import logging
-from typing import Callable, Dict, Any, Awaitable, Optional
+import string
+from typing import Callable, Dict, Any, Awaitable, Optional, Tuple
 from pathlib import Path
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 
 logger = logging.getLogger(__name__)
 
+# Запись каталога: (значение, функция форматирования или None, если плейсхолдеров нет)
+CatalogEntry = Tuple[Any, Optional[Callable[..., str]]]
+
+_CONVERSIONS = {'s': str, 'r': repr, 'a': ascii}
+
+
+class FormatTemplate:
+    """
+    Строка перевода, разобранная при компиляции каталога на литералы и поля:
+    вызов только подставляет значения, не разбирая шаблон заново.
+    Результат и ошибки (KeyError при нехватке параметра) - как у str.format
+    """
+
+    __slots__ = ('segments',)
+
+    def __init__(self, segments: Tuple[Tuple[str, Optional[str], Optional[Callable], str], ...]):
+        self.segments = segments
+
+    @classmethod
+    def compile(cls, value: str) -> Callable[..., str]:
+        """Разобрать строку; сложные шаблоны (позиционные поля, атрибуты, вложенные спецификации) остаются str.format"""
+        try:
+            parsed = list(string.Formatter().parse(value))
+        except ValueError:
+            return value.format
+        
+        segments = []
+        for literal, field_name, format_spec, conversion in parsed:
+            if field_name is None:
+                segments.append((literal, None, None, ''))
+                continue
+            if (
+                not field_name.isidentifier()
+                or '{' in format_spec
+                or (conversion is not None and conversion not in _CONVERSIONS)
+            ):
+                return value.format
+            segments.append((literal, field_name, _CONVERSIONS.get(conversion), format_spec))
+        return cls(tuple(segments))
+
+    def __call__(self, **kwargs) -> str:
+        parts = []
+        for literal, field_name, convert, format_spec in self.segments:
+            if literal:
+                parts.append(literal)
+            if field_name is not None:
+                value = kwargs[field_name]
+                if convert is not None:
+                    value = convert(value)
+                parts.append(format(value, format_spec))
+        return ''.join(parts)
+
+
 class I18n:
     """Класс для работы с переводами"""
     
@@ -15,68 +69,116 @@ class I18n:
         self.default_lang = default_lang
         self.locales_dir = Path(locales_dir)
         self.translations: Dict[str, Dict] = {}
-        self._load_fallback_translations()
+        # Плоские каталоги "menu.generate" -> запись, с уже подмешанным языком по умолчанию
+        self._catalogs: Dict[str, Dict[str, CatalogEntry]] = {}
+        self.version = 0  # Растет при каждой перезагрузке (для кешей поверх переводов)
         self.load_translations()
     
-    def _load_fallback_translations(self):
-        """Загрузка резервных переводов"""
-        self.translations['ru'] = {
-            'language_info': {
-                'name': 'Русский',
-                'native_name': 'Русский',
-                'emoji': '🇷🇺'
-            },
-            'common': {
-                'back': 'Назад',
-                'cancel': 'Отмена',
-                'credits': 'кредитов',
-                'page': 'стр. {page}/{total}',
-                'days': 'дней'
-            },
-            'menu': {
-                'main': 'Главное меню',
-                'main_menu': 'Главное меню',
-                'generate': 'Создать видео',
-                'buy_credits': 'Купить кредиты',
-                'balance': 'Баланс: {balance}',
-                'history': 'История',
-                'referral': 'Реферальная программа',
-                'settings': 'Настройки',
-                'help': 'Помощь',
-                'support': 'Поддержка',
-                'videos_created': 'Создано видео: {count}',
-                'choose_action': 'Выберите действие:'
-            },
-            'errors': {
-                'insufficient_balance': 'Недостаточно кредитов',
-                'error': 'Ошибка',
-                'prompt_too_long': 'Слишком длинный промпт',
-                'prompt_too_short': 'Слишком короткий промпт',
-                'image_too_large': 'Изображение слишком большое',
-                'invalid_file_type': 'Неверный тип файла'
+    def _get_fallback_translations(self) -> Dict[str, Dict]:
+        """Резервные переводы"""
+        return {
+            'ru': {
+                'language_info': {
+                    'name': 'Русский',
+                    'native_name': 'Русский',
+                    'emoji': '🇷🇺'
+                },
+                'common': {
+                    'back': 'Назад',
+                    'cancel': 'Отмена',
+                    'credits': 'кредитов',
+                    'page': 'стр. {page}/{total}',
+                    'days': 'дней'
+                },
+                'menu': {
+                    'main': 'Главное меню',
+                    'main_menu': 'Главное меню',
+                    'generate': 'Создать видео',
+                    'buy_credits': 'Купить кредиты',
+                    'balance': 'Баланс: {balance}',
+                    'history': 'История',
+                    'referral': 'Реферальная программа',
+                    'settings': 'Настройки',
+                    'help': 'Помощь',
+                    'support': 'Поддержка',
+                    'videos_created': 'Создано видео: {count}',
+                    'choose_action': 'Выберите действие:'
+                },
+                'errors': {
+                    'insufficient_balance': 'Недостаточно кредитов',
+                    'error': 'Ошибка',
+                    'prompt_too_long': 'Слишком длинный промпт',
+                    'prompt_too_short': 'Слишком короткий промпт',
+                    'image_too_large': 'Изображение слишком большое',
+                    'invalid_file_type': 'Неверный тип файла'
+                }
             }
         }
     
     def load_translations(self):
-        """Загрузка всех файлов переводов"""
+        """Загрузка всех файлов переводов и компиляция каталогов"""
+        translations = self._get_fallback_translations()
+        
         if not self.locales_dir.exists():
             logger.warning(f"Locales directory {self.locales_dir} does not exist, using fallback translations")
-            return
+        else:
+            for locale_file in self.locales_dir.glob('*.json'):
+                lang_code = locale_file.stem
+                try:
+                    with open(locale_file, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                        if content:  # Проверяем, что файл не пустой
+                            translations[lang_code] = json.loads(content)
+                            logger.info(f"Loaded locale: {lang_code}")
+                        else:
+                            logger.warning(f"Empty locale file: {lang_code}")
+                except json.JSONDecodeError as e:
+                    logger.error(f"Invalid JSON in locale {lang_code}: {e}")
+                except Exception as e:
+                    logger.error(f"Failed to load locale {lang_code}: {e}")
         
-        for locale_file in self.locales_dir.glob('*.json'):
-            lang_code = locale_file.stem
-            try:
-                with open(locale_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if content:  # Проверяем, что файл не пустой
-                        self.translations[lang_code] = json.loads(content)
-                        logger.info(f"Loaded locale: {lang_code}")
-                    else:
-                        logger.warning(f"Empty locale file: {lang_code}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Invalid JSON in locale {lang_code}: {e}")
-            except Exception as e:
-                logger.error(f"Failed to load locale {lang_code}: {e}")
+        catalogs = self._compile(translations)
+        
+        # Подменяем одним присваиванием: параллельные get() видят либо старый,
+        # либо новый набор каталогов целиком
+        self.translations, self._catalogs = translations, catalogs
+        self.version += 1
+    
+    def reload(self):
+        """Перечитать файлы переводов без перезапуска бота"""
+        self.load_translations()
+        logger.info(f"Translations reloaded: {', '.join(sorted(self._catalogs))}")
+    
+    def _compile(self, translations: Dict[str, Dict]) -> Dict[str, Dict[str, CatalogEntry]]:
+        """Собрать плоские каталоги с подмешанным языком по умолчанию"""
+        flat = {lang: self._flatten(data) for lang, data in translations.items() if data}
+        default_catalog = flat.get(self.default_lang, {})
+        
+        catalogs = {}
+        for lang, entries in flat.items():
+            if lang == self.default_lang:
+                catalogs[lang] = entries
+            else:
+                catalogs[lang] = {**default_catalog, **entries}
+        return catalogs
+    
+    @staticmethod
+    def _flatten(data: Dict, prefix: str = '') -> Dict[str, CatalogEntry]:
+        """Развернуть вложенные словари в ключи вида "a.b.c" """
+        entries: Dict[str, CatalogEntry] = {}
+        for key, value in data.items():
+            full_key = f"{prefix}{key}"
+            if value is None:
+                continue
+            if isinstance(value, dict):
+                # Промежуточные узлы тоже доступны по ключу, как и раньше
+                entries[full_key] = (value, None)
+                entries.update(I18n._flatten(value, f"{full_key}."))
+            elif isinstance(value, str) and ('{' in value or '}' in value):
+                entries[full_key] = (value, FormatTemplate.compile(value))
+            else:
+                entries[full_key] = (value, None)
+        return entries
     
     def get(
         self,
@@ -94,50 +196,26 @@ class I18n:
             default: Значение по умолчанию
             **kwargs: Параметры для форматирования
         """
-        lang = lang or self.default_lang
-        
-        # Получаем переводы для языка
-        translations = self.translations.get(lang)
-        if not translations:
-            translations = self.translations.get(self.default_lang, {})
+        catalogs = self._catalogs
+        catalog = catalogs.get(lang or self.default_lang)
+        if catalog is None:
+            catalog = catalogs.get(self.default_lang, {})
         
-        # Навигация по ключу
-        keys = key.split('.')
-        value = translations
-        
-        for k in keys:
-            if isinstance(value, dict):
-                value = value.get(k)
-            else:
-                value = None
-                break
+        entry = catalog.get(key)
         
         # Если перевод не найден
-        if value is None:
-            # Пробуем найти в языке по умолчанию
-            if lang != self.default_lang:
-                default_translations = self.translations.get(self.default_lang, {})
-                default_value = default_translations
-                for k in keys:
-                    if isinstance(default_value, dict):
-                        default_value = default_value.get(k)
-                    else:
-                        default_value = None
-                        break
-                if default_value is not None:
-                    value = default_value
-            
-            # Если все еще не найден, используем default или возвращаем ключ
-            if value is None:
-                if default is not None:
-                    return default
-                logger.debug(f"Translation not found: {key} for lang {lang}")
-                return key
+        if entry is None:
+            if default is not None:
+                return default
+            logger.debug("Translation not found: %s for lang %s", key, lang)
+            return key
+        
+        value, formatter = entry
         
         # Форматируем строку если есть параметры
-        if isinstance(value, str) and kwargs:
+        if kwargs and formatter is not None:
             try:
-                return value.format(**kwargs)
+                return formatter(**kwargs)
             except KeyError as e:
                 logger.error(f"Format error in translation {key}: {e}")
                 return value
@@ -159,8 +237,9 @@ class I18n:
 class I18nMiddleware(BaseMiddleware):
     """Middleware для мультиязычности"""
     
-    def __init__(self, i18n: Optional[I18n] = None):
-        self.i18n = i18n or I18n()
+    def __init__(self, translator: Optional[I18n] = None):
+        # По умолчанию общий экземпляр модуля: его reload() видят и обработчики
+        self.i18n = translator or i18n
     
     async def __call__(
         self,
@@ -278,6 +357,7 @@ class LanguageManager:
                     session.add(user)
                     await session.commit()
                 
+                db.invalidate_user_cache(telegram_id=user_id)
                 return True
             return False
         except Exception as e:
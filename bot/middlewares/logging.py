@@ -58,13 +58,10 @@ class LoggingMiddleware(BaseMiddleware):
                 f"Time: {processing_time:.2f}s"
             )
             
-            # Обновляем активность пользователя
+            # Отмечаем активность пользователя (запись в БД пачками в фоне)
             if user and hasattr(event, 'bot'):
-                from services.database import db
-                try:
-                    await db.update_user_activity(user.id)
-                except Exception as e:
-                    logger.error(f"Failed to update user activity: {e}")
+                from services.activity_recorder import activity_recorder
+                activity_recorder.touch(user.id)
             
             return result
             
@@ -113,19 +110,11 @@ class UserActivityLogger:
             f"Details: {details or {}}"
         )
         
-        # Можно добавить сохранение в БД для аналитики
+        # Сохранение в БД для аналитики - через очередь аудита, пачками
         try:
             from services.database import db
-            from models.models import UserAction
             
-            async with db.async_session() as session:
-                action_log = UserAction(
-                    user_id=user_id,
-                    action=action,
-                    details=details
-                )
-                session.add(action_log)
-                await session.commit()
+            await db.log_user_action(user_id, action, details=details)
                 
         except Exception as e:
             logger.error(f"Failed to save user action to DB: {e}")
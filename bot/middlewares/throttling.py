@@ -1,23 +1,74 @@
 import time
-from typing import Callable, Dict, Any, Awaitable, Optional
+import uuid
+import math
+import asyncio
+from collections import deque
+from typing import Callable, Dict, Any, Awaitable, Optional, Deque, List, Tuple, Set
 from functools import wraps
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
 import logging
 
+from core.config import settings
+from services.cache_service import cache
+
 logger = logging.getLogger(__name__)
 
+# Минимальный интервал между запросами: SET NX PX - ключ живет ровно rate_limit
+MIN_INTERVAL_SCRIPT = """
+if redis.call('SET', KEYS[1], '1', 'PX', ARGV[1], 'NX') then
+    return 1
+end
+return 0
+"""
+
+# Скользящее окно по нескольким лимитам сразу.
+# KEYS - окна (sorted set), ARGV[1] - id записи,
+# далее пары (limit, window_ms) для каждого окна.
+# Запись добавляется во все окна, только если ни одно из них не заполнено;
+# ее id возвращается для отката
+SLIDING_WINDOW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+for i = 1, #KEYS do
+    local limit = tonumber(ARGV[i * 2])
+    local window = tonumber(ARGV[i * 2 + 1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - window)
+    if redis.call('ZCARD', KEYS[i]) >= limit then
+        local oldest = redis.call('ZRANGE', KEYS[i], 0, 0, 'WITHSCORES')
+        return {0, i, tonumber(oldest[2]) + window - now, ''}
+    end
+end
+for i = 1, #KEYS do
+    redis.call('ZADD', KEYS[i], now, ARGV[1])
+    redis.call('PEXPIRE', KEYS[i], tonumber(ARGV[i * 2 + 1]))
+end
+return {1, 0, 0, ARGV[1]}
+"""
+
+# Откат резервации: удаляем ровно ее запись (ARGV[1]) из всех окон
+ROLLBACK_SCRIPT = """
+local removed = 0
+for i = 1, #KEYS do
+    removed = removed + redis.call('ZREM', KEYS[i], ARGV[1])
+end
+return removed
+"""
+
+
 class ThrottlingMiddleware(BaseMiddleware):
     """Middleware для защиты от спама"""
-    
+
     def __init__(self, rate_limit: float = 0.5):
         """
         Args:
             rate_limit: Минимальное время между запросами в секундах
         """
         self.rate_limit = rate_limit
+        # Локальный режим (когда Redis недоступен)
         self.user_timestamps: Dict[int, float] = {}
-    
+        self._cleanup_threshold = 1000
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -28,108 +79,235 @@ class ThrottlingMiddleware(BaseMiddleware):
         user = data.get("event_from_user")
         if not user:
             return await handler(event, data)
-        
+
         user_id = user.id
+
+        if not await self._is_allowed(type(event).__name__.lower(), user_id):
+            # Слишком частые запросы
+            if isinstance(event, Message):
+                await event.answer(
+                    "⏱ Слишком много запросов. Подождите немного...",
+                    show_alert=False
+                )
+            elif isinstance(event, CallbackQuery):
+                await event.answer(
+                    "⏱ Подождите немного...",
+                    show_alert=True
+                )
+
+            logger.warning(f"Rate limit exceeded for user {user_id}")
+            return
+
+        return await handler(event, data)
+
+    async def _is_allowed(self, scope: str, user_id: int) -> bool:
+        """Проверка интервала: в Redis (общий для всех воркеров) или локально"""
+        result = await cache.run_script(
+            MIN_INTERVAL_SCRIPT,
+            keys=[f"throttle:{scope}:{user_id}"],
+            args=[max(1, int(self.rate_limit * 1000))],
+            timeout=settings.RATE_LIMIT_REDIS_TIMEOUT
+        )
+        if result is not None:
+            return bool(result)
+
+        return self._is_allowed_local(user_id)
+
+    def _is_allowed_local(self, user_id: int) -> bool:
         current_time = time.time()
-        
+
         # Проверяем время последнего запроса
-        if user_id in self.user_timestamps:
-            time_passed = current_time - self.user_timestamps[user_id]
-            
-            if time_passed < self.rate_limit:
-                # Слишком частые запросы
-                if isinstance(event, Message):
-                    await event.answer(
-                        "⏱ Слишком много запросов. Подождите немного...",
-                        show_alert=False
-                    )
-                elif isinstance(event, CallbackQuery):
-                    await event.answer(
-                        "⏱ Подождите немного...",
-                        show_alert=True
-                    )
-                
-                logger.warning(f"Rate limit exceeded for user {user_id}")
-                return
-        
+        last_time = self.user_timestamps.get(user_id)
+        if last_time is not None and current_time - last_time < self.rate_limit:
+            return False
+
         # Обновляем время последнего запроса
         self.user_timestamps[user_id] = current_time
-        
-        # Очищаем старые записи (более 1 часа)
-        if len(self.user_timestamps) > 1000:
-            current_time = time.time()
+
+        # Очищаем старые записи (более 1 часа). Порог растет вместе со словарем,
+        # чтобы не пересобирать его на каждом запросе
+        if len(self.user_timestamps) > self._cleanup_threshold:
             self.user_timestamps = {
-                uid: timestamp 
+                uid: timestamp
                 for uid, timestamp in self.user_timestamps.items()
                 if current_time - timestamp < 3600
             }
-        
-        return await handler(event, data)
+            self._cleanup_threshold = max(1000, len(self.user_timestamps) * 2)
+
+        return True
 
 class UserThrottling:
     """Класс для управления throttling по пользователям"""
-    
+
     def __init__(self):
-        self.limits: Dict[str, Dict[int, list]] = {}
-    
+        # Локальный режим (когда Redis недоступен)
+        self.limits: Dict[str, Dict[int, Deque[float]]] = {}
+        # id записи -> время, под которым она добавлена в окна (для отката)
+        self._reservations: Dict[str, float] = {}
+        self._max_reservations = 10000
+        self._pending: Set[asyncio.Task] = set()
+
+    async def acquire(
+        self,
+        user_id: int,
+        windows: List[Tuple[str, int, int]]
+    ) -> Tuple[bool, int, int, Optional[str]]:
+        """
+        Атомарная проверка сразу нескольких лимитов со списанием
+
+        Args:
+            user_id: ID пользователя
+            windows: Список (ключ, лимит, окно в секундах)
+
+        Returns:
+            (allowed, индекс превышенного лимита, секунд до освобождения,
+            id записи для rollback или None, если лимит превышен)
+        """
+        keys = [f"throttle:{key}:{user_id}" for key, _, _ in windows]
+        args: List[Any] = [uuid.uuid4().hex]
+        for _, limit, window in windows:
+            args.extend([limit, window * 1000])
+
+        result = await cache.run_script(
+            SLIDING_WINDOW_SCRIPT,
+            keys=keys,
+            args=args,
+            timeout=settings.RATE_LIMIT_REDIS_TIMEOUT
+        )
+        if result is not None:
+            allowed, failed_index, retry_ms = (int(value) for value in result[:3])
+            return (
+                bool(allowed), failed_index - 1, math.ceil(max(0, retry_ms) / 1000),
+                result[3] if allowed else None
+            )
+
+        return self._acquire_local(user_id, windows, args[0])
+
+    async def rollback(
+        self,
+        user_id: int,
+        windows: List[Tuple[str, int, int]],
+        reservation: str
+    ) -> bool:
+        """Отменить запись reservation (id из acquire) во всех окнах"""
+        keys = [f"throttle:{key}:{user_id}" for key, _, _ in windows]
+
+        result = await cache.run_script(
+            ROLLBACK_SCRIPT,
+            keys=keys,
+            args=[reservation],
+            timeout=settings.RATE_LIMIT_REDIS_TIMEOUT
+        )
+        if result is not None:
+            return bool(result)
+
+        return self._rollback_local(user_id, windows, reservation)
+
+    def schedule_rollback(
+        self,
+        user_id: int,
+        windows: List[Tuple[str, int, int]],
+        reservation: str
+    ) -> Optional[asyncio.Task]:
+        """Запустить откат в фоне (для синхронных вызовов)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._rollback_local(user_id, windows, reservation)
+            return None
+
+        task = loop.create_task(self.rollback(user_id, windows, reservation))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return task
+
+    def _acquire_local(
+        self,
+        user_id: int,
+        windows: List[Tuple[str, int, int]],
+        reservation: str
+    ) -> Tuple[bool, int, int, Optional[str]]:
+        for index, (key, limit, window) in enumerate(windows):
+            if not self.check_limit(user_id, key, limit, window, record=False):
+                return False, index, self.get_remaining_time(user_id, key, window), None
+
+        current_time = time.time()
+        for key, _, _ in windows:
+            self.limits[key][user_id].append(current_time)
+
+        self._reservations[reservation] = current_time
+        if len(self._reservations) > self._max_reservations:
+            # Самые старые записи уже вышли из окон - откатывать нечего
+            del self._reservations[next(iter(self._reservations))]
+        return True, -1, 0, reservation
+
+    def _rollback_local(
+        self,
+        user_id: int,
+        windows: List[Tuple[str, int, int]],
+        reservation: str
+    ) -> bool:
+        timestamp = self._reservations.pop(reservation, None)
+        if timestamp is None:
+            return False
+
+        for key, _, _ in windows:
+            timestamps = self.limits.get(key, {}).get(user_id)
+            if timestamps and timestamp in timestamps:
+                timestamps.remove(timestamp)
+        return True
+
     def check_limit(
         self,
         user_id: int,
         key: str,
         limit: int,
-        window: int = 3600
+        window: int = 3600,
+        record: bool = True
     ) -> bool:
         """
-        Проверка лимита для пользователя
-        
+        Проверка лимита для пользователя (локально, без Redis)
+
         Args:
             user_id: ID пользователя
             key: Ключ лимита (например, 'generations')
             limit: Максимальное количество действий
             window: Временное окно в секундах
-            
+            record: Засчитать действие, если лимит не превышен
+
         Returns:
             True если лимит не превышен
         """
         current_time = time.time()
-        
-        if key not in self.limits:
-            self.limits[key] = {}
-        
-        if user_id not in self.limits[key]:
-            self.limits[key][user_id] = []
-        
-        # Удаляем старые записи
-        self.limits[key][user_id] = [
-            timestamp for timestamp in self.limits[key][user_id]
-            if current_time - timestamp < window
-        ]
-        
+        timestamps = self.limits.setdefault(key, {}).setdefault(user_id, deque())
+
+        # Удаляем старые записи (они всегда в начале очереди)
+        while timestamps and current_time - timestamps[0] >= window:
+            timestamps.popleft()
+
         # Проверяем лимит
-        if len(self.limits[key][user_id]) >= limit:
+        if len(timestamps) >= limit:
             return False
-        
+
         # Добавляем новую запись
-        self.limits[key][user_id].append(current_time)
+        if record:
+            timestamps.append(current_time)
         return True
-    
+
     def get_remaining_time(
         self,
         user_id: int,
         key: str,
         window: int = 3600
     ) -> int:
-        """Получить время до сброса лимита в секундах"""
-        if key not in self.limits or user_id not in self.limits[key]:
-            return 0
-        
-        if not self.limits[key][user_id]:
+        """Получить время до сброса лимита в секундах (локально)"""
+        timestamps = self.limits.get(key, {}).get(user_id)
+        if not timestamps:
             return 0
-        
-        oldest_timestamp = min(self.limits[key][user_id])
-        time_passed = time.time() - oldest_timestamp
+
+        time_passed = time.time() - timestamps[0]
         remaining = window - time_passed
-        
+
         return max(0, int(remaining))
 
 # Глобальный экземпляр
@@ -142,7 +320,7 @@ def rate_limit(
 ):
     """
     Декоратор для ограничения частоты вызовов
-    
+
     Args:
         key: Ключ для группировки (если None, используется имя функции)
         limit: Максимальное количество вызовов
@@ -157,76 +335,79 @@ def rate_limit(
         ):
             user_id = update.from_user.id
             limit_key = key or func.__name__
-            
-            if not user_throttling.check_limit(user_id, limit_key, limit, window):
-                remaining = user_throttling.get_remaining_time(user_id, limit_key, window)
-                
+
+            allowed, _, remaining, _ = await user_throttling.acquire(
+                user_id,
+                [(limit_key, limit, window)]
+            )
+            if not allowed:
                 if remaining > 60:
                     time_text = f"{remaining // 60} мин"
                 else:
                     time_text = f"{remaining} сек"
-                
+
                 text = (
                     f"⏱ Превышен лимит ({limit} за {window // 60} мин)\n"
                     f"Попробуйте через {time_text}"
                 )
-                
+
                 if isinstance(update, Message):
                     await update.answer(text)
                 else:
                     await update.answer(text, show_alert=True)
-                
+
                 return
-            
+
             return await func(update, *args, **kwargs)
-        
+
         return wrapper
     return decorator
 
 class GenerationThrottling:
     """Специальный throttling для генераций"""
-    
+
+    @staticmethod
+    def _windows() -> List[Tuple[str, int, int]]:
+        return [
+            ('generation_per_minute', settings.GENERATIONS_PER_MINUTE, 60),
+            ('generation_per_hour', settings.GENERATIONS_PER_HOUR, 3600)
+        ]
+
     @staticmethod
-    async def check_generation_limit(user_id: int) -> tuple[bool, str]:
+    async def check_generation_limit(user_id: int) -> tuple[bool, str, Optional[str]]:
         """
-        Проверка лимитов генерации
-        
+        Проверка лимитов генерации (минутный и часовой лимиты списываются атомарно)
+
         Returns:
-            (allowed, error_message)
+            (allowed, error_message, reservation) - reservation передается
+            в cancel_generation_limit, если генерация не состоялась
         """
-        # Проверяем лимит в минуту
-        if not user_throttling.check_limit(
-            user_id,
-            'generation_per_minute',
-            limit=3,
-            window=60
-        ):
-            return False, "Максимум 3 генерации в минуту"
-        
-        # Проверяем лимит в час
-        if not user_throttling.check_limit(
+        allowed, failed_index, remaining, reservation = await user_throttling.acquire(
             user_id,
-            'generation_per_hour',
-            limit=30,
-            window=3600
-        ):
-            remaining = user_throttling.get_remaining_time(
-                user_id,
-                'generation_per_hour',
-                3600
-            )
-            return False, f"Превышен часовой лимит. Попробуйте через {remaining // 60} мин"
-        
-        return True, ""
-    
+            GenerationThrottling._windows()
+        )
+
+        if allowed:
+            return True, "", reservation
+
+        if failed_index == 0:
+            return False, f"Максимум {settings.GENERATIONS_PER_MINUTE} генерации в минуту", None
+
+        return False, f"Превышен часовой лимит. Попробуйте через {remaining // 60} мин", None
+
     @staticmethod
-    def cancel_generation_limit(user_id: int):
+    def cancel_generation_limit(user_id: int, reservation: Optional[str]) -> Optional[asyncio.Task]:
         """
-        Отменить последний лимит генерации (при неудачной генерации)
+        Отменить списание лимита генерации reservation (при неудачной генерации)
+
+        Откат выполняется в фоне; вернувшуюся задачу можно дождаться через await,
+        если цикл событий скоро завершится (например, в Celery-задачах).
+        Без reservation откатывать нечего - возвращается None.
         """
-        # Удаляем последнюю запись из лимитов
-        for key in ['generation_per_minute', 'generation_per_hour']:
-            if (key in user_throttling.limits and 
-                user_id in user_throttling.limits[key] and 
-                user_throttling.limits[key][user_id]):
-                user_throttling.limits[key][user_id].pop()  # Удаляем последнюю запись
\ No newline at end of file
+        if not reservation:
+            return None
+        return user_throttling.schedule_rollback(
+            user_id,
+            GenerationThrottling._windows(),
+            reservation
+        )
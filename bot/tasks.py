@@ -4,14 +4,15 @@ from celery import Celery, Task
 from celery.utils.log import get_task_logger
 from datetime import datetime, timedelta
 import aiohttp
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from core.config import settings
 from core.constants import GenerationStatus
 from services.database import db
 from services.wavespeed_api import get_wavespeed_api, GenerationRequest
 from services.api_monitor import api_monitor
-from models.models import User, Generation, Transaction, Statistics
+from services.retention import retention
+from models.models import User, Generation, Transaction
 
 # Настройка Celery
 app = Celery('seedance_bot')
@@ -83,7 +84,11 @@ class GenerateVideoTask(AsyncTask):
                     user = await db.get_user_by_id(generation.user_id)
                     if user:
                         from bot.middlewares.throttling import GenerationThrottling
-                        GenerationThrottling.cancel_generation_limit(user.telegram_id)
+                        rollback = GenerationThrottling.cancel_generation_limit(
+                            user.telegram_id, generation_data.get('throttle_reservation')
+                        )
+                        if rollback:
+                            await rollback
                 
                 return {
                     'success': False,
@@ -177,7 +182,11 @@ class GenerateVideoTask(AsyncTask):
                 user = await db.get_user_by_id(generation.user_id)
                 if user:
                     from bot.middlewares.throttling import GenerationThrottling
-                    GenerationThrottling.cancel_generation_limit(user.telegram_id)
+                    rollback = GenerationThrottling.cancel_generation_limit(
+                        user.telegram_id, generation_data.get('throttle_reservation')
+                    )
+                    if rollback:
+                        await rollback
                 
                 # Отправляем уведомление об ошибке
                 await send_generation_notification(
@@ -266,35 +275,29 @@ async def send_generation_notification(generation_id: int, status: str, **kwargs
         await bot.session.close()
 
 @app.task
-def cleanup_old_generations():
-    """Очистка старых генераций"""
+def apply_retention():
+    """Партиции журналов на будущие месяцы и удаление истории старше срока хранения"""
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     
     try:
-        loop.run_until_complete(_cleanup_old_generations())
+        return loop.run_until_complete(_apply_retention())
     finally:
         loop.close()
 
-async def _cleanup_old_generations():
-    """Асинхронная очистка старых генераций"""
-    # Удаляем генерации старше 30 дней
-    cutoff_date = datetime.utcnow() - timedelta(days=30)
+async def _apply_retention():
+    """Асинхронное обслуживание истории, возвращает отчет по таблицам"""
+    await retention.ensure_partitions()
+    reports = await retention.apply_retention()
     
-    async with db.async_session() as session:
-        from sqlalchemy import delete
-        
-        result = await session.execute(
-            delete(Generation).where(
-                Generation.created_at < cutoff_date,
-                Generation.status.in_([GenerationStatus.COMPLETED, GenerationStatus.FAILED])
-            )
-        )
-        
-        deleted_count = result.rowcount
-        await session.commit()
-        
-        logger.info(f"Deleted {deleted_count} old generations")
+    total_rows = sum(report['rows'] for report in reports)
+    total_bytes = sum(report['bytes'] or 0 for report in reports)
+    logger.info(f"Retention finished: {total_rows} rows, ~{total_bytes} bytes reclaimed")
+    
+    return [
+        {**report, 'cutoff': report['cutoff'].isoformat()}
+        for report in reports
+    ]
 
 @app.task
 def calculate_daily_statistics():
@@ -308,79 +311,23 @@ def calculate_daily_statistics():
         loop.close()
 
 async def _calculate_daily_statistics():
-    """Асинхронный расчет статистики"""
+    """Асинхронный расчет статистики за вчера (повторный запуск перезаписывает день)"""
     yesterday = datetime.utcnow().date() - timedelta(days=1)
     
-    async with db.async_session() as session:
-        from sqlalchemy import select, func, and_
-        
-        # Новые пользователи
-        new_users = await session.execute(
-            select(func.count(User.id)).where(
-                func.date(User.created_at) == yesterday
-            )
-        )
-        
-        # Активные пользователи
-        active_users = await session.execute(
-            select(func.count(func.distinct(Generation.user_id))).where(
-                func.date(Generation.created_at) == yesterday
-            )
-        )
-        
-        # Генерации
-        total_generations = await session.execute(
-            select(func.count(Generation.id)).where(
-                func.date(Generation.created_at) == yesterday
-            )
-        )
-        
-        successful_generations = await session.execute(
-            select(func.count(Generation.id)).where(
-                and_(
-                    func.date(Generation.created_at) == yesterday,
-                    Generation.status == GenerationStatus.COMPLETED
-                )
-            )
-        )
-        
-        # Доход
-        revenue = await session.execute(
-            select(func.sum(Transaction.stars_paid)).where(
-                and_(
-                    func.date(Transaction.created_at) == yesterday,
-                    Transaction.status == 'completed'
-                )
-            )
-        )
-        
-        # Среднее время генерации
-        avg_gen_time = await session.execute(
-            select(func.avg(Generation.generation_time)).where(
-                and_(
-                    func.date(Generation.created_at) == yesterday,
-                    Generation.status == GenerationStatus.COMPLETED,
-                    Generation.generation_time.isnot(None)
-                )
-            )
-        )
-        
-        # Сохраняем статистику
-        stats = Statistics(
-            date=yesterday,
-            new_users=new_users.scalar() or 0,
-            active_users=active_users.scalar() or 0,
-            total_generations=total_generations.scalar() or 0,
-            successful_generations=successful_generations.scalar() or 0,
-            failed_generations=(total_generations.scalar() or 0) - (successful_generations.scalar() or 0),
-            revenue_stars=revenue.scalar() or 0,
-            avg_generation_time=avg_gen_time.scalar()
-        )
-        
-        session.add(stats)
-        await session.commit()
-        
-        logger.info(f"Daily statistics calculated for {yesterday}")
+    await db.recalculate_daily_statistics(yesterday)
+    
+    logger.info(f"Daily statistics calculated for {yesterday}")
+
+@app.task
+def rebase_live_counters():
+    """Пересчет живых счетчиков дашборда администратора из БД"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    
+    try:
+        loop.run_until_complete(db.rebase_live_counters())
+    finally:
+        loop.close()
 
 @app.task
 def send_inactive_user_reminder():
@@ -446,14 +393,18 @@ async def _send_inactive_user_reminder():
 from celery.schedules import crontab
 
 app.conf.beat_schedule = {
-    'cleanup-old-generations': {
-        'task': 'bot.tasks.cleanup_old_generations',
+    'apply-retention': {
+        'task': 'bot.tasks.apply_retention',
         'schedule': crontab(hour=3, minute=0),  # Каждый день в 3:00
     },
     'calculate-daily-statistics': {
         'task': 'bot.tasks.calculate_daily_statistics',
         'schedule': crontab(hour=0, minute=30),  # Каждый день в 0:30
     },
+    'rebase-live-counters': {
+        'task': 'bot.tasks.rebase_live_counters',
+        'schedule': crontab(minute='*/10'),  # Каждые 10 минут
+    },
     'send-inactive-reminders': {
         'task': 'bot.tasks.send_inactive_user_reminder',
         'schedule': crontab(hour=12, minute=0, day_of_week=1),  # Каждый понедельник в 12:00
@@ -464,8 +415,13 @@ app.conf.beat_schedule = {
 generate_video_task = app.register_task(GenerateVideoTask())
 
 # Утилиты для работы с задачами
-async def cancel_generation_task(generation_id: int) -> bool:
-    """Отмена задачи генерации"""
+async def cancel_generation_task(generation_id: int, throttle_reservation: Optional[str] = None) -> bool:
+    """
+    Отмена задачи генерации
+    
+    Args:
+        throttle_reservation: id списания лимита генерации (из check_generation_limit)
+    """
     try:
         generation = await db.get_generation(generation_id)
         if generation and generation.task_id:
@@ -484,7 +440,9 @@ async def cancel_generation_task(generation_id: int) -> bool:
             user = await db.get_user_by_id(generation.user_id)
             if user:
                 from bot.middlewares.throttling import GenerationThrottling
-                GenerationThrottling.cancel_generation_limit(user.telegram_id)
+                rollback = GenerationThrottling.cancel_generation_limit(user.telegram_id, throttle_reservation)
+                if rollback:
+                    await rollback
             
             logger.info(f"Generation task {generation.task_id} cancelled")
             return True
@@ -0,0 +1,185 @@
+"""
+Скомпилированные шаблоны больших экранов
+
+Экран описывается один раз: переводы помечаются как [[ключ]] (или
+[[ключ|текст по умолчанию]]), динамические значения - как обычные поля
+str.format ({balance}). При первом рендере на языке все переводы
+подставляются в шаблон, и дальше рендер - это один вызов format_map.
+
+[[=ключ]] подставляет перевод, который сам содержит плейсхолдеры:
+его поля становятся полями экрана (например, {name} в приветствии).
+"""
+
+import re
+import string
+import logging
+from typing import Dict, Tuple, Optional
+
+from bot.middlewares.i18n import i18n
+
+logger = logging.getLogger(__name__)
+
+_MARKER = re.compile(r"\[\[(=?)([\w.]+)(?:\|([^\]]*))?\]\]")
+_formatter = string.Formatter()
+
+
+class _Slots(dict):
+    """Значения экрана: неизвестное поле остается в тексте как есть"""
+
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+def _is_format_string(value: str) -> bool:
+    try:
+        list(_formatter.parse(value))
+        return True
+    except ValueError:
+        return False
+
+
+class ScreenTemplate:
+    """Шаблон экрана, компилируемый один раз на язык"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self._compiled: Dict[str, Tuple[int, str]] = {}  # язык -> (версия переводов, шаблон)
+
+    def compile(self, lang: str) -> str:
+        """Подставить переводы языка в шаблон"""
+        def substitute(match: re.Match) -> str:
+            is_format, key, default = match.groups()
+            value = str(i18n.get(key, lang, default=default))
+            if is_format and _is_format_string(value):
+                return value
+            return value.replace('{', '{{').replace('}', '}}')
+
+        return _MARKER.sub(substitute, self.source)
+
+    def render(self, lang: Optional[str] = None, **values) -> str:
+        """Отрендерить экран на языке пользователя"""
+        lang = lang or i18n.default_lang
+        compiled = self._compiled.get(lang)
+        if compiled is None or compiled[0] != i18n.version:
+            # Первый рендер на языке или переводы перезагружены
+            compiled = (i18n.version, self.compile(lang))
+            self._compiled[lang] = compiled
+        return compiled[1].format_map(_Slots(values))
+
+
+# ========== Главное меню ==========
+
+def _main_menu_source(welcome_key: str, special_offer: bool) -> str:
+    offer = "\n[[menu.beautiful.special_offer]]\n\n" if special_offer else ""
+    return f"""
+[[menu.beautiful.divider]]
+[[={welcome_key}]]
+[[menu.beautiful.divider]]
+
+[[menu.beautiful.dashboard]]
+
+[[menu.beautiful.wallet]]
+💰 <b>{{balance:,}}</b> [[menu.beautiful.credits_label]]
+{{status}}
+
+[[menu.beautiful.video_stats]]
+🎬 <b>{{total_generations}}</b> [[menu.beautiful.videos_label]]
+📅 [[=menu.beautiful.last_video]]
+
+[[menu.beautiful.divider]]
+{offer}[[menu.beautiful.quick_actions]]
+[[menu.beautiful.lets_create]]"""
+
+
+MAIN_MENU = ScreenTemplate(_main_menu_source("menu.beautiful.welcome_back", special_offer=False))
+MAIN_MENU_NEW_USER = ScreenTemplate(_main_menu_source("menu.beautiful.welcome", special_offer=True))
+
+
+# ========== Генерация ==========
+
+GENERATION_CONFIRMATION = ScreenTemplate("""
+[[generation.beautiful.divider]]
+[[generation.beautiful.create_title]]
+[[generation.beautiful.ai_magic]]
+[[generation.beautiful.divider]]
+
+[[generation.beautiful.confirmation]]
+[[generation.beautiful.generation_summary]]
+
+📋 <b>Параметры генерации:</b>
+├ 🎯 Режим: {mode}
+├ 🤖 Модель: {model}
+├ 📐 Разрешение: {resolution}
+├ ⏱️ Длительность: {duration}{extra_params}
+└ 💰 Стоимость: {cost} кредитов
+
+📝 <b>Ваш промпт:</b>
+<i>"{prompt}"</i>
+
+💰 <b>Баланс:</b> {balance} кредитов{balance_status}
+
+[[generation.beautiful.all_set]]
+
+[[generation.beautiful.divider]]
+""")
+
+GENERATION_STARTED = ScreenTemplate("""
+[[generation.beautiful.divider]]
+[[generation.beautiful.processing_title]]
+[[generation.beautiful.ai_working]]
+[[generation.beautiful.divider]]
+
+🆔 <b>ID генерации:</b> <code>{generation_id}</code>
+💰 <b>Списано кредитов:</b> {cost}
+
+[[generation.beautiful.progress_processing]]
+[[generation.beautiful.progress_bar]]
+
+[[generation.beautiful.please_wait]]
+[[generation.beautiful.eta]]
+
+[[generation.beautiful.divider]]
+""")
+
+GENERATION_PROGRESS = ScreenTemplate("""
+[[generation.beautiful.divider]]
+[[generation.beautiful.processing_title]]
+[[generation.beautiful.ai_working]]
+[[generation.beautiful.divider]]
+
+🆔 <b>ID генерации:</b> <code>{generation_id}</code>
+💰 <b>Списано кредитов:</b> {cost}
+
+{status_emoji} <b>{status_text}</b>
+{progress_bar} {progress}%
+
+⏱ <b>Прошло времени:</b> {elapsed}
+
+[[generation.beautiful.divider]]
+""")
+
+
+# ========== Статистика пользователя ==========
+
+USER_STATISTICS = ScreenTemplate(
+    "📊 <b>[[statistics.title|Статистика]]</b>\n\n"
+    "👤 <b>[[statistics.profile|Профиль]]:</b>\n"
+    "├ 🆔 ID: <code>{telegram_id}</code>\n"
+    "├ 📅 [[statistics.registration|Регистрация]]: {reg_date}\n"
+    "└ 🌐 [[statistics.language|Язык]]: {language_name}\n\n"
+    "💰 <b>[[statistics.balance|Баланс]]:</b>\n"
+    "├ 💳 [[statistics.current|Текущий]]: {balance} [[common.credits]]\n"
+    "├ 📥 [[statistics.total_bought|Куплено]]: {total_bought} [[common.credits]]\n"
+    "├ 🎁 [[statistics.bonuses_received|Получено бонусов]]: {total_bonuses} [[common.credits]]\n"
+    "└ 📤 [[statistics.total_spent|Потрачено]]: {total_spent} [[common.credits]]\n\n"
+    "🎬 <b>[[statistics.generations|Генерации]]:</b>\n"
+    "├ 📊 [[statistics.total|Всего]]: {total_generations}\n"
+    "├ ✅ [[statistics.successful|Успешных]]: {successful_generations}\n"
+    "├ ❌ [[statistics.failed|Неудачных]]: {failed_generations}\n"
+    "├ ⭐ [[statistics.avg_rating|Средняя оценка]]: {average_rating:.1f}/5\n"
+    "└ 📈 [[statistics.avg_per_day|В среднем в день]]: {avg_per_day:.1f}\n\n"
+    "📈 <b>[[statistics.activity|Активность]]:</b>\n"
+    "├ 📅 [[statistics.last_generation|Последняя генерация]]: {last_generation}\n"
+    "├ 🔥 [[statistics.current_streak|Текущая серия]]: {current_streak} [[common.days|дней]]\n"
+    "└ 🏆 [[statistics.max_streak|Максимальная серия]]: {max_streak} [[common.days|дней]]"
+)
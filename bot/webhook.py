@@ -0,0 +1,215 @@
+"""
+Обработка апдейтов вебхука через ограниченную очередь
+
+SimpleRequestHandler в фоновом режиме создает отдельную задачу на каждый
+апдейт: их число ничем не ограничено, а апдейты одного пользователя
+обрабатываются в произвольном порядке. Здесь вебхук так же сразу отвечает
+Telegram, но апдейт встает в очередь своего пользователя (по ID). Очередь
+пользователя разбирает своя задача строго по порядку, а общее число
+одновременно обрабатываемых апдейтов ограничено семафором: медленный
+обработчик задерживает только своего пользователя.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Any, Tuple
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from services.diagnostics import startup_timer
+
+logger = logging.getLogger(__name__)
+
+
+def get_update_user_id(update: Dict[str, Any]) -> int:
+    """ID пользователя (или чата) апдейта - ключ очереди пользователя"""
+    for key, payload in update.items():
+        if key == 'update_id' or not isinstance(payload, dict):
+            continue
+        sender = payload.get('from') or payload.get('user')
+        if sender and 'id' in sender:
+            return sender['id']
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat and 'id' in chat:
+            return chat['id']
+    return update.get('update_id', 0)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Вебхук с ограниченной очередью и упорядоченной обработкой по пользователям"""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        workers: int = 32,
+        max_queue_size: int = 10000,
+        put_timeout: float = 0.5,
+        drain_timeout: float = 10.0,
+        **data: Any
+    ):
+        """
+        Args:
+            workers: Предел одновременно обрабатываемых апдейтов
+            max_queue_size: Сколько апдейтов может быть принято и еще не обработано
+            put_timeout: Сколько ждать места в очереди, прежде чем отказать Telegram
+            drain_timeout: Сколько ждать обработки остатка очереди при остановке
+        """
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **data)
+        self.workers = max(1, workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self.put_timeout = put_timeout
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(self.workers)
+        # Очереди пользователей с незавершенными апдейтами и задачи, которые их разбирают
+        self._queues: Dict[int, Deque[Tuple[float, Bot, Dict[str, Any]]]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._pending = 0  # Принято и еще не обработано (в очередях и в работе)
+        self._space = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+
+        # Метрики
+        self.in_flight = 0
+        self.enqueued_total = 0
+        self.processed_total = 0
+        self.failed_total = 0
+        self.rejected_total = 0
+        self.backpressure_waits = 0
+        self.max_depth = 0
+        self.max_in_flight = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+
+    async def _wait_for_space(self) -> bool:
+        """Дождаться места в очереди не дольше put_timeout"""
+        deadline = time.monotonic() + self.put_timeout
+        while self._pending >= self.max_queue_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._closing:
+                return False
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return not self._closing
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if self._closing:
+            return web.Response(status=503, headers={'Retry-After': '5'})
+
+        update = await request.json(loads=bot.session.json_loads)
+
+        if self._pending >= self.max_queue_size:
+            # Очередь заполнена - немного ждем, затем просим Telegram повторить позже
+            self.backpressure_waits += 1
+            if not await self._wait_for_space():
+                self.rejected_total += 1
+                logger.warning(f"Update queue overflow, update {update.get('update_id')} rejected")
+                return web.Response(status=503, headers={'Retry-After': '1'})
+
+        user_id = get_update_user_id(update)
+        self._pending += 1
+        self._idle.clear()
+        self.enqueued_total += 1
+
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._tasks[user_id] = asyncio.create_task(self._drain_user(user_id, queue), name=f"updates-{user_id}")
+        queue.append((time.monotonic(), bot, update))
+
+        depth = self.depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _drain_user(self, user_id: int, queue: Deque[Tuple[float, Bot, Dict[str, Any]]]):
+        """Обработать апдейты пользователя по порядку, занимая общий слот на каждый апдейт"""
+        try:
+            while queue:
+                enqueued_at, bot, update = queue[0]
+                async with self._slots:
+                    queue.popleft()
+                    wait = time.monotonic() - enqueued_at
+                    self.total_queue_wait += wait
+                    self.max_queue_wait = max(self.max_queue_wait, wait)
+                    self.in_flight += 1
+                    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                    try:
+                        await self._process(bot, update)
+                    finally:
+                        self.in_flight -= 1
+                        self._pending -= 1
+                        self._space.set()
+                        if not self._pending:
+                            self._idle.set()
+        finally:
+            # Проверка и удаление без await между ними: новый апдейт либо попал
+            # в эту очередь до выхода, либо создаст новую задачу
+            del self._queues[user_id]
+            del self._tasks[user_id]
+
+    async def _process(self, bot: Bot, update: Dict[str, Any]):
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+            self.processed_total += 1
+            if self.processed_total == 1:
+                startup_timer.mark_update_handled()
+        except Exception as e:
+            self.failed_total += 1
+            logger.error(f"Error processing update {update.get('update_id')}: {e}")
+
+    @property
+    def depth(self) -> int:
+        """Апдейты, ожидающие обработки"""
+        return self._pending - self.in_flight
+
+    async def close(self) -> None:
+        """Дообработать очередь и остановить обработку"""
+        self._closing = True
+        self._space.set()
+
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Update queue drain timed out, {self._pending} updates dropped")
+
+            tasks = list(self._tasks.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        await super().close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики очереди"""
+        dequeued = self.processed_total + self.failed_total
+        return {
+            'workers': self.workers,
+            'capacity': self.max_queue_size,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'active_users': len(self._queues),
+            'busiest_user_depth': max((len(queue) for queue in self._queues.values()), default=0),
+            'enqueued_total': self.enqueued_total,
+            'processed_total': self.processed_total,
+            'failed_total': self.failed_total,
+            'rejected_total': self.rejected_total,
+            'backpressure_waits': self.backpressure_waits,
+            'avg_queue_wait_ms': round(self.total_queue_wait / dequeued * 1000, 2) if dequeued else 0.0,
+            'max_queue_wait_ms': round(self.max_queue_wait * 1000, 2)
+        }
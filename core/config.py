@@ -25,6 +25,11 @@ class Settings(BaseSettings):
     DB_USER: str = "seedance"
     DB_PASSWORD: str = "test_password"
     
+    # Реплика только для чтения (аналитика, выгрузки, статистика); пусто - все читается с основной БД
+    DB_REPLICA_URL: Optional[str] = None
+    DB_REPLICA_MAX_LAG: float = 30.0  # Допустимое отставание реплики (секунды), иначе чтение с основной
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = 10.0  # Как часто проверять отставание реплики (секунды)
+    
     @property
     def DATABASE_URL(self) -> str:
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
@@ -45,6 +50,11 @@ class Settings(BaseSettings):
     WEBHOOK_HOST: Optional[str] = None
     WEBHOOK_PATH: str = "/webhook"
     WEBHOOK_PORT: int = 8080
+    WEBHOOK_UPDATE_QUEUE: bool = True  # Обрабатывать апдейты через очередь с порядком по пользователям
+    WEBHOOK_WORKERS: int = 32  # Предел одновременно обрабатываемых апдейтов вебхука
+    WEBHOOK_QUEUE_SIZE: int = 10000  # Общий размер очереди апдейтов
+    WEBHOOK_QUEUE_PUT_TIMEOUT: float = 0.5  # Ожидание места в очереди перед ответом 503
+    WEBHOOK_PROCESSES: int = 1  # Процессов-воркеров вебхука на одном порту (SO_REUSEPORT)
     
     @property
     def WEBHOOK_URL(self) -> Optional[str]:
@@ -88,6 +98,24 @@ class Settings(BaseSettings):
                 return int(v)
         return v
     
+    # Обязательная подписка на канал
+    CHANNEL_USERNAME: Optional[str] = None  # Без @, пусто - проверка отключена
+    SUBSCRIPTION_CACHE_POSITIVE_TTL: int = 3600  # Кеш "подписан" (секунды)
+    SUBSCRIPTION_CACHE_NEGATIVE_TTL: int = 60  # Кеш "не подписан" (секунды)
+    SUBSCRIPTION_LOCAL_CACHE_TTL: int = 60  # In-process кеш положительных проверок (секунды)
+    
+    @field_validator('CHANNEL_USERNAME', mode='before')
+    @classmethod
+    def parse_channel_username(cls, v):
+        if v is None:
+            return None
+        if isinstance(v, str):
+            clean_str = v.split('#')[0].strip().lstrip('@')
+            if not clean_str or clean_str == 'None':
+                return None
+            return clean_str
+        return v
+    
     # Support
     SUPPORT_CHAT_ID: Optional[int] = None
     
@@ -137,6 +165,7 @@ class Settings(BaseSettings):
     GENERATIONS_PER_MINUTE: int = 3
     GENERATIONS_PER_HOUR: int = 30
     API_REQUESTS_PER_SECOND: float = 10.0
+    RATE_LIMIT_REDIS_TIMEOUT: float = 0.25  # Дольше ждать Redis не будем - локальный режим
     
     # Celery
     CELERY_BROKER_URL: Optional[str] = None
@@ -180,6 +209,25 @@ class Settings(BaseSettings):
     CACHE_TTL: int = 3600  # 1 час
     USER_CACHE_TTL: int = 300  # 5 минут
     STATS_CACHE_TTL: int = 600  # 10 минут
+    REFERRAL_SUMMARY_CACHE_TTL: int = 600  # Сводка по рефералам в Redis (секунды)
+    USER_CONTEXT_CACHE_TTL: float = 5.0  # In-process кеш пользователей (секунды, 0 - отключен)
+    LIVE_COUNTERS_MAX_AGE: int = 1800  # Счетчики дашборда старше этого пересчитываются из БД (секунды)
+    
+    # Отложенная запись активности пользователей
+    ACTIVITY_FLUSH_INTERVAL: float = 5.0  # Интервал сброса last_active в БД (секунды)
+    ACTIVITY_BUFFER_MAX_SIZE: int = 10000  # Досрочный сброс при таком размере буфера
+    ACTIVITY_BUFFER_LIMIT: int = 100000  # Предел буфера при сбоях записи, сверх него отметки отбрасываются
+    
+    # Статистика SQL-запросов (services/query_stats.py)
+    QUERY_STATS_ENABLED: bool = True  # Замер запросов DatabaseService и ожидания пула
+    SLOW_QUERY_THRESHOLD_MS: float = 500.0  # Запросы дольше пишутся в журнал медленных (мс)
+    QUERY_STATS_SAMPLE_SIZE: int = 512  # Последних замеров на отпечаток для перцентилей
+    QUERY_STATS_MAX_FINGERPRINTS: int = 500  # Предел числа отпечатков запросов
+    
+    # Буферизованная запись журналов аудита (user_actions, admin_logs)
+    AUDIT_FLUSH_INTERVAL: float = 2.0  # Интервал сброса очереди в БД (секунды)
+    AUDIT_BATCH_SIZE: int = 500  # Строк в одном INSERT, досрочный сброс при таком размере очереди
+    AUDIT_QUEUE_MAX_SIZE: int = 20000  # Предел очереди, сверх него строки отбрасываются
     
     # Локализация
     DEFAULT_LANGUAGE: str = "ru"
@@ -194,6 +242,14 @@ class Settings(BaseSettings):
     ENABLE_ANALYTICS: bool = True
     ANALYTICS_SAMPLE_RATE: float = 0.1  # 10% выборка
     
+    # Хранение истории (задача apply_retention)
+    GENERATIONS_RETENTION_DAYS: int = 30  # Завершенные и неудачные генерации
+    USER_ACTIONS_RETENTION_DAYS: int = 90  # Журнал действий пользователей
+    UTM_RETENTION_DAYS: int = 365  # Клики и события UTM-кампаний
+    RETENTION_BATCH_SIZE: int = 5000  # Строк в одной порции DELETE
+    RETENTION_BATCH_PAUSE: float = 0.2  # Пауза между порциями DELETE (секунды)
+    PARTITION_MONTHS_AHEAD: int = 2  # На сколько месяцев вперед создавать партиции журналов
+    
     # Резервное копирование
     BACKUP_ENABLED: bool = True
     BACKUP_INTERVAL_HOURS: int = 24
@@ -0,0 +1,190 @@
+"""
+Запуск aiohttp-приложения в нескольких процессах на одном порту
+
+Каждый воркер - отдельный процесс со своим event loop (uvloop, если
+установлен), своей сессией бота и своим пулом соединений с БД. Все воркеры
+слушают один порт через SO_REUSEPORT, и ядро само распределяет входящие
+соединения между ними.
+
+Состояние, которое должно быть общим для воркеров, хранится в Redis:
+FSM (RedisStorage), throttling, кеш подписок, кулдауны уведомлений.
+In-process кеши (пользователи, переводы, шаблоны экранов) у каждого
+воркера свои и живут недолго либо не меняются.
+"""
+
+import os
+import time
+import signal
+import asyncio
+import logging
+import multiprocessing
+from typing import Callable, Awaitable, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Номер воркера текущего процесса (0 - основной: вебхук и команды бота)
+WORKER_INDEX_ENV = "WEBHOOK_WORKER_INDEX"
+# Признак того, что воркер перезапущен после падения
+WORKER_RESTART_ENV = "WEBHOOK_WORKER_RESTART"
+# Признак того, что общая подготовка (схема БД) выполнена родителем до запуска воркеров
+WORKERS_PREPARED_ENV = "WEBHOOK_WORKERS_PREPARED"
+
+
+def get_worker_index() -> int:
+    """Номер воркера текущего процесса"""
+    return int(os.environ.get(WORKER_INDEX_ENV, "0"))
+
+
+def is_primary_worker() -> bool:
+    """Выполняет ли текущий процесс однократные задачи запуска/остановки"""
+    return get_worker_index() == 0
+
+
+def is_worker_restart() -> bool:
+    """Запущен ли процесс повторно после падения воркера"""
+    return os.environ.get(WORKER_RESTART_ENV) == "1"
+
+
+def is_prepared_by_parent() -> bool:
+    """Выполнил ли родительский процесс подготовку до запуска воркеров"""
+    return os.environ.get(WORKERS_PREPARED_ENV) == "1"
+
+
+def signal_all_workers(signum: int) -> bool:
+    """
+    Отправить сигнал всем воркерам, включая текущий (через родителя, он пересылает)
+
+    Returns:
+        False, если процесс запущен не через run_workers
+    """
+    if WORKER_INDEX_ENV not in os.environ:
+        return False
+    os.kill(os.getppid(), signum)
+    return True
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """Новый event loop (uvloop, если доступен)"""
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop")
+    except ImportError:
+        logger.info("uvloop is not installed, using default asyncio event loop")
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def serve_app(
+    app_factory: Callable[[], Awaitable[web.Application]],
+    host: str,
+    port: int,
+    reuse_port: bool = False
+):
+    """Создать приложение и обслуживать его в текущем процессе"""
+    loop = new_event_loop()
+    app = loop.run_until_complete(app_factory())
+    web.run_app(
+        app,
+        host=host,
+        port=port,
+        reuse_port=reuse_port,
+        loop=loop
+    )
+
+
+def _worker_main(
+    index: int,
+    app_factory: Callable[[], Awaitable[web.Application]],
+    host: str,
+    port: int,
+    restart: bool
+):
+    os.environ[WORKER_INDEX_ENV] = str(index)
+    os.environ[WORKER_RESTART_ENV] = "1" if restart else "0"
+    logger.info(f"Webhook worker {index} started (pid {os.getpid()})")
+    serve_app(app_factory, host, port, reuse_port=True)
+
+
+def run_workers(
+    app_factory: Callable[[], Awaitable[web.Application]],
+    processes: int,
+    host: str,
+    port: int,
+    restart_delay: float = 1.0,
+    prepare: Optional[Callable[[], Awaitable[None]]] = None
+):
+    """
+    Запустить N процессов-воркеров на одном порту и следить за ними
+
+    Упавший воркер перезапускается. SIGTERM/SIGINT пересылаются воркерам,
+    каждый из них корректно завершает свое приложение; SIGHUP (перезагрузка
+    переводов) пересылается как есть.
+
+    Args:
+        app_factory: Корутина-фабрика приложения (функция верхнего уровня модуля)
+        processes: Количество воркеров
+        host: Адрес
+        port: Порт
+        restart_delay: Пауза перед перезапуском упавшего воркера
+        prepare: Корутина-функция, которая выполняется в родителе один раз до
+            запуска воркеров (например, создание схемы БД)
+    """
+    if prepare is not None:
+        # Ни один воркер не начнет обслуживать апдейты до окончания подготовки
+        asyncio.run(prepare())
+        os.environ[WORKERS_PREPARED_ENV] = "1"
+
+    # spawn: каждый воркер инициализирует модули заново и не наследует
+    # соединения, открытые в родителе
+    ctx = multiprocessing.get_context("spawn")
+    workers: dict = {}
+    stopping = False
+
+    def start(index: int, restart: bool = False):
+        process = ctx.Process(
+            target=_worker_main,
+            args=(index, app_factory, host, port, restart),
+            name=f"webhook-worker-{index}"
+        )
+        process.start()
+        workers[index] = process
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM - aiohttp завершает приложение корректно
+
+    def forward(signum, frame):
+        for process in workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, forward)
+
+    for index in range(processes):
+        start(index)
+    logger.info(f"Started {processes} webhook workers on {host}:{port} (SO_REUSEPORT)")
+
+    while workers:
+        for index, process in list(workers.items()):
+            process.join(timeout=0.5)
+            if process.is_alive():
+                continue
+
+            del workers[index]
+            if not stopping:
+                logger.error(f"Webhook worker {index} exited with code {process.exitcode}, restarting")
+                time.sleep(restart_delay)
+                start(index, restart=True)
+
+    logger.info("All webhook workers stopped")
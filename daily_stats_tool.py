@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Пересчет ежедневной статистики (таблица statistics) за прошлые периоды
+
+Строки обновляются по дате, поэтому пересчет можно запускать повторно.
+
+Примеры:
+    python daily_stats_tool.py --date 2024-03-01                       # один день
+    python daily_stats_tool.py --from 2024-01-01 --to 2024-03-31       # период
+    python daily_stats_tool.py --days 30                               # последние 30 дней до вчера
+    python daily_stats_tool.py --days 7 --dry-run                      # только показать
+"""
+
+import sys
+import asyncio
+import argparse
+from datetime import date, datetime, timedelta
+
+from services.database import db
+
+
+def parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {value} (expected YYYY-MM-DD)")
+
+
+async def run(start: date, end: date, dry_run: bool, chunk_days: int) -> int:
+    try:
+        total = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+            if dry_run:
+                rows = await db.calculate_daily_statistics(chunk_start, chunk_end)
+            else:
+                rows = await db.recalculate_daily_statistics(chunk_start, chunk_end)
+
+            for row in rows:
+                print(
+                    f"{row['date']}: users +{row['new_users']}, active {row['active_users']}, "
+                    f"generations {row['total_generations']} (ok {row['successful_generations']}, "
+                    f"failed {row['failed_generations']}), revenue {row['revenue_stars']} stars"
+                )
+            total += len(rows)
+            chunk_start = chunk_end + timedelta(days=1)
+
+        print(f"{'Calculated' if dry_run else 'Saved'}: {total} days")
+        return 0
+    finally:
+        await db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute daily statistics for past periods")
+    parser.add_argument('--date', type=parse_date, help="Single day (YYYY-MM-DD)")
+    parser.add_argument('--from', dest='start', type=parse_date, help="First day of the period")
+    parser.add_argument('--to', dest='end', type=parse_date, help="Last day of the period (default: yesterday)")
+    parser.add_argument('--days', type=int, help="Last N days up to yesterday")
+    parser.add_argument('--chunk-days', type=int, default=31, help="Days aggregated per query batch")
+    parser.add_argument('--dry-run', action='store_true', help="Print the numbers without saving")
+    args = parser.parse_args()
+
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
+    if args.date:
+        start = end = args.date
+    elif args.start:
+        start, end = args.start, args.end or yesterday
+    elif args.days:
+        start, end = yesterday - timedelta(days=args.days - 1), yesterday
+    else:
+        parser.error("use --date, --from or --days")
+
+    if start > end:
+        parser.error("the period start is after its end")
+    if args.chunk_days < 1:
+        parser.error("--chunk-days must be positive")
+
+    return asyncio.run(run(start, end, args.dry_run, args.chunk_days))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
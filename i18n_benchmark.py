@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк переводов: рендер экрана из ~30 ключей через I18n.get
+
+Сравнивает прежний обход вложенных словарей с str.format на каждый вызов
+и плоские каталоги с заранее разобранными шаблонами (FormatTemplate).
+Время зависит от машины, поэтому это отчет, а не тест.
+
+Примеры:
+    python i18n_benchmark.py
+    python i18n_benchmark.py --rounds 5000
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+from bot.middlewares.i18n import I18n
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+
+# Ключи экрана подтверждения генерации - один из самых "тяжелых" по переводам
+SCREEN_KEYS = [
+    "generation.beautiful.divider",
+    "generation.beautiful.create_title",
+    "generation.beautiful.ai_magic",
+    "generation.beautiful.mode_selection",
+    "generation.beautiful.processing_title",
+    "generation.beautiful.ai_working",
+    "generation.beautiful.progress_processing",
+    "generation.beautiful.progress_bar",
+    "generation.beautiful.please_wait",
+    "generation.beautiful.eta",
+    "menu.balance",
+    "common.back",
+    "common.cancel",
+    "missing.key.for.fallback",
+] * 2
+
+
+def legacy_get(i18n: I18n, key: str, lang: str = None, default: str = None, **kwargs):
+    """Прежняя реализация get: обход вложенных словарей и str.format на каждый вызов"""
+    for candidate in (lang or i18n.default_lang, i18n.default_lang):
+        value = i18n.translations.get(candidate) or i18n.translations.get(i18n.default_lang, {})
+        for part in key.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        if value is not None:
+            break
+
+    if value is None:
+        return default if default is not None else key
+    if isinstance(value, str) and kwargs:
+        try:
+            return value.format(**kwargs)
+        except KeyError:
+            return value
+    return value
+
+
+def measure(get, rounds: int) -> float:
+    """Время одного вызова get (нс) на рендере экрана для ru и en"""
+    def render():
+        for lang in ('ru', 'en'):
+            for key in SCREEN_KEYS:
+                get(key, lang, balance=100)
+
+    render()  # Прогрев
+    start = time.perf_counter()
+    for _ in range(rounds):
+        render()
+    return (time.perf_counter() - start) / (rounds * 2 * len(SCREEN_KEYS)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="I18n.get micro-benchmark on a generation screen")
+    parser.add_argument('--rounds', type=int, default=2000, help="Screen renders per implementation")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    i18n = I18n(default_lang='ru', locales_dir=LOCALES_DIR)
+
+    legacy_ns = measure(lambda *a, **kw: legacy_get(i18n, *a, **kw), args.rounds)
+    flat_ns = measure(i18n.get, args.rounds)
+
+    print(f"Screen: {len(SCREEN_KEYS)} keys x 2 languages, {args.rounds} rounds")
+    print(f"  legacy  {legacy_ns:7.0f} ns/call")
+    print(f"  flat    {flat_ns:7.0f} ns/call  (x{legacy_ns / flat_ns:.1f})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест многопроцессного вебхука
+
+По умолчанию поднимает через core.launcher синтетическое приложение
+(разбор апдейта + CPU-работа, сравнимая с рендером экрана) на 1, 2, 4...
+воркерах и для каждого варианта замеряет пропускную способность и задержки.
+С --url отправляет синтетические апдейты на уже запущенный вебхук.
+
+Примеры:
+    python load_test_webhook.py --processes 1 2 4 --duration 10
+    python load_test_webhook.py --url http://127.0.0.1:8080/webhook --concurrency 200
+"""
+
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import multiprocessing
+
+import aiohttp
+from aiohttp import web
+
+from core.launcher import run_workers, new_event_loop
+
+HOST = "127.0.0.1"
+
+
+def make_update(update_id: int) -> dict:
+    user_id = 100000 + update_id % 5000
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load", "language_code": "ru"},
+            "text": "/start"
+        }
+    }
+
+
+async def synthetic_app() -> web.Application:
+    """Приложение-заглушка: та же работа на запрос, что у вебхука, без Telegram и БД"""
+    async def handle(request: web.Request) -> web.Response:
+        update = await request.json()
+        # ~1 мс CPU на апдейт
+        "".join(f"{update['update_id']}:{i}\n" for i in range(3000))
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post("/webhook", handle)
+    return app
+
+
+def _wait_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((HOST, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Port {port} is not listening")
+
+
+async def run_load(url: str, duration: float, concurrency: int) -> dict:
+    """Отправлять апдейты в течение duration секунд из concurrency соединений"""
+    latencies = []
+    errors = 0
+    counter = 0
+    deadline = time.monotonic() + duration
+
+    async def client(session: aiohttp.ClientSession):
+        nonlocal errors, counter
+        while time.monotonic() < deadline:
+            counter += 1
+            body = json.dumps(make_update(counter))
+            started = time.perf_counter()
+            try:
+                async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency, force_close=False)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.monotonic()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99)
+    }
+
+
+def print_result(label: str, result: dict, baseline: float = None):
+    scaling = f"  x{result['rps'] / baseline:.2f}" if baseline else ""
+    print(
+        f"{label:>12}: {result['rps']:8.0f} req/s  "
+        f"p50 {result['p50_ms']:6.1f} ms  p99 {result['p99_ms']:6.1f} ms  "
+        f"errors {result['errors']}{scaling}"
+    )
+
+
+def benchmark_processes(process_counts, port: int, duration: float, concurrency: int):
+    ctx = multiprocessing.get_context("spawn")
+    print(f"CPU cores: {multiprocessing.cpu_count()}, concurrency {concurrency}, {duration:.0f}s per run")
+
+    baseline = None
+    for processes in process_counts:
+        launcher = ctx.Process(target=run_workers, args=(synthetic_app, processes, HOST, port))
+        launcher.start()
+        try:
+            _wait_port(port)
+            time.sleep(1.0)  # даем подняться всем воркерам
+
+            loop = new_event_loop()
+            result = loop.run_until_complete(run_load(f"http://{HOST}:{port}/webhook", duration, concurrency))
+            loop.close()
+
+            baseline = baseline or result["rps"]
+            print_result(f"{processes} worker(s)", result, baseline)
+        finally:
+            launcher.terminate()
+            launcher.join(timeout=15)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the webhook endpoint")
+    parser.add_argument("--url", help="Webhook URL of a running bot (skips the synthetic benchmark)")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--port", type=int, default=18080, help="Port for the synthetic benchmark")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent client connections")
+    args = parser.parse_args()
+
+    if args.url:
+        loop = new_event_loop()
+        result = loop.run_until_complete(run_load(args.url, args.duration, args.concurrency))
+        print_result("webhook", result)
+        return 0
+
+    benchmark_processes(args.processes, args.port, args.duration, args.concurrency)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
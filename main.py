@@ -1,3 +1,8 @@
+import time
+# Момент запуска процесса (для отчета о времени старта)
+PROCESS_STARTED = time.monotonic()
+
+import signal
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
@@ -23,10 +28,16 @@ from bot.middlewares import (
     ThrottlingMiddleware,
     LoggingMiddleware,
     AuthMiddleware,
-    I18nMiddleware
+    I18nMiddleware,
+    i18n,
+    subscription_router
 )
-from services.database import DatabaseService, init_database
+from services.database import init_database, db
 from services.api_monitor import api_monitor
+from services.activity_recorder import activity_recorder
+from services.diagnostics import startup_timer
+from bot.webhook import QueuedRequestHandler
+from core.launcher import is_primary_worker, is_worker_restart, is_prepared_by_parent, serve_app, run_workers
 
 # Настройка логирования
 logging.basicConfig(
@@ -35,6 +46,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Обработчик вебхука в приложении (для метрик в /health)
+WEBHOOK_HANDLER_KEY = web.AppKey("webhook_handler", SimpleRequestHandler)
+
 def setup_logging():
     """Настройка логирования"""
     logging.basicConfig(
@@ -42,16 +56,30 @@ def setup_logging():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
 
-# Создаем экземпляр базы данных
-db = DatabaseService()
+startup_timer.started = PROCESS_STARTED
 
 async def health_check(request):
     """Health check endpoint"""
-    return web.json_response({
+    response = {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "service": "magic-frame-bot"
-    }, status=200)
+    }
+    
+    # Метрики очереди апдейтов (если включена)
+    webhook_handler = request.app.get(WEBHOOK_HANDLER_KEY)
+    if isinstance(webhook_handler, QueuedRequestHandler):
+        response["update_queue"] = webhook_handler.get_stats()
+    
+    # Буфер отметок активности и очередь журналов аудита: отброшенные при переполнении строки
+    response["activity_buffer"] = activity_recorder.get_stats()
+    response["audit_queue"] = db.audit.get_stats()
+    # Чтение с реплики по маршрутам
+    response["read_routing"] = db.get_read_routing_stats()
+    
+    response["startup"] = startup_timer.get_report()
+    
+    return web.json_response(response, status=200)
 
 async def setup_bot_commands(bot: Bot):
     """Настройка команд бота"""
@@ -83,36 +111,63 @@ async def setup_bot_commands(bot: Bot):
         BotCommand(command="support", description="💬 Support")
     ]
     
-    # Устанавливаем команды для разных языков
-    await bot.set_my_commands(ru_commands, language_code="ru")
-    await bot.set_my_commands(en_commands, language_code="en")
-    await bot.set_my_commands(ru_commands)  # По умолчанию
+    # Устанавливаем команды для разных языков (запросы независимы)
+    await asyncio.gather(
+        bot.set_my_commands(ru_commands, language_code="ru"),
+        bot.set_my_commands(en_commands, language_code="en"),
+        bot.set_my_commands(ru_commands)  # По умолчанию
+    )
+
+def setup_reload_signal():
+    """SIGHUP перечитывает переводы в этом процессе (run_workers пересылает его воркерам)"""
+    if not hasattr(signal, 'SIGHUP'):
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, i18n.reload)
+    except NotImplementedError:
+        logger.warning("Signal handlers are not supported, use /reload_translations")
 
 async def on_startup(bot: Bot):
     """Действия при запуске бота"""
     try:
+        setup_reload_signal()
+        
         # Создание необходимых директорий
         import os
         os.makedirs(settings.TEMP_FILES_DIR, exist_ok=True)
         os.makedirs(settings.LOCALES_DIR, exist_ok=True)
         logger.info("Directories created")
         
-        # Инициализация БД
-        await init_database()
-        logger.info("Database initialized")
+        # Фоновая запись активности пользователей и журналов аудита (в каждом воркере)
+        activity_recorder.start()
+        db.audit.start()
         
-        # Установка команд
-        await setup_bot_commands(bot)
+        if not is_primary_worker():
+            # Общие для всех воркеров шаги выполняет основной воркер
+            startup_timer.mark_ready()
+            logger.info("Bot worker started")
+            return
         
+        # БД, команды и вебхук не зависят друг от друга - выполняем параллельно
+        # (апдейты начнут обрабатываться только после завершения on_startup).
+        # При нескольких воркерах схему уже создал родитель (prepare_workers)
+        steps = [startup_timer.timed("commands", setup_bot_commands(bot))]
+        if not is_prepared_by_parent():
+            steps.append(startup_timer.timed("database", init_database()))
         if not settings.DEBUG:
             # Установка вебхука для production
-            await bot.set_webhook(
+            # (после перезапуска упавшего воркера накопившиеся апдейты не сбрасываем)
+            steps.append(startup_timer.timed("webhook", bot.set_webhook(
                 url=settings.WEBHOOK_URL,
-                drop_pending_updates=True,
-                allowed_updates=["message", "callback_query", "pre_checkout_query", "my_chat_member"]
-            )
+                drop_pending_updates=not is_worker_restart(),
+                allowed_updates=["message", "callback_query", "pre_checkout_query", "my_chat_member", "chat_member"]
+            )))
+        await asyncio.gather(*steps)
+        logger.info("Database initialized")
+        if not settings.DEBUG:
             logger.info(f"Webhook set to {settings.WEBHOOK_URL}")
         
+        startup_timer.mark_ready()
         logger.info("Bot started successfully")
         
     except Exception as e:
@@ -123,9 +178,13 @@ async def on_startup(bot: Bot):
 async def on_shutdown(bot: Bot):
     """Действия при остановке бота"""
     try:
-        if not settings.DEBUG:
+        if not settings.DEBUG and is_primary_worker():
             await bot.delete_webhook()
         
+        # Записываем накопленную активность и журналы аудита
+        await activity_recorder.stop()
+        await db.audit.stop()
+        
         await bot.session.close()
         logger.info("Bot stopped")
         
@@ -134,6 +193,7 @@ async def on_shutdown(bot: Bot):
 
 def register_routers(dp: Dispatcher):
     """Регистрация всех роутеров"""
+    dp.include_router(subscription_router)  # Проверка подписки на канал
     dp.include_router(start_handler)
     dp.include_router(generation_handler)
     dp.include_router(payment_handler)
@@ -157,9 +217,9 @@ def register_middlewares(dp: Dispatcher):
     dp.message.middleware(AuthMiddleware())
     dp.callback_query.middleware(AuthMiddleware())
     
-    # Мультиязычность
-    dp.message.middleware(I18nMiddleware())
-    dp.callback_query.middleware(I18nMiddleware())
+    # Мультиязычность (общий каталог переводов с обработчиками)
+    dp.message.middleware(I18nMiddleware(i18n))
+    dp.callback_query.middleware(I18nMiddleware(i18n))
 
 async def create_bot_instance():
     """Создание экземпляра бота"""
@@ -208,15 +268,34 @@ async def create_app():
     app.router.add_get('/health', health_check)
     
     # Настройка вебхука
-    webhook_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot
-    )
+    if settings.WEBHOOK_UPDATE_QUEUE:
+        # Сразу отвечаем Telegram, апдейты обрабатываются воркерами по порядку для каждого пользователя
+        webhook_handler = QueuedRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            workers=settings.WEBHOOK_WORKERS,
+            max_queue_size=settings.WEBHOOK_QUEUE_SIZE,
+            put_timeout=settings.WEBHOOK_QUEUE_PUT_TIMEOUT
+        )
+    else:
+        webhook_handler = SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot
+        )
     webhook_handler.register(app, path=settings.WEBHOOK_PATH)
+    app[WEBHOOK_HANDLER_KEY] = webhook_handler
     setup_application(app, dp, bot=bot)
     
     return app
 
+async def prepare_workers():
+    """Подготовка в родительском процессе до запуска воркеров: схема БД"""
+    try:
+        await init_database()
+    finally:
+        # Соединения этого event loop воркерам не нужны
+        await db.engine.dispose()
+
 async def main_polling():
     """Запуск в режиме polling (для разработки)"""
     logger.info("Starting bot in polling mode...")
@@ -242,14 +321,17 @@ def main():
             logger.info("Bot stopped by user")
     else:
         # Production режим - webhook
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        app = loop.run_until_complete(create_app())
-        web.run_app(
-            app,
-            host="0.0.0.0",
-            port=settings.WEBHOOK_PORT
-        )
+        if settings.WEBHOOK_PROCESSES > 1:
+            # Несколько процессов на одном порту, у каждого свой loop, бот и пул БД
+            run_workers(
+                create_app,
+                processes=settings.WEBHOOK_PROCESSES,
+                host="0.0.0.0",
+                port=settings.WEBHOOK_PORT,
+                prepare=prepare_workers
+            )
+        else:
+            serve_app(create_app, host="0.0.0.0", port=settings.WEBHOOK_PORT)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,47 @@
+-- Материализованная статистика пользователей (user_stats)
+-- Таблица также создается через create_all при старте бота;
+-- миграция заполняет ее для уже существующих пользователей.
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    total_generations INTEGER NOT NULL DEFAULT 0,
+    successful_generations INTEGER NOT NULL DEFAULT 0,
+    last_generation_at TIMESTAMP NULL,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    total_bonuses INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO user_stats (
+    user_id, total_generations, successful_generations, last_generation_at,
+    rating_sum, rating_count, total_bonuses, updated_at
+)
+SELECT
+    u.id,
+    COALESCE(g.total_generations, 0),
+    COALESCE(g.successful_generations, 0),
+    g.last_generation_at,
+    COALESCE(g.rating_sum, 0),
+    COALESCE(g.rating_count, 0),
+    COALESCE(t.total_bonuses, 0),
+    NOW()
+FROM users u
+LEFT JOIN (
+    SELECT
+        user_id,
+        COUNT(*) AS total_generations,
+        COUNT(*) FILTER (WHERE status = 'COMPLETED') AS successful_generations,
+        MAX(created_at) AS last_generation_at,
+        SUM(rating) AS rating_sum,
+        COUNT(rating) AS rating_count
+    FROM generations
+    GROUP BY user_id
+) g ON g.user_id = u.id
+LEFT JOIN (
+    SELECT user_id, SUM(amount) AS total_bonuses
+    FROM transactions
+    WHERE type IN ('BONUS', 'REFERRAL', 'ADMIN_GIFT') AND status = 'COMPLETED'
+    GROUP BY user_id
+) t ON t.user_id = u.id
+ON CONFLICT (user_id) DO NOTHING;
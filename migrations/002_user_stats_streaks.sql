@@ -0,0 +1,35 @@
+-- Серии активности в user_stats и их разовое заполнение по истории
+-- create_all не добавляет колонки в существующую таблицу, поэтому ALTER.
+
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS last_active_day DATE NULL;
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS current_streak INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS max_streak INTEGER NOT NULL DEFAULT 0;
+
+-- Дни подряд имеют одинаковую разность "день - номер дня", это и есть серия
+WITH active_days AS (
+    SELECT DISTINCT user_id, created_at::date AS day
+    FROM generations
+    WHERE status = 'COMPLETED'
+),
+numbered AS (
+    SELECT user_id, day, day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::int AS island
+    FROM active_days
+),
+islands AS (
+    SELECT user_id, MAX(day) AS end_day, COUNT(*) AS length
+    FROM numbered
+    GROUP BY user_id, island
+),
+per_user AS (
+    SELECT user_id, MAX(end_day) AS last_day, MAX(length) AS max_streak
+    FROM islands
+    GROUP BY user_id
+)
+UPDATE user_stats s
+SET last_active_day = p.last_day,
+    current_streak = i.length,
+    max_streak = p.max_streak,
+    updated_at = NOW()
+FROM per_user p
+JOIN islands i ON i.user_id = p.user_id AND i.end_day = p.last_day
+WHERE s.user_id = p.user_id;
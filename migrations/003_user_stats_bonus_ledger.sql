@@ -0,0 +1,21 @@
+-- Счетчики бонусных кредитов в user_stats и их заполнение по истории
+
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS bonus_granted INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE user_stats ADD COLUMN IF NOT EXISTS credits_consumed INTEGER NOT NULL DEFAULT 0;
+
+UPDATE user_stats s
+SET bonus_granted = COALESCE((
+        SELECT SUM(t.amount)
+        FROM transactions t
+        WHERE t.user_id = s.user_id
+          AND t.type IN ('BONUS', 'REFERRAL', 'ADMIN_GIFT')
+          AND t.status = 'COMPLETED'
+          AND t.amount > 0
+    ), 0),
+    credits_consumed = COALESCE((
+        SELECT SUM(g.cost)
+        FROM generations g
+        WHERE g.user_id = s.user_id
+          AND g.status IN ('PENDING', 'PROCESSING', 'COMPLETED')
+    ), 0),
+    updated_at = NOW();
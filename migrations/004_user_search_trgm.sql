@@ -0,0 +1,10 @@
+-- Индексы для поиска пользователей в админке (DatabaseService.search_users)
+-- Триграммные GIN-индексы ускоряют LIKE '%...%' и оператор % по сходству,
+-- btree с text_pattern_ops - поиск "@username" по префиксу.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_user_username_trgm ON users USING gin (lower(username) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_user_first_name_trgm ON users USING gin (lower(first_name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_user_last_name_trgm ON users USING gin (lower(last_name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_user_username_prefix ON users (lower(username) text_pattern_ops);
@@ -0,0 +1,65 @@
+-- Составные и частичные индексы под частые запросы DatabaseService и удаление дублей
+-- Колонки с index=True и явным Index в моделях получали по два одинаковых индекса.
+-- Миграция выполняется в транзакции, поэтому без CONCURRENTLY: на больших
+-- таблицах применяйте ее в период низкой нагрузки.
+-- Планы запросов проверяет tests/test_query_plans.py.
+
+-- Рефералы пользователя и списки пользователей по курсору (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_user_referrer_created ON users (referrer_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_user_created_id ON users (created_at, id);
+
+-- История генераций по курсору, счетчики user_stats и серии по статусу
+CREATE INDEX IF NOT EXISTS idx_generation_user_created ON generations (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_generation_user_status ON generations (user_id, status);
+-- Только ожидающие генерации: дашборд и зависшие задачи
+CREATE INDEX IF NOT EXISTS idx_generation_pending ON generations (created_at) WHERE status IN ('PENDING', 'PROCESSING');
+
+-- Транзакции пользователя по типу и статусу, история по курсору
+CREATE INDEX IF NOT EXISTS idx_transaction_user_type_status ON transactions (user_id, type, status);
+CREATE INDEX IF NOT EXISTS idx_transaction_user_created ON transactions (user_id, created_at, id);
+-- Только завершенные покупки: выручка за день и ежедневная статистика
+CREATE INDEX IF NOT EXISTS idx_transaction_purchase_created ON transactions (created_at) WHERE type = 'PURCHASE' AND status = 'COMPLETED';
+
+-- UTM: клики пользователя по времени и клики пользователя в кампании
+CREATE INDEX IF NOT EXISTS idx_utm_click_user_date ON utm_clicks (user_id, clicked_at);
+CREATE INDEX IF NOT EXISTS idx_utm_click_campaign_user ON utm_clicks (campaign_id, user_id);
+
+-- Покрыты составными индексами выше (первая колонка совпадает)
+DROP INDEX IF EXISTS idx_user_referrer;
+DROP INDEX IF EXISTS idx_user_created;
+DROP INDEX IF EXISTS idx_generation_user;
+DROP INDEX IF EXISTS idx_transaction_user;
+DROP INDEX IF EXISTS idx_utm_click_campaign;
+DROP INDEX IF EXISTS idx_utm_click_user;
+
+-- Дубли явных индексов idx_*, созданные из index=True
+DROP INDEX IF EXISTS ix_users_created_at;
+DROP INDEX IF EXISTS ix_generations_status;
+DROP INDEX IF EXISTS ix_generations_task_id;
+DROP INDEX IF EXISTS ix_generations_created_at;
+DROP INDEX IF EXISTS ix_transactions_type;
+DROP INDEX IF EXISTS ix_transactions_status;
+DROP INDEX IF EXISTS ix_transactions_created_at;
+DROP INDEX IF EXISTS ix_transactions_telegram_charge_id;
+DROP INDEX IF EXISTS ix_support_tickets_status;
+DROP INDEX IF EXISTS ix_support_tickets_created_at;
+DROP INDEX IF EXISTS ix_user_actions_action;
+DROP INDEX IF EXISTS ix_user_actions_created_at;
+DROP INDEX IF EXISTS ix_utm_campaigns_utm_source;
+DROP INDEX IF EXISTS ix_utm_campaigns_utm_medium;
+DROP INDEX IF EXISTS ix_utm_campaigns_utm_campaign;
+DROP INDEX IF EXISTS ix_utm_campaigns_created_at;
+DROP INDEX IF EXISTS ix_utm_campaigns_is_active;
+DROP INDEX IF EXISTS ix_utm_clicks_campaign_id;
+DROP INDEX IF EXISTS ix_utm_clicks_user_id;
+DROP INDEX IF EXISTS ix_utm_clicks_telegram_id;
+DROP INDEX IF EXISTS ix_utm_clicks_clicked_at;
+DROP INDEX IF EXISTS ix_utm_clicks_is_first_visit;
+DROP INDEX IF EXISTS ix_utm_events_campaign_id;
+DROP INDEX IF EXISTS ix_utm_events_user_id;
+DROP INDEX IF EXISTS ix_utm_events_click_id;
+DROP INDEX IF EXISTS ix_utm_events_event_type;
+DROP INDEX IF EXISTS ix_utm_events_event_at;
+DROP INDEX IF EXISTS ix_utm_events_session_id;
+DROP INDEX IF EXISTS ix_package_prices_package_id;
+DROP INDEX IF EXISTS ix_package_prices_is_active;
@@ -0,0 +1,48 @@
+-- Месячные партиции для журналов, которые только дописываются: user_actions и utm_events
+-- Устаревшие месяцы удаляются целиком (services/retention.py), без DELETE и VACUUM.
+-- Первичный ключ партиционированной таблицы включает ключ партиционирования,
+-- поэтому он становится (id, created_at) / (id, event_at); ORM по-прежнему ищет по id.
+-- Существующие строки переносятся в партицию DEFAULT; месячные партиции создает
+-- retention.ensure_partitions() (задача apply_retention), строки из DEFAULT удаляются
+-- по сроку хранения порциями.
+-- Миграция копирует таблицы целиком - применяйте ее в период низкой нагрузки.
+
+-- ========== user_actions ==========
+ALTER TABLE user_actions RENAME TO user_actions_legacy;
+UPDATE user_actions_legacy SET created_at = NOW() AT TIME ZONE 'utc' WHERE created_at IS NULL;
+
+CREATE TABLE user_actions (LIKE user_actions_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at);
+ALTER TABLE user_actions ADD PRIMARY KEY (id, created_at);
+ALTER TABLE user_actions ADD FOREIGN KEY (user_id) REFERENCES users (id);
+ALTER SEQUENCE user_actions_id_seq OWNED BY user_actions.id;
+CREATE TABLE user_actions_default PARTITION OF user_actions DEFAULT;
+
+INSERT INTO user_actions SELECT * FROM user_actions_legacy;
+DROP TABLE user_actions_legacy;
+
+CREATE INDEX idx_user_action_user ON user_actions (user_id);
+CREATE INDEX idx_user_action_action ON user_actions (action);
+CREATE INDEX idx_user_action_created ON user_actions (created_at);
+CREATE INDEX idx_user_action_session ON user_actions (session_id);
+
+-- ========== utm_events ==========
+ALTER TABLE utm_events RENAME TO utm_events_legacy;
+UPDATE utm_events_legacy SET event_at = NOW() AT TIME ZONE 'utc' WHERE event_at IS NULL;
+
+CREATE TABLE utm_events (LIKE utm_events_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (event_at);
+ALTER TABLE utm_events ADD PRIMARY KEY (id, event_at);
+ALTER TABLE utm_events ADD FOREIGN KEY (campaign_id) REFERENCES utm_campaigns (id);
+ALTER TABLE utm_events ADD FOREIGN KEY (user_id) REFERENCES users (id);
+ALTER TABLE utm_events ADD FOREIGN KEY (click_id) REFERENCES utm_clicks (id);
+ALTER SEQUENCE utm_events_id_seq OWNED BY utm_events.id;
+CREATE TABLE utm_events_default PARTITION OF utm_events DEFAULT;
+
+INSERT INTO utm_events SELECT * FROM utm_events_legacy;
+DROP TABLE utm_events_legacy;
+
+CREATE INDEX idx_utm_event_campaign ON utm_events (campaign_id);
+CREATE INDEX idx_utm_event_user ON utm_events (user_id);
+CREATE INDEX idx_utm_event_type ON utm_events (event_type);
+CREATE INDEX idx_utm_event_date ON utm_events (event_at);
+CREATE INDEX idx_utm_event_click ON utm_events (click_id);
+CREATE INDEX idx_utm_event_session ON utm_events (session_id);
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, JSON, Float, Text, ForeignKey, Index, Enum, Numeric
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Date, Boolean, JSON, Float, Text, ForeignKey, Index, Enum, Numeric, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -75,7 +75,7 @@ class User(Base):
     })
     
     # Даты
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     last_active = Column(DateTime, default=datetime.utcnow)
     first_purchase_at = Column(DateTime, nullable=True)
     
@@ -85,14 +85,15 @@ class User(Base):
     tickets = relationship("SupportTicket", back_populates="user", cascade="all, delete-orphan")
     promo_usages = relationship("PromoCodeUsage", back_populates="user", cascade="all, delete-orphan")
     actions = relationship("UserAction", back_populates="user", cascade="all, delete-orphan")
+    stats = relationship("UserStats", back_populates="user", uselist=False, cascade="all, delete-orphan")
     
     # Самоссылка для рефералов
     referrals = relationship("User", backref="referrer", remote_side=[id])
     
     # Индексы для оптимизации
     __table_args__ = (
-        Index('idx_user_referrer', 'referrer_id'),
-        Index('idx_user_created', 'created_at'),
+        Index('idx_user_referrer_created', 'referrer_id', 'created_at'),
+        Index('idx_user_created_id', 'created_at', 'id'),
         Index('idx_user_active', 'last_active'),
         Index('idx_user_balance', 'balance'),
     )
@@ -129,12 +130,12 @@ class Generation(Base):
     queue_time = Column(Float, nullable=True)  # Время в очереди
     
     # Статус
-    status = Column(Enum(GenerationStatusEnum), default=GenerationStatusEnum.PENDING, index=True)
+    status = Column(Enum(GenerationStatusEnum), default=GenerationStatusEnum.PENDING)
     error_message = Column(Text, nullable=True)
     error_code = Column(String(50), nullable=True)
     
     # WaveSpeed API
-    task_id = Column(String(100), nullable=True, index=True)
+    task_id = Column(String(100), nullable=True)
     queue_position = Column(Integer, nullable=True)
     progress = Column(Integer, default=0)  # Прогресс генерации 0-100
     
@@ -143,7 +144,7 @@ class Generation(Base):
     feedback = Column(Text, nullable=True)
     
     # Даты
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     
@@ -152,8 +153,14 @@ class Generation(Base):
     
     # Индексы
     __table_args__ = (
-        Index('idx_generation_user', 'user_id'),
+        Index('idx_generation_user_created', 'user_id', 'created_at', 'id'),
+        Index('idx_generation_user_status', 'user_id', 'status'),
         Index('idx_generation_status', 'status'),
+        Index(
+            'idx_generation_pending', 'created_at',
+            postgresql_where=text("status IN ('PENDING', 'PROCESSING')"),
+            sqlite_where=text("status IN ('PENDING', 'PROCESSING')")
+        ),
         Index('idx_generation_created', 'created_at'),
         Index('idx_generation_task', 'task_id'),
     )
@@ -165,7 +172,7 @@ class Transaction(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     
     # Тип и сумма
-    type = Column(Enum(TransactionTypeEnum), nullable=False, index=True)
+    type = Column(Enum(TransactionTypeEnum), nullable=False)
     amount = Column(Integer)  # Количество кредитов (может быть отрицательным)
     balance_before = Column(Integer, nullable=True)  # Баланс до транзакции
     balance_after = Column(Integer)  # Баланс после транзакции
@@ -178,7 +185,7 @@ class Transaction(Base):
     
     # Telegram Stars платежи
     payment_id = Column(String(100), nullable=True)  # Telegram payment ID
-    telegram_charge_id = Column(String(200), nullable=True, index=True)  # Для возвратов
+    telegram_charge_id = Column(String(200), nullable=True)  # Для возвратов
     
     # YooKassa платежи
     yookassa_payment_id = Column(String(100), nullable=True, index=True)  # ID платежа в ЮКассе
@@ -194,10 +201,10 @@ class Transaction(Base):
     meta_data = Column(JSON, nullable=True)
     
     # Статус
-    status = Column(Enum(TransactionStatusEnum), default=TransactionStatusEnum.PENDING, index=True)
+    status = Column(Enum(TransactionStatusEnum), default=TransactionStatusEnum.PENDING)
     
     # Даты
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
     refunded_at = Column(DateTime, nullable=True)
     
@@ -208,13 +215,57 @@ class Transaction(Base):
     
     # Индексы
     __table_args__ = (
-        Index('idx_transaction_user', 'user_id'),
+        Index('idx_transaction_user_type_status', 'user_id', 'type', 'status'),
+        Index('idx_transaction_user_created', 'user_id', 'created_at', 'id'),
         Index('idx_transaction_type', 'type'),
         Index('idx_transaction_status', 'status'),
         Index('idx_transaction_created', 'created_at'),
         Index('idx_transaction_charge', 'telegram_charge_id'),
+        Index(
+            'idx_transaction_purchase_created', 'created_at',
+            postgresql_where=text("type = 'PURCHASE' AND status = 'COMPLETED'"),
+            sqlite_where=text("type = 'PURCHASE' AND status = 'COMPLETED'")
+        ),
     )
 
+class UserStats(Base):
+    """Материализованная статистика пользователя (одна строка на пользователя)
+
+    Счетчики обновляются в той же транзакции, что и генерация, оценка или
+    бонусная транзакция. Это накопительные значения: очистка старых
+    генераций их не уменьшает.
+    """
+    __tablename__ = 'user_stats'
+    
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    
+    # Генерации
+    total_generations = Column(Integer, default=0, nullable=False)
+    successful_generations = Column(Integer, default=0, nullable=False)
+    last_generation_at = Column(DateTime, nullable=True)
+    
+    # Оценки (среднее = rating_sum / rating_count)
+    rating_sum = Column(Integer, default=0, nullable=False)
+    rating_count = Column(Integer, default=0, nullable=False)
+    
+    # Сумма завершенных бонусных транзакций (бонусы, рефералы, подарки админа)
+    total_bonuses = Column(Integer, default=0, nullable=False)
+    
+    # Учет бонусных кредитов: генерация оплачена бонусами,
+    # пока credits_consumed + стоимость <= bonus_granted
+    bonus_granted = Column(Integer, default=0, nullable=False)  # Положительные бонусные начисления
+    credits_consumed = Column(Integer, default=0, nullable=False)  # Стоимость неотмененных генераций
+    
+    # Серии активности: дни с завершенными генерациями (по дате создания)
+    last_active_day = Column(Date, nullable=True)
+    current_streak = Column(Integer, default=0, nullable=False)  # Серия, заканчивающаяся в last_active_day
+    max_streak = Column(Integer, default=0, nullable=False)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Отношения
+    user = relationship("User", back_populates="stats")
+
 class PromoCode(Base):
     __tablename__ = 'promo_codes'
     
@@ -278,7 +329,7 @@ class SupportTicket(Base):
     category = Column(String(50))  # technical, payment, generation, suggestion, other
     
     # Статус
-    status = Column(Enum(TicketStatusEnum), default=TicketStatusEnum.OPEN, index=True)
+    status = Column(Enum(TicketStatusEnum), default=TicketStatusEnum.OPEN)
     priority = Column(String(20), default='normal')  # low, normal, high, urgent
     
     # Ответ поддержки
@@ -287,7 +338,7 @@ class SupportTicket(Base):
     admin_notes = Column(Text, nullable=True)  # Внутренние заметки
     
     # Даты
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     resolved_at = Column(DateTime, nullable=True)
     response_time = Column(Float, nullable=True)  # Время ответа в часах
@@ -358,13 +409,14 @@ class AdminLog(Base):
     )
 
 class UserAction(Base):
+    # В PostgreSQL - месячные партиции по created_at (миграция 006), первичный ключ (id, created_at)
     __tablename__ = 'user_actions'
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     
     # Информация о действии
-    action = Column(String(100), nullable=False, index=True)
+    action = Column(String(100), nullable=False)
     category = Column(String(50), nullable=True)  # navigation, generation, payment, etc
     details = Column(JSON, nullable=True)
     
@@ -373,7 +425,7 @@ class UserAction(Base):
     user_agent = Column(String(500), nullable=True)
     session_id = Column(String(100), nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     
     # Отношения
     user = relationship("User", back_populates="actions")
@@ -395,9 +447,9 @@ class UTMCampaign(Base):
     id = Column(Integer, primary_key=True)
     
     # UTM параметры
-    utm_source = Column(String(100), nullable=False, index=True)  # vk, telegram, youtube
-    utm_medium = Column(String(100), nullable=False, index=True)  # cpc, banner, post
-    utm_campaign = Column(String(200), nullable=False, index=True)  # summer_promo_2024
+    utm_source = Column(String(100), nullable=False)  # vk, telegram, youtube
+    utm_medium = Column(String(100), nullable=False)  # cpc, banner, post
+    utm_campaign = Column(String(200), nullable=False)  # summer_promo_2024
     utm_content = Column(String(200), nullable=True)  # button_top, banner_main
     utm_term = Column(String(200), nullable=True)  # ключевые слова (опционально)
     
@@ -412,9 +464,9 @@ class UTMCampaign(Base):
     
     # Администрирование
     created_by_admin_id = Column(BigInteger, nullable=False)  # ID админа, создавшего кампанию
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    is_active = Column(Boolean, default=True, index=True)
+    is_active = Column(Boolean, default=True)
     
     # Статистика (денормализация для быстроты)
     total_clicks = Column(Integer, default=0)
@@ -443,12 +495,12 @@ class UTMClick(Base):
     id = Column(Integer, primary_key=True)
     
     # Связи
-    campaign_id = Column(Integer, ForeignKey('utm_campaigns.id'), nullable=False, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)  # Может быть NULL для анонимов
+    campaign_id = Column(Integer, ForeignKey('utm_campaigns.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)  # Может быть NULL для анонимов
     
     # Данные клика
-    telegram_id = Column(BigInteger, nullable=True, index=True)  # ID пользователя в Telegram
-    clicked_at = Column(DateTime, default=datetime.utcnow, index=True)
+    telegram_id = Column(BigInteger, nullable=True)  # ID пользователя в Telegram
+    clicked_at = Column(DateTime, default=datetime.utcnow)
     
     # Техническая информация
     user_agent = Column(Text, nullable=True)
@@ -459,7 +511,7 @@ class UTMClick(Base):
     additional_params = Column(JSON, nullable=True)  # Любые дополнительные параметры
     
     # Флаги
-    is_first_visit = Column(Boolean, default=True, index=True)  # Первый ли это визит пользователя
+    is_first_visit = Column(Boolean, default=True)  # Первый ли это визит пользователя
     is_registered_user = Column(Boolean, default=False, index=True)  # Зарегистрированный ли пользователь
     
     # Связи
@@ -468,30 +520,34 @@ class UTMClick(Base):
     
     # Индексы
     __table_args__ = (
-        Index('idx_utm_click_campaign', 'campaign_id'),
-        Index('idx_utm_click_user', 'user_id'),
+        Index('idx_utm_click_campaign_user', 'campaign_id', 'user_id'),
+        Index('idx_utm_click_user_date', 'user_id', 'clicked_at'),
         Index('idx_utm_click_telegram', 'telegram_id'),
         Index('idx_utm_click_date', 'clicked_at'),
         Index('idx_utm_click_first', 'is_first_visit'),
     )
 
 class UTMEvent(Base):
-    """События пользователей, привязанные к UTM кампаниям"""
+    """
+    События пользователей, привязанные к UTM кампаниям
+    
+    В PostgreSQL - месячные партиции по event_at (миграция 006), первичный ключ (id, event_at)
+    """
     __tablename__ = 'utm_events'
     
     id = Column(Integer, primary_key=True)
     
     # Связи
-    campaign_id = Column(Integer, ForeignKey('utm_campaigns.id'), nullable=False, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
-    click_id = Column(Integer, ForeignKey('utm_clicks.id'), nullable=True, index=True)  # Связь с кликом
+    campaign_id = Column(Integer, ForeignKey('utm_campaigns.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    click_id = Column(Integer, ForeignKey('utm_clicks.id'), nullable=True)  # Связь с кликом
     
     # Данные события
-    event_type = Column(String(50), nullable=False, index=True)  # registration, purchase, generation, etc
+    event_type = Column(String(50), nullable=False)  # registration, purchase, generation, etc
     event_data = Column(JSON, nullable=True)  # Дополнительные данные события
     
     # Временные метки
-    event_at = Column(DateTime, default=datetime.utcnow, index=True)
+    event_at = Column(DateTime, default=datetime.utcnow)
     
     # Ценностные метрики
     revenue = Column(Float, nullable=True)  # Выручка от события (для покупок)
@@ -499,7 +555,7 @@ class UTMEvent(Base):
     credits_purchased = Column(Integer, nullable=True)  # Куплено кредитов
     
     # Метаданные
-    session_id = Column(String(100), nullable=True, index=True)  # ID сессии пользователя
+    session_id = Column(String(100), nullable=True)  # ID сессии пользователя
     time_from_click = Column(Integer, nullable=True)  # Время от клика до события (в секундах)
     
     # Связи
@@ -522,14 +578,14 @@ class PackagePrice(Base):
     __tablename__ = 'package_prices'
     
     id = Column(Integer, primary_key=True)
-    package_id = Column(String(50), nullable=False, index=True)  # pack_50, pack_100, etc.
+    package_id = Column(String(50), nullable=False)  # pack_50, pack_100, etc.
     
     # Цены
     stars_price = Column(Integer, nullable=True)  # Цена в Telegram Stars
     rub_price = Column(Numeric(10, 2), nullable=True)  # Цена в рублях (ЮКасса)
     
     # Метаданные
-    is_active = Column(Boolean, default=True, index=True)
+    is_active = Column(Boolean, default=True)
     created_by = Column(Integer, nullable=True)  # ID админа который создал
     updated_by = Column(Integer, nullable=True)  # ID админа который обновил
     
@@ -0,0 +1,170 @@
+"""
+Отложенная запись last_active пользователей
+
+Вместо UPDATE + COMMIT на каждое сообщение и callback копим отметки активности
+в памяти (только последнюю для каждого пользователя) и раз в несколько секунд
+сбрасываем их в БД одним массовым UPDATE. Если БД недоступна, буфер растет
+только до предела; отметки новых пользователей сверх него отбрасываются и
+учитываются в dropped_total.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional, Any
+
+from core.config import settings
+from services.database import db
+from services.live_counters import live_counters
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityRecorder:
+    """Буфер отметок активности с периодическим сбросом в БД"""
+
+    def __init__(
+        self,
+        flush_interval: float = 5.0,
+        max_buffer_size: int = 10000,
+        buffer_limit: int = 100000
+    ):
+        """
+        Args:
+            flush_interval: Интервал сброса в секундах
+            max_buffer_size: При достижении этого размера сброс запускается досрочно
+            buffer_limit: Предел буфера (пока сбросы не проходят), сверх него отметки отбрасываются
+        """
+        self.flush_interval = flush_interval
+        self.max_buffer_size = max_buffer_size
+        self.buffer_limit = max(buffer_limit, max_buffer_size)
+        self._buffer: Dict[int, datetime] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.touches_total = 0
+        self.dropped_total = 0
+        self.flushes_total = 0
+        self.rows_flushed_total = 0
+        self.flush_errors = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.max_buffer_depth = 0
+
+    def touch(self, telegram_id: int):
+        """Отметить активность пользователя (без обращения к БД)"""
+        self.touches_total += 1
+        if len(self._buffer) >= self.buffer_limit and telegram_id not in self._buffer:
+            self._drop(1)
+            return
+        self._buffer[telegram_id] = datetime.utcnow()
+
+        depth = len(self._buffer)
+        if depth > self.max_buffer_depth:
+            self.max_buffer_depth = depth
+        if depth >= self.max_buffer_size:
+            self._wakeup.set()
+
+    def _drop(self, count: int):
+        self.dropped_total += count
+        if self.dropped_total % 1000 < count:
+            logger.warning(f"Activity buffer is full, dropped {self.dropped_total} touches so far")
+
+    async def flush(self) -> int:
+        """Сбросить накопленные отметки в БД"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return 0
+
+            # Забираем буфер целиком, новые отметки пишутся уже в новый словарь
+            batch, self._buffer = self._buffer, {}
+            start_time = time.perf_counter()
+
+            try:
+                updated = await db.bulk_update_user_activity(batch)
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"Failed to flush user activity ({len(batch)} users): {e}")
+                # Возвращаем отметки в буфер, не затирая более свежие и не превышая предел
+                dropped = 0
+                for telegram_id, ts in batch.items():
+                    if telegram_id in self._buffer:
+                        continue
+                    if len(self._buffer) >= self.buffer_limit:
+                        dropped += 1
+                        continue
+                    self._buffer[telegram_id] = ts
+                if dropped:
+                    self._drop(dropped)
+                return 0
+
+            latency = time.perf_counter() - start_time
+            self.last_flush_latency = latency
+            self.total_flush_latency += latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.flushes_total += 1
+            self.rows_flushed_total += len(batch)
+
+            logger.debug(f"Flushed activity for {len(batch)} users in {latency * 1000:.1f}ms")
+
+            # Те же отметки идут в счетчик активных за день для дашборда
+            await live_counters.record_active_users(batch.keys())
+            return updated
+
+    async def _run(self):
+        """Фоновый цикл периодического сброса"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Запустить фоновый сброс"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Activity recorder started (flush every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Остановить фоновый сброс и записать остаток буфера"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+        logger.info("Activity recorder stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики буфера"""
+        return {
+            'buffer_depth': len(self._buffer),
+            'max_buffer_depth': self.max_buffer_depth,
+            'touches_total': self.touches_total,
+            'dropped_total': self.dropped_total,
+            'flushes_total': self.flushes_total,
+            'rows_flushed_total': self.rows_flushed_total,
+            'flush_errors': self.flush_errors,
+            'last_flush_latency_ms': round(self.last_flush_latency * 1000, 2),
+            'avg_flush_latency_ms': round(
+                self.total_flush_latency / self.flushes_total * 1000, 2
+            ) if self.flushes_total else 0.0,
+            'max_flush_latency_ms': round(self.max_flush_latency * 1000, 2)
+        }
+
+
+# Глобальный экземпляр
+activity_recorder = ActivityRecorder(
+    flush_interval=settings.ACTIVITY_FLUSH_INTERVAL,
+    max_buffer_size=settings.ACTIVITY_BUFFER_MAX_SIZE,
+    buffer_limit=settings.ACTIVITY_BUFFER_LIMIT
+)
@@ -5,9 +5,19 @@ from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
 from core.config import settings
 from services.database import db
+from services.cache_service import cache
 
 logger = logging.getLogger(__name__)
 
+# Кулдаун уведомления, общий для всех процессов бота: уведомление
+# отправляет тот, кто первым занял ключ
+NOTIFICATION_COOLDOWN_SCRIPT = """
+if redis.call('SET', KEYS[1], '1', 'EX', ARGV[1], 'NX') then
+    return 1
+end
+return 0
+"""
+
 class APIBalanceMonitor:
     """Сервис для мониторинга баланса API"""
     
@@ -16,7 +26,7 @@ class APIBalanceMonitor:
         self.api_url = "https://api.wavespeed.ai/api/v3/balance"
         self.low_balance_threshold = 10.0  # $10
         self.critical_balance_threshold = 0.0  # $0
-        self._last_notification = {}  # Кеш последних уведомлений
+        self._last_notification = {}  # Последние уведомления (если Redis недоступен)
         
     async def check_balance(self) -> Optional[float]:
         """Проверить баланс API"""
@@ -82,15 +92,11 @@ class APIBalanceMonitor:
         """Отправить уведомление админам (с защитой от спама)"""
         now = datetime.now()
         
-        # Проверяем, не отправляли ли мы уже уведомление недавно
-        last_notification = self._last_notification.get(status)
-        if last_notification:
-            # Для критичного статуса - уведомляем каждые 30 минут
-            # Для низкого баланса - каждые 2 часа
-            cooldown = timedelta(minutes=30) if status == 'critical' else timedelta(hours=2)
-            
-            if now - last_notification < cooldown:
-                return
+        # Для критичного статуса - уведомляем каждые 30 минут
+        # Для низкого баланса - каждые 2 часа
+        cooldown = timedelta(minutes=30) if status == 'critical' else timedelta(hours=2)
+        if not await self._acquire_notification_slot(status, cooldown, now):
+            return
         
         # Формируем подробное сообщение для админов
         admin_message = f"""
@@ -119,9 +125,24 @@ class APIBalanceMonitor:
                 logger.info(f"Balance notification sent to admin {admin_id}")
             except Exception as e:
                 logger.error(f"Failed to send balance notification to admin {admin_id}: {e}")
+    
+    async def _acquire_notification_slot(self, status: str, cooldown: timedelta, now: datetime) -> bool:
+        """Можно ли отправить уведомление (кулдаун общий для всех воркеров через Redis)"""
+        result = await cache.run_script(
+            NOTIFICATION_COOLDOWN_SCRIPT,
+            keys=[f"api_monitor:notified:{status}"],
+            args=[int(cooldown.total_seconds())],
+            timeout=1.0
+        )
+        if result is not None:
+            return bool(result)
         
-        # Обновляем время последнего уведомления
+        # Redis недоступен - кулдаун в пределах процесса
+        last_notification = self._last_notification.get(status)
+        if last_notification and now - last_notification < cooldown:
+            return False
         self._last_notification[status] = now
+        return True
     
     def is_service_available(self, balance: Optional[float]) -> bool:
         """Проверить, доступен ли сервис генерации"""
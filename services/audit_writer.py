@@ -0,0 +1,160 @@
+"""
+Буферизованная запись журналов аудита (user_actions, admin_logs)
+
+Обработчик только кладет строку в ограниченную очередь в памяти, а фоновая
+задача пишет накопленное в БД одним многострочным INSERT на пачку - когда
+набралась пачка или истек интервал. При переполнении очереди новые строки
+отбрасываются и учитываются в dropped_total; при остановке очередь дописывается.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Очередь строк аудита с пакетной записью в БД"""
+
+    def __init__(
+        self,
+        insert_rows: Callable[[Any, List[Dict[str, Any]]], Awaitable[int]],
+        flush_interval: float = 2.0,
+        batch_size: int = 500,
+        max_queue_size: int = 20000
+    ):
+        """
+        Args:
+            insert_rows: async (model, rows) - записать строки одной пачкой
+            flush_interval: Интервал сброса в секундах
+            batch_size: Строк в одном INSERT; при таком размере очереди сброс запускается досрочно
+            max_queue_size: Предел очереди, сверх него строки отбрасываются
+        """
+        self._insert_rows = insert_rows
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_queue_size = max_queue_size
+        self._queue: Deque[Tuple[Any, Dict[str, Any]]] = deque()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.written_total = 0
+        self.dropped_total = 0
+        self.rows_flushed_total = 0
+        self.flushes_total = 0
+        self.flush_errors = 0
+        self.last_flush_latency = 0.0
+        self.max_queue_depth = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def write(self, model, row: Dict[str, Any]) -> bool:
+        """
+        Поставить строку в очередь (без обращения к БД)
+
+        Returns:
+            False, если очередь переполнена и строка отброшена
+        """
+        if len(self._queue) >= self.max_queue_size:
+            self.dropped_total += 1
+            if self.dropped_total % 1000 == 1:
+                logger.warning(f"Audit queue is full, dropped {self.dropped_total} rows so far")
+            return False
+
+        self._queue.append((model, row))
+        self.written_total += 1
+
+        depth = len(self._queue)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        if depth >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _requeue(self, rows: List[Tuple[Any, Dict[str, Any]]]):
+        """Вернуть незаписанную пачку в начало очереди, не превышая предел"""
+        room = max(self.max_queue_size - len(self._queue), 0)
+        if len(rows) > room:
+            self.dropped_total += len(rows) - room
+            rows = rows[:room]
+        self._queue.extendleft(reversed(rows))
+
+    async def flush(self) -> int:
+        """Записать всю очередь пачками по batch_size"""
+        async with self._flush_lock:
+            flushed = 0
+            while self._queue:
+                count = min(self.batch_size, len(self._queue))
+                batch = [self._queue.popleft() for _ in range(count)]
+
+                by_model: Dict[Any, List[Dict[str, Any]]] = {}
+                for model, row in batch:
+                    by_model.setdefault(model, []).append(row)
+
+                start_time = time.perf_counter()
+                for model, rows in by_model.items():
+                    try:
+                        await self._insert_rows(model, rows)
+                    except Exception as e:
+                        self.flush_errors += 1
+                        logger.error(f"Failed to flush {len(rows)} {model.__tablename__} rows: {e}")
+                        # В batch остались только незаписанные строки - повторим их при следующем сбросе
+                        self._requeue(batch)
+                        return flushed
+                    flushed += len(rows)
+                    self.rows_flushed_total += len(rows)
+                    batch = [(m, r) for m, r in batch if m is not model]
+
+                self.last_flush_latency = time.perf_counter() - start_time
+                self.flushes_total += 1
+
+            return flushed
+
+    async def _run(self):
+        """Фоновый цикл периодического сброса"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Запустить фоновый сброс"""
+        if not self.is_running:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Audit writer started (flush every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Остановить фоновый сброс и дописать очередь"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self.flush()
+        logger.info("Audit writer stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики очереди"""
+        return {
+            'queue_depth': len(self._queue),
+            'max_queue_depth': self.max_queue_depth,
+            'written_total': self.written_total,
+            'dropped_total': self.dropped_total,
+            'rows_flushed_total': self.rows_flushed_total,
+            'flushes_total': self.flushes_total,
+            'flush_errors': self.flush_errors,
+            'last_flush_latency_ms': round(self.last_flush_latency * 1000, 2)
+        }
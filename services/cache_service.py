@@ -3,6 +3,7 @@ import logging
 from typing import Any, Optional, Union, Callable, Dict, List, Set
 from datetime import timedelta
 import asyncio
+import time
 import redis.asyncio as redis
 from functools import wraps
 import inspect
@@ -20,12 +21,24 @@ class CacheService:
         self.prefix = prefix or getattr(settings, 'CACHE_PREFIX', 'magic_frame')
         self._connection_retries = 3
         self._connection_timeout = 5
+        self._reconnect_cooldown = 30  # Не пытаемся переподключаться чаще (секунды)
+        self._retry_after = 0.0
+        self._scripts: Dict[str, Any] = {}  # Текст Lua-скрипта -> зарегистрированный скрипт
+    
+    @property
+    def is_available(self) -> bool:
+        """Можно ли сейчас обращаться к Redis (нет активного cooldown после сбоя)"""
+        return self._redis is not None or time.monotonic() >= self._retry_after
     
     async def connect(self):
         """Подключение к Redis с повторными попытками"""
         if self._redis:
             return
         
+        if time.monotonic() < self._retry_after:
+            # Недавно не смогли подключиться - не блокируем вызывающего повторными попытками
+            raise ConnectionError("Redis is unavailable (reconnect cooldown)")
+        
         for attempt in range(self._connection_retries):
             try:
                 self._redis = await redis.from_url(
@@ -45,8 +58,10 @@ class CacheService:
                 
             except Exception as e:
                 logger.error(f"Redis connection attempt {attempt + 1} failed: {e}")
+                self._redis = None
                 if attempt == self._connection_retries - 1:
                     logger.critical("Failed to connect to Redis after all retries")
+                    self._retry_after = time.monotonic() + self._reconnect_cooldown
                     raise
                 await asyncio.sleep(1)
     
@@ -57,6 +72,15 @@ class CacheService:
             self._redis = None
             logger.info("Disconnected from Redis")
     
+    async def _drop_client(self):
+        """Закрыть клиент после сбоя (соединения пула освобождаются) и забыть его"""
+        client, self._redis = self._redis, None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.debug(f"Error closing Redis client: {e}")
+    
     async def __aenter__(self):
         await self.connect()
         return self
@@ -75,9 +99,9 @@ class CacheService:
         else:
             try:
                 await self._redis.ping()
-            except (ConnectionError, TimeoutError):
+            except (ConnectionError, TimeoutError, redis.ConnectionError, redis.TimeoutError):
                 logger.warning("Redis connection lost, reconnecting...")
-                self._redis = None
+                await self._drop_client()
                 await self.connect()
     
     async def get(self, key: str, default: Any = None) -> Optional[Any]:
@@ -484,6 +508,61 @@ class CacheService:
             logger.error(f"Cache clear_all error: {e}")
             return False
     
+    async def run_script(
+        self,
+        script: str,
+        keys: List[str],
+        args: List[Any],
+        timeout: Optional[float] = None
+    ) -> Optional[Any]:
+        """
+        Выполнить Lua-скрипт атомарно (EVALSHA с загрузкой скрипта при необходимости)
+        
+        Args:
+            script: Текст скрипта
+            keys: Ключи без префикса
+            args: Аргументы скрипта
+            timeout: Максимальное время ожидания ответа в секундах
+            
+        Returns:
+            Результат скрипта или None, если Redis недоступен - вызывающий
+            может переключиться на локальную реализацию
+        """
+        if not self.is_available:
+            return None
+        
+        try:
+            if not self._redis:
+                await self.connect()
+            
+            registered = self._scripts.get(script)
+            if registered is None:
+                registered = self._redis.register_script(script)
+                self._scripts[script] = registered
+            
+            call = registered(
+                keys=[self._make_key(key) for key in keys],
+                args=args,
+                client=self._redis
+            )
+            if timeout:
+                return await asyncio.wait_for(call, timeout=timeout)
+            return await call
+            
+        except asyncio.TimeoutError:
+            # Медленный ответ - fallback только для этого вызова, клиент остается
+            logger.warning(f"Cache script timed out after {timeout}s")
+            return None
+        except (ConnectionError, redis.ConnectionError, redis.TimeoutError) as e:
+            # Не ждем Redis на каждом вызове, пока он недоступен
+            logger.error(f"Cache script error, Redis marked unavailable: {e}")
+            await self._drop_client()
+            self._retry_after = time.monotonic() + self._reconnect_cooldown
+            return None
+        except Exception as e:
+            logger.error(f"Cache script error: {e}")
+            return None
+    
     async def get_info(self) -> Dict[str, Any]:
         """Получить информацию о Redis"""
         try:
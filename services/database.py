@@ -1,20 +1,85 @@
+import time
 import asyncio
-from typing import Optional, List, Dict, Any, Union
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, Union, Tuple
+from datetime import datetime, date, timedelta
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy import select, update, delete, func, and_, or_, String, cast
+from sqlalchemy import select, insert, update, delete, func, and_, or_, case, values, column, bindparam, BigInteger, DateTime, tuple_, text
 from sqlalchemy.orm import selectinload
 import logging
 
 from core.config import settings
 from models.models import (
     Base, User, Generation, Transaction, PromoCode, PromoCodeUsage, 
-    SupportTicket, Statistics, AdminLog, UserAction,
+    SupportTicket, Statistics, AdminLog, UserAction, UserStats,
     GenerationStatusEnum, TransactionTypeEnum, TransactionStatusEnum
 )
+from services.user_context import (
+    UserCache, get_current_user, forget_current_user
+)
+from services.cache_service import cache
+from services.audit_writer import AuditWriter
+from services.query_stats import query_stats, instrument_methods
+from services.unit_of_work import UnitOfWork, UnitOfWorkRolledBack, JoinedSession, current_uow
+from services.live_counters import live_counters
 
 logger = logging.getLogger(__name__)
 
+# Типы транзакций, которые считаются бонусными кредитами
+BONUS_TRANSACTION_TYPES = (
+    TransactionTypeEnum.BONUS,
+    TransactionTypeEnum.REFERRAL,
+    TransactionTypeEnum.ADMIN_GIFT
+)
+
+# Статусы генераций, занимающих кредиты (неудачные и отмененные их освобождают)
+CREDIT_CONSUMING_STATUSES = (
+    GenerationStatusEnum.PENDING,
+    GenerationStatusEnum.PROCESSING,
+    GenerationStatusEnum.COMPLETED
+)
+
+# Статусы генераций, которые дашборд показывает как ожидающие
+PENDING_STATUSES = (
+    GenerationStatusEnum.PENDING,
+    GenerationStatusEnum.PROCESSING
+)
+
+# Начало отсчета для курсоров страниц (created_at хранится в UTC без зоны)
+CURSOR_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(item) -> str:
+    """
+    Непрозрачный курсор страницы по (created_at, id) строки
+    
+    Короткий, чтобы помещаться в callback_data (до 64 байт) вместе с префиксом.
+    """
+    micros = (item.created_at - CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{micros:x}.{item.id:x}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разобрать курсор страницы; ValueError, если он поврежден"""
+    micros, _, item_id = cursor.partition('.')
+    return CURSOR_EPOCH + timedelta(microseconds=int(micros, 16)), int(item_id, 16)
+
+
+# Ключ кеша сводки по рефералам (сбрасывается при новом или ставшем активным реферале)
+REFERRAL_SUMMARY_CACHE_KEY = "referral_summary:{referrer_id}"
+
+# Недоступную реплику пробуем снова не раньше чем через (секунды)
+REPLICA_RETRY_AFTER = 30
+
+# Отставание реплики в секундах; 0, если WAL применен полностью (или это не реплика)
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
 class DatabaseService:
     def __init__(self):
         self.engine = create_async_engine(
@@ -30,6 +95,191 @@ class DatabaseService:
             class_=AsyncSession,
             expire_on_commit=False
         )
+        self.user_cache = UserCache(ttl=settings.USER_CONTEXT_CACHE_TTL)
+        if settings.QUERY_STATS_ENABLED:
+            query_stats.install(self.engine)
+        # Журналы аудита пишутся пачками; фоновый сброс запускает бот (audit.start())
+        self.audit = AuditWriter(
+            self.insert_rows,
+            flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+            batch_size=settings.AUDIT_BATCH_SIZE,
+            max_queue_size=settings.AUDIT_QUEUE_MAX_SIZE
+        )
+        
+        # Реплика только для чтения: аналитика, выгрузки и статистика (read_session)
+        self.replica_engine = None
+        self.replica_session = None
+        if settings.DB_REPLICA_URL:
+            self.replica_engine = create_async_engine(
+                settings.DB_REPLICA_URL,
+                echo=settings.DEBUG,
+                pool_size=10,
+                max_overflow=10,
+                pool_pre_ping=True,
+                pool_recycle=3600
+            )
+            self.replica_session = async_sessionmaker(
+                self.replica_engine,
+                class_=AsyncSession,
+                expire_on_commit=False
+            )
+            if settings.QUERY_STATS_ENABLED:
+                query_stats.install(self.replica_engine)
+        self._replica_lag: Optional[float] = None
+        self._replica_lag_checked = 0.0
+        self._replica_down_until = 0.0
+        self.read_routes: Dict[str, Dict[str, int]] = {}
+    
+    def invalidate_user_cache(self, telegram_id: Optional[int] = None, user_id: Optional[int] = None):
+        """Сбросить кешированного пользователя после изменения в БД"""
+        self.user_cache.invalidate(telegram_id=telegram_id, user_id=user_id)
+        forget_current_user(telegram_id=telegram_id, user_id=user_id)
+        
+        uow = current_uow.get()
+        if uow is not None and uow.joins(self):
+            # Другие запросы могли закешировать строку до фиксации - сбрасываем еще раз после нее
+            uow.after_commit.append(
+                lambda: self.user_cache.invalidate(telegram_id=telegram_id, user_id=user_id)
+            )
+    
+    def _cache_user(self, user: Optional[User]):
+        """
+        Закешировать прочитанного пользователя. Внутри единицы работы - только
+        после фиксации: при откате объект сессии истекает и отсоединяется
+        """
+        uow = current_uow.get()
+        if uow is not None and uow.joins(self):
+            uow.after_commit.append(lambda: self.user_cache.set(user))
+        else:
+            self.user_cache.set(user)
+    
+    # ========== Единица работы ==========
+    
+    def session(self) -> Union[AsyncSession, JoinedSession]:
+        """Сессия для метода: общая сессия текущей единицы работы (uow) или новая"""
+        uow = current_uow.get()
+        if uow is not None and uow.joins(self):
+            return JoinedSession(uow)
+        return self.async_session()
+    
+    @asynccontextmanager
+    async def uow(self):
+        """
+        Единица работы: методы, вызванные внутри блока, используют одну
+        сессию и одну транзакцию, которая фиксируется при выходе из блока
+        (см. services/unit_of_work.py). Вложенный uow() присоединяется к внешнему.
+        """
+        current = current_uow.get()
+        if current is not None and current.joins(self):
+            yield current
+            return
+        
+        async with self.async_session() as session:
+            uow = UnitOfWork(self, session)
+            token = current_uow.set(uow)
+            try:
+                yield uow
+                if uow.rolled_back:
+                    raise UnitOfWorkRolledBack("Unit of work was rolled back by a nested call")
+                await session.commit()
+            except BaseException:
+                await session.rollback()
+                raise
+            finally:
+                uow.closed = True
+                current_uow.reset(token)
+        
+        await uow.run_after_commit()
+    
+    async def _after_commit(self, action):
+        """Выполнить действие после фиксации: сразу или при фиксации текущей единицы работы"""
+        uow = current_uow.get()
+        if uow is not None and uow.joins(self):
+            uow.after_commit.append(action)
+        else:
+            await action()
+    
+    # ========== Чтение с реплики ==========
+    
+    @asynccontextmanager
+    async def read_session(self, route: str, max_lag: Optional[float] = None):
+        """
+        Сессия для тяжелых запросов только на чтение
+        
+        Открывается на реплике, если она задана, доступна и отстает не больше
+        max_lag секунд (по умолчанию DB_REPLICA_MAX_LAG), иначе на основной БД.
+        Данные могут отставать - не используйте для чтения перед записью.
+        
+        Args:
+            route: Имя маршрута для метрик (utm_analytics, referrals, ...)
+        """
+        session = await self._open_replica_session(route, max_lag)
+        if session is None:
+            session = self.async_session()
+        async with session:
+            yield session
+    
+    async def _open_replica_session(self, route: str, max_lag: Optional[float]) -> Optional[AsyncSession]:
+        """Сессия на реплике или None, если читать нужно с основной БД"""
+        if self.replica_session is None:
+            self._count_read_route(route, 'primary')
+            return None
+        if time.monotonic() < self._replica_down_until:
+            self._count_read_route(route, 'unavailable')
+            return None
+        
+        max_lag = settings.DB_REPLICA_MAX_LAG if max_lag is None else max_lag
+        session = None
+        try:
+            if await self._get_replica_lag() > max_lag:
+                self._count_read_route(route, 'lagging')
+                return None
+            session = self.replica_session()
+            # Соединение берем сразу, чтобы ошибка подключения ушла в fallback, а не в запрос
+            await session.connection()
+        except Exception as e:
+            if session is not None:
+                await session.close()
+            self._replica_down_until = time.monotonic() + REPLICA_RETRY_AFTER
+            self._replica_lag_checked = 0.0
+            logger.warning(f"Replica unavailable, reading {route} from primary: {e}")
+            self._count_read_route(route, 'unavailable')
+            return None
+        
+        self._count_read_route(route, 'replica')
+        return session
+    
+    async def _get_replica_lag(self) -> float:
+        """Отставание реплики в секундах (проверяется не чаще DB_REPLICA_LAG_CHECK_INTERVAL)"""
+        now = time.monotonic()
+        if self._replica_lag is not None and now - self._replica_lag_checked < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+            return self._replica_lag
+        
+        if self.replica_engine.dialect.name != 'postgresql':
+            lag = 0.0
+        else:
+            async with self.replica_engine.connect() as conn:
+                lag = float((await conn.execute(text(REPLICA_LAG_SQL))).scalar() or 0)
+        self._replica_lag, self._replica_lag_checked = lag, now
+        return lag
+    
+    def _count_read_route(self, route: str, target: str):
+        counters = self.read_routes.setdefault(
+            route, {'replica': 0, 'primary': 0, 'lagging': 0, 'unavailable': 0}
+        )
+        counters[target] += 1
+    
+    def get_read_routing_stats(self) -> Dict[str, Any]:
+        """
+        Метрики маршрутизации чтения по маршрутам: replica - прочитано с реплики,
+        primary - реплика не задана, lagging/unavailable - fallback на основную БД
+        """
+        return {
+            'replica_configured': self.replica_session is not None,
+            'replica_lag': self._replica_lag,
+            'replica_down': time.monotonic() < self._replica_down_until,
+            'routes': self.read_routes
+        }
     
     async def create_tables(self):
         """Создание всех таблиц"""
@@ -41,24 +291,61 @@ class DatabaseService:
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.drop_all)
     
+    @staticmethod
+    def _paginate(query, model, limit: int, offset: int = 0, after: Optional[str] = None, before: Optional[str] = None):
+        """
+        Страница в порядке (created_at, id) по убыванию
+        
+        after - курсор последней строки предыдущей страницы (следующая страница),
+        before - курсор первой строки (предыдущая страница, выбирается в обратном
+        порядке - разверните результат). Курсор сравнивается с ключом строки,
+        поэтому стоимость не растет с глубиной, в отличие от OFFSET.
+        """
+        key = tuple_(model.created_at, model.id)
+        if after:
+            query = query.where(key < tuple_(*decode_cursor(after)))
+        elif before:
+            query = query.where(key > tuple_(*decode_cursor(before)))
+            return query.order_by(model.created_at.asc(), model.id.asc()).limit(limit)
+        elif offset:
+            query = query.offset(offset)
+        return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+    
     # ========== User методы ==========
     
-    async def get_user(self, telegram_id: int) -> Optional[User]:
+    async def get_user(self, telegram_id: int, use_cache: bool = True) -> Optional[User]:
         """Получить пользователя по telegram_id"""
-        async with self.async_session() as session:
+        if use_cache:
+            # Сначала пользователь текущего апдейта, затем in-process кеш
+            user = get_current_user(telegram_id=telegram_id) or self.user_cache.get(telegram_id)
+            if user is not None:
+                return user
+        
+        async with self.session() as session:
             result = await session.execute(
                 select(User).where(User.telegram_id == telegram_id)
             )
-            return result.scalar_one_or_none()
+            user = result.scalar_one_or_none()
+        
+        self._cache_user(user)
+        return user
     
-    async def get_user_by_id(self, user_id: int) -> Optional[User]:
+    async def get_user_by_id(self, user_id: int, use_cache: bool = True) -> Optional[User]:
         """Получить пользователя по внутреннему ID"""
-        async with self.async_session() as session:
-            return await session.get(User, user_id)
+        if use_cache:
+            user = get_current_user(user_id=user_id) or self.user_cache.get_by_id(user_id)
+            if user is not None:
+                return user
+        
+        async with self.session() as session:
+            user = await session.get(User, user_id)
+        
+        self._cache_user(user)
+        return user
     
     async def get_user_by_username(self, username: str) -> Optional[User]:
         """Получить пользователя по username"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 select(User).where(User.username == username)
             )
@@ -74,7 +361,7 @@ class DatabaseService:
         referrer_telegram_id: Optional[int] = None
     ) -> User:
         """Создать нового пользователя"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             # Проверяем, существует ли уже пользователь
             existing = await session.execute(
                 select(User).where(User.telegram_id == telegram_id)
@@ -110,7 +397,11 @@ class DatabaseService:
             if referrer:
                 await self._process_referral_bonus(session, referrer, user)
                 await session.commit()
+                self.invalidate_user_cache(user_id=referrer.id)
+                await self._after_commit(lambda: self._invalidate_referral_summary(referrer.id))
             
+            self.invalidate_user_cache(telegram_id=telegram_id)
+            await self._after_commit(live_counters.record_user_created)
             return user
     
     async def _process_referral_bonus(self, session: AsyncSession, referrer: User, new_user: User):
@@ -133,6 +424,11 @@ class DatabaseService:
             meta_data={"referral_id": new_user.id}
         )
         session.add(ref_transaction)
+        await self._bump_user_stats(
+            session, referrer.id,
+            total_bonuses=settings.REFERRAL_BONUS_CREDITS,
+            bonus_granted=max(settings.REFERRAL_BONUS_CREDITS, 0)
+        )
     
     async def update_user_balance(self, user_id: int, amount: int, description: Optional[str] = None) -> bool:
         """Обновить баланс пользователя (по внутреннему ID)"""
@@ -141,7 +437,7 @@ class DatabaseService:
             logger.error(f"Attempt to update balance with too large amount: {amount}")
             return False
             
-        async with self.async_session() as session:
+        async with self.session() as session:
             user = await session.get(User, user_id)
             if not user:
                 return False
@@ -173,13 +469,16 @@ class DatabaseService:
                 completed_at=datetime.utcnow()
             )
             session.add(transaction)
+            if amount > 0:
+                await self._bump_user_stats(session, user_id, total_bonuses=amount, bonus_granted=amount)
             
             await session.commit()
+            self.invalidate_user_cache(user_id=user_id)
             return True
     
     async def get_user_balance(self, telegram_id: int) -> int:
         """Получить баланс пользователя"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 select(User.balance).where(User.telegram_id == telegram_id)
             )
@@ -188,7 +487,7 @@ class DatabaseService:
     
     async def update_user_activity(self, telegram_id: int):
         """Обновить время последней активности"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             await session.execute(
                 update(User)
                 .where(User.telegram_id == telegram_id)
@@ -196,9 +495,59 @@ class DatabaseService:
             )
             await session.commit()
     
+    async def bulk_update_user_activity(self, touches: Dict[int, datetime], chunk_size: int = 5000) -> int:
+        """
+        Массово обновить время последней активности
+        
+        Args:
+            touches: telegram_id -> время последней активности
+            chunk_size: Количество строк в одном UPDATE
+            
+        Returns:
+            Количество обновленных строк
+        """
+        if not touches:
+            return 0
+        
+        items = list(touches.items())
+        updated = 0
+        
+        async with self.session() as session:
+            for i in range(0, len(items), chunk_size):
+                chunk = items[i:i + chunk_size]
+                
+                if self.engine.dialect.name == 'postgresql':
+                    # UPDATE users SET ... FROM (VALUES ...) - один запрос на пачку
+                    activity = values(
+                        column('telegram_id', BigInteger),
+                        column('last_active', DateTime),
+                        name='activity'
+                    ).data(chunk)
+                    result = await session.execute(
+                        update(User)
+                        .where(User.telegram_id == activity.c.telegram_id)
+                        .values(last_active=activity.c.last_active)
+                        .execution_options(synchronize_session=False)
+                    )
+                    updated += result.rowcount or 0
+                else:
+                    # Fallback для SQLite: executemany одним вызовом
+                    table = User.__table__
+                    await session.execute(
+                        update(table)
+                        .where(table.c.telegram_id == bindparam('b_telegram_id'))
+                        .values(last_active=bindparam('b_last_active')),
+                        [{'b_telegram_id': tid, 'b_last_active': ts} for tid, ts in chunk]
+                    )
+                    updated += len(chunk)
+            
+            await session.commit()
+        
+        return updated
+    
     async def update_user(self, telegram_id: int, **kwargs):
         """Обновить данные пользователя"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             # Фильтруем только существующие поля
             allowed_fields = {
                 'username', 'first_name', 'last_name', 'language_code',
@@ -213,21 +562,23 @@ class DatabaseService:
                     .values(**filtered_kwargs)
                 )
                 await session.commit()
+                self.invalidate_user_cache(telegram_id=telegram_id)
     
     async def update_user_settings(self, user_id: int, settings: Dict[str, Any]) -> bool:
         """Обновить настройки пользователя"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             await session.execute(
                 update(User)
                 .where(User.id == user_id)
                 .values(settings=settings)
             )
             await session.commit()
+            self.invalidate_user_cache(user_id=user_id)
             return True
     
     async def get_user_generations_count(self, user_id: int) -> int:
         """Получить количество генераций пользователя"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 select(func.count(Generation.id))
                 .where(Generation.user_id == user_id)
@@ -236,7 +587,7 @@ class DatabaseService:
     
     async def get_user_total_spent(self, user_id: int) -> int:
         """Получить общую сумму потраченных кредитов пользователя"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 select(func.sum(Transaction.amount))
                 .where(
@@ -251,145 +602,277 @@ class DatabaseService:
             return abs(total_spent)  # Возвращаем положительное число
     
     async def get_user_statistics(self, telegram_id: int) -> Dict[str, Any]:
-        """Получить статистику пользователя"""
+        """
+        Получить статистику пользователя
+        
+        Читает одну строку user_stats. Если строки еще нет, она строится
+        из исходных таблиц (_ensure_user_stats).
+        """
         user = await self.get_user(telegram_id)
         if not user:
             return {}
         
-        async with self.async_session() as session:
-            # Подсчет генераций
-            generations_count = await session.execute(
-                select(func.count(Generation.id))
-                .where(Generation.user_id == user.id)
+        async with self.session() as session:
+            stats = await session.get(UserStats, user.id)
+            if stats is None:
+                stats = await self._ensure_user_stats(session, user.id)
+                await session.commit()
+        
+        # Серия продолжается, если последняя активность была сегодня или вчера
+        yesterday = datetime.utcnow().date() - timedelta(days=1)
+        is_streak_alive = stats.last_active_day is not None and stats.last_active_day >= yesterday
+        
+        return {
+            "user_id": user.telegram_id,
+            "registration_date": user.created_at,
+            "language": user.language_code,
+            "balance": user.balance,
+            "total_bought": user.total_bought,
+            "total_spent": user.total_spent,
+            "total_bonuses": stats.total_bonuses,
+            "total_generations": stats.total_generations,
+            "successful_generations": stats.successful_generations,
+            "average_rating": round(stats.rating_sum / stats.rating_count, 2) if stats.rating_count else 0,
+            "referral_count": user.referral_count,
+            "referral_earnings": user.referral_earnings,
+            "last_generation": stats.last_generation_at,
+            "is_premium": user.is_premium,
+            "current_streak": stats.current_streak if is_streak_alive else 0,
+            "max_streak": stats.max_streak
+        }
+    
+    # ========== Материализованная статистика (user_stats) ==========
+    
+    async def _aggregate_user_stats(self, session: AsyncSession, user_id: int) -> Dict[str, Any]:
+        """Посчитать статистику пользователя по исходным таблицам"""
+        generations = await session.execute(
+            select(
+                func.count(Generation.id),
+                func.count(Generation.id).filter(Generation.status == GenerationStatusEnum.COMPLETED),
+                func.coalesce(func.sum(Generation.rating), 0),
+                func.count(Generation.rating),
+                func.max(Generation.created_at),
+                func.coalesce(func.sum(Generation.cost).filter(Generation.status.in_(CREDIT_CONSUMING_STATUSES)), 0)
             )
-            total_generations = generations_count.scalar() or 0
-            
-            successful_generations = await session.execute(
-                select(func.count(Generation.id))
-                .where(
-                    and_(
-                        Generation.user_id == user.id,
-                        Generation.status == GenerationStatusEnum.COMPLETED
-                    )
-                )
+            .where(Generation.user_id == user_id)
+        )
+        total, successful, rating_sum, rating_count, last_generation_at, credits_consumed = generations.one()
+        
+        bonuses = await session.execute(
+            select(
+                func.coalesce(func.sum(Transaction.amount), 0),
+                func.coalesce(func.sum(Transaction.amount).filter(Transaction.amount > 0), 0)
             )
-            
-            # Средняя оценка
-            avg_rating = await session.execute(
-                select(func.avg(Generation.rating))
-                .where(
-                    and_(
-                        Generation.user_id == user.id,
-                        Generation.rating.isnot(None)
-                    )
+            .where(
+                and_(
+                    Transaction.user_id == user_id,
+                    Transaction.type.in_(BONUS_TRANSACTION_TYPES),
+                    Transaction.status == TransactionStatusEnum.COMPLETED
                 )
             )
-            
-            # Последняя генерация
-            last_gen = await session.execute(
-                select(Generation.created_at)
-                .where(Generation.user_id == user.id)
-                .order_by(Generation.created_at.desc())
-                .limit(1)
-            )
-            last_generation = last_gen.scalar_one_or_none()
-            
-            # Подсчет бонусов
-            total_bonuses = await session.execute(
-                select(func.sum(Transaction.amount))
-                .where(
-                    and_(
-                        Transaction.user_id == user.id,
-                        Transaction.type.in_([
-                            TransactionTypeEnum.BONUS,
-                            TransactionTypeEnum.REFERRAL,
-                            TransactionTypeEnum.ADMIN_GIFT
-                        ]),
-                        Transaction.status == TransactionStatusEnum.COMPLETED
-                    )
+        )
+        total_bonuses, bonus_granted = bonuses.one()
+        
+        # Дни с завершенными генерациями - полный проход по истории
+        active_days = await session.execute(
+            select(func.date(Generation.created_at))
+            .where(
+                and_(
+                    Generation.user_id == user_id,
+                    Generation.status == GenerationStatusEnum.COMPLETED
                 )
             )
-            
-            # Подсчет streak'ов (ежедневная активность)
-            current_streak, max_streak = await self._calculate_user_streaks(session, user.id)
-            
-            return {
-                "user_id": user.telegram_id,
-                "registration_date": user.created_at,
-                "language": user.language_code,
-                "balance": user.balance,
-                "total_bought": user.total_bought,
-                "total_spent": user.total_spent,
-                "total_bonuses": total_bonuses.scalar() or 0,
-                "total_generations": total_generations,
-                "successful_generations": successful_generations.scalar() or 0,
-                "average_rating": round(avg_rating.scalar() or 0, 2),
-                "referral_count": user.referral_count,
-                "referral_earnings": user.referral_earnings,
-                "last_generation": last_generation,
-                "is_premium": user.is_premium,
-                "current_streak": current_streak,
-                "max_streak": max_streak
-            }
+            .group_by(func.date(Generation.created_at))
+        )
+        last_active_day, current_streak, max_streak = self._streaks_from_days(active_days.scalars().all())
+        
+        return {
+            "total_generations": total,
+            "successful_generations": successful,
+            "rating_sum": int(rating_sum),
+            "rating_count": rating_count,
+            "last_generation_at": last_generation_at,
+            "total_bonuses": int(total_bonuses),
+            "bonus_granted": int(bonus_granted),
+            "credits_consumed": int(credits_consumed),
+            "last_active_day": last_active_day,
+            "current_streak": current_streak,
+            "max_streak": max_streak
+        }
     
-    async def _calculate_user_streaks(self, session: AsyncSession, user_id: int) -> tuple[int, int]:
-        """Рассчитать текущую и максимальную полосу активности пользователя"""
-        try:
-            # Получаем даты всех генераций пользователя, сгруппированные по дням
-            result = await session.execute(
-                select(func.date(Generation.created_at).label('generation_date'))
-                .where(
-                    and_(
-                        Generation.user_id == user_id,
-                        Generation.status == GenerationStatusEnum.COMPLETED
-                    )
-                )
-                .group_by(func.date(Generation.created_at))
-                .order_by(func.date(Generation.created_at).desc())
+    @staticmethod
+    def _streaks_from_days(days: List[Any]) -> tuple:
+        """
+        Серии активности по списку дней
+        
+        Returns:
+            (последний активный день, длина серии, заканчивающейся в нем, максимальная серия)
+        """
+        # SQLite возвращает date() строкой
+        days = sorted(
+            day if isinstance(day, date) else date.fromisoformat(str(day))
+            for day in days
+        )
+        if not days:
+            return None, 0, 0
+        
+        run = max_streak = 0
+        previous = None
+        for day in days:
+            run = run + 1 if previous is not None and day == previous + timedelta(days=1) else 1
+            max_streak = max(max_streak, run)
+            previous = day
+        
+        return days[-1], run, max_streak
+    
+    async def rebuild_user_stats(self, user_id: int, session: Optional[AsyncSession] = None) -> UserStats:
+        """
+        Пересчитать строку user_stats из исходных таблиц
+        
+        Используется для исправления расхождений (см. check_user_stats).
+        С переданной сессией строка только записывается в ее транзакцию,
+        фиксирует вызывающий. Учтите, что генерации старше срока хранения
+        уже удалены и в пересчет не попадут.
+        """
+        if session is None:
+            async with self.session() as session:
+                stats = await self.rebuild_user_stats(user_id, session=session)
+                await session.commit()
+                return stats
+        
+        return await self._write_user_stats(session, user_id, overwrite=True)
+    
+    async def _ensure_user_stats(self, session: AsyncSession, user_id: int, lock: bool = False) -> Optional[UserStats]:
+        """
+        Строка user_stats пользователя; если ее нет, строится из исходных таблиц
+        
+        Запись идет в транзакцию вызывающего (без фиксации). Строку, которую
+        одновременно создал другой запрос, INSERT не трогает - читаем ее.
+        """
+        stats = await session.get(UserStats, user_id, with_for_update=lock, populate_existing=True)
+        if stats is None:
+            stats = await self._write_user_stats(session, user_id, overwrite=False, lock=lock)
+        return stats
+    
+    async def _write_user_stats(
+        self,
+        session: AsyncSession,
+        user_id: int,
+        overwrite: bool,
+        lock: bool = False
+    ) -> Optional[UserStats]:
+        """Записать агрегат в user_stats (INSERT ... ON CONFLICT) и прочитать строку"""
+        if session.bind.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        
+        values = await self._aggregate_user_stats(session, user_id)
+        values['updated_at'] = datetime.utcnow()
+        statement = insert(UserStats).values(user_id=user_id, **values)
+        if overwrite:
+            statement = statement.on_conflict_do_update(
+                index_elements=[UserStats.user_id],
+                set_={name: statement.excluded[name] for name in values}
             )
-            
-            generation_dates = [row.generation_date for row in result.fetchall()]
-            
-            if not generation_dates:
-                return 0, 0
-            
-            # Рассчитываем текущий streak
-            current_streak = 0
-            today = datetime.utcnow().date()
-            yesterday = today - timedelta(days=1)
-            
-            # Проверяем непрерывность начиная с сегодня или вчера
-            check_date = today if today in generation_dates else yesterday
-            
-            for date in generation_dates:
-                if date == check_date:
-                    current_streak += 1
-                    check_date -= timedelta(days=1)
-                elif date < check_date:
-                    # Пропуск в активности
-                    break
-            
-            # Рассчитываем максимальный streak
-            max_streak = 0
-            temp_streak = 0
-            prev_date = None
-            
-            # Сортируем даты по возрастанию для подсчета максимального streak
-            sorted_dates = sorted(generation_dates)
-            
-            for date in sorted_dates:
-                if prev_date is None or date == prev_date + timedelta(days=1):
-                    temp_streak += 1
-                    max_streak = max(max_streak, temp_streak)
-                else:
-                    temp_streak = 1
-                prev_date = date
-            
-            return current_streak, max_streak
-            
-        except Exception as e:
-            logger.error(f"Error calculating user streaks: {e}")
-            return 0, 0
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=[UserStats.user_id])
+        await session.execute(statement)
+        
+        return await session.get(UserStats, user_id, with_for_update=lock, populate_existing=True)
+    
+    async def check_user_stats(self, user_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Сверить user_stats с исходными таблицами
+        
+        Счетчики генераций и оценок накопительные, поэтому значение больше
+        агрегата - норма (старые генерации удалены очисткой), а меньше -
+        расхождение. Суммы по транзакциям (бонусы) должны совпадать точно.
+        
+        Returns:
+            Список расхождений: user_id, поле, значение в user_stats и по агрегату
+        """
+        async with self.session() as session:
+            if user_ids is None:
+                result = await session.execute(select(UserStats.user_id).order_by(UserStats.user_id))
+                user_ids = list(result.scalars().all())
+            
+            mismatches = []
+            for user_id in user_ids:
+                stats = await session.get(UserStats, user_id)
+                if stats is None:
+                    continue
+                expected = await self._aggregate_user_stats(session, user_id)
+                
+                for field, value in expected.items():
+                    actual = getattr(stats, field)
+                    if field in ('total_bonuses', 'bonus_granted'):
+                        drifted = actual != value
+                    else:
+                        drifted = value is not None and (actual is None or actual < value)
+                    if drifted:
+                        mismatches.append({
+                            "user_id": user_id,
+                            "field": field,
+                            "stored": actual,
+                            "expected": value
+                        })
+            
+            return mismatches
+    
+    async def _bump_user_stats(
+        self,
+        session: AsyncSession,
+        user_id: int,
+        last_generation_at: Optional[datetime] = None,
+        **deltas: int
+    ):
+        """
+        Изменить счетчики user_stats в текущей транзакции
+        
+        Если строки еще нет, ничего не делаем: она будет построена из
+        исходных таблиц при первом чтении и уже учтет это изменение.
+        """
+        values = {field: getattr(UserStats, field) + delta for field, delta in deltas.items() if delta}
+        if last_generation_at is not None:
+            values['last_generation_at'] = last_generation_at
+        if not values:
+            return
+        
+        values['updated_at'] = datetime.utcnow()
+        await session.execute(
+            update(UserStats)
+            .where(UserStats.user_id == user_id)
+            .values(**values)
+        )
+    
+    async def _record_active_day(self, session: AsyncSession, user_id: int, day: date):
+        """
+        Учесть день активности в сериях user_stats (в текущей транзакции)
+        
+        Серия хранится как (последний день, длина), поэтому обновление не
+        зависит от длины истории. Завершение генерации, созданной раньше
+        начала текущей серии, не склеивает старые серии - это исправит
+        пересчет (rebuild_user_stats).
+        """
+        stats = await session.get(UserStats, user_id, with_for_update=True, populate_existing=True)
+        if stats is None:
+            return
+        
+        last_day = stats.last_active_day
+        if last_day is None or day > last_day + timedelta(days=1):
+            stats.current_streak = 1
+            stats.last_active_day = day
+        elif day == last_day + timedelta(days=1):
+            stats.current_streak += 1
+            stats.last_active_day = day
+        elif day == last_day - timedelta(days=stats.current_streak):
+            # День сразу перед началом текущей серии
+            stats.current_streak += 1
+        else:
+            return
+        
+        stats.max_streak = max(stats.max_streak, stats.current_streak)
     
     # ========== Generation методы ==========
     
@@ -402,95 +885,160 @@ class DatabaseService:
         cost: int,
         **kwargs
     ) -> Generation:
-        """Создать новую генерацию"""
+        """Создать новую генерацию (без списания кредитов, см. start_generation)"""
         # Валидация cost
         if cost < 0 or cost > 10000:
             raise ValueError(f"Invalid generation cost: {cost}")
             
-        async with self.async_session() as session:
-            # Определяем, используются ли бонусные кредиты
-            used_bonus_credits = await self._is_using_bonus_credits(session, user_id, cost)
-            
-            generation = Generation(
-                user_id=user_id,
-                mode=mode,
-                model=model,
-                prompt=prompt[:2000],  # Ограничиваем длину промпта
-                cost=cost,
-                used_bonus_credits=used_bonus_credits,
-                resolution=kwargs.get('resolution', '720p'),
-                duration=kwargs.get('duration', 5),
-                aspect_ratio=kwargs.get('aspect_ratio', '16:9'),
-                negative_prompt=kwargs.get('negative_prompt', '')[:500],  # Ограничиваем длину
-                image_url=kwargs.get('image_url'),
-                video_url=None,
-                video_file_id=None,
-                thumbnail_url=None,
-                seed=kwargs.get('seed', -1),
-                file_size=None,
-                generation_time=None,
-                queue_time=None,
-                status=GenerationStatusEnum.PENDING,
-                error_message=None,
-                error_code=None,
-                task_id=kwargs.get('task_id'),
-                queue_position=kwargs.get('queue_position'),
-                progress=0,
-                rating=None,
-                feedback=None
+        async with self.session() as session:
+            generation, first_generation = await self._add_generation(
+                session, user_id, mode, model, prompt, cost, **kwargs
             )
-            session.add(generation)
             await session.commit()
             await session.refresh(generation)
-            return generation
+        
+        await self._after_commit(lambda: self._on_generation_created(user_id, first_generation))
+        return generation
     
-    async def _is_using_bonus_credits(self, session: AsyncSession, user_id: int, cost: int) -> bool:
+    async def start_generation(
+        self,
+        user_id: int,  # Внутренний ID пользователя
+        mode: str,
+        model: str,
+        prompt: str,
+        cost: int,
+        **kwargs
+    ) -> Optional[Generation]:
         """
-        Определяет, используются ли бонусные кредиты для генерации
+        Списать кредиты и создать генерацию в одной транзакции
+        
+        Баланс уменьшается одним условным UPDATE ... WHERE balance >= cost
+        RETURNING, поэтому двойное нажатие "подтвердить" не спишет кредиты
+        дважды при недостаточном балансе и не потеряет обновление. Запись
+        в журнале транзакций и генерация создаются в той же транзакции.
         
-        Логика:
-        1. Получаем общую сумму бонусных кредитов пользователя
-        2. Получаем общую сумму потраченных кредитов на генерации
-        3. Если (потраченные + текущая стоимость) <= бонусные кредиты, то используются бонусы
+        Returns:
+            Генерация или None, если кредитов недостаточно
         """
-        # Получаем пользователя
-        user = await session.get(User, user_id)
-        if not user:
-            return False
+        if cost < 0 or cost > 10000:
+            raise ValueError(f"Invalid generation cost: {cost}")
         
-        # Получаем общую сумму бонусных кредитов
-        total_bonus_result = await session.execute(
-            select(func.sum(Transaction.amount))
-            .where(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.type.in_([
-                        TransactionTypeEnum.BONUS,
-                        TransactionTypeEnum.REFERRAL,
-                        TransactionTypeEnum.ADMIN_GIFT
-                    ]),
-                    Transaction.status == TransactionStatusEnum.COMPLETED,
-                    Transaction.amount > 0
+        async with self.session() as session:
+            result = await session.execute(
+                update(User)
+                .where(and_(User.id == user_id, User.balance >= cost))
+                .values(
+                    balance=User.balance - cost,
+                    total_spent=User.total_spent + cost
                 )
+                .returning(User.balance)
+                .execution_options(synchronize_session=False)
             )
-        )
-        total_bonus_credits = total_bonus_result.scalar() or 0
-        
-        # Получаем общую сумму потраченных кредитов на генерации
-        total_spent_result = await session.execute(
-            select(func.sum(Generation.cost))
-            .where(
-                and_(
-                    Generation.user_id == user_id,
-                    Generation.status == GenerationStatusEnum.COMPLETED
-                )
+            new_balance = result.scalar_one_or_none()
+            if new_balance is None:
+                # UPDATE ничего не изменил, фиксировать нечего
+                return None
+            
+            generation, first_generation = await self._add_generation(
+                session, user_id, mode, model, prompt, cost, **kwargs
             )
+            session.add(Transaction(
+                user_id=user_id,
+                type=TransactionTypeEnum.GENERATION,
+                amount=-cost,
+                balance_before=new_balance + cost,
+                balance_after=new_balance,
+                status=TransactionStatusEnum.COMPLETED,
+                generation_id=generation.id,
+                completed_at=datetime.utcnow()
+            ))
+            await session.commit()
+        
+        self.invalidate_user_cache(user_id=user_id)
+        await self._after_commit(lambda: self._on_generation_created(user_id, first_generation))
+        return generation
+    
+    async def _add_generation(
+        self,
+        session: AsyncSession,
+        user_id: int,
+        mode: str,
+        model: str,
+        prompt: str,
+        cost: int,
+        **kwargs
+    ):
+        """Добавить генерацию и обновить счетчики user_stats (без коммита)"""
+        # Определяем, используются ли бонусные кредиты (строка user_stats остается заблокированной)
+        used_bonus_credits = await self._is_using_bonus_credits(session, user_id, cost)
+        # Строка уже в сессии - первая генерация делает пользователя активным рефералом
+        stats = await session.get(UserStats, user_id)
+        first_generation = stats is not None and stats.total_generations == 0
+        
+        generation = Generation(
+            user_id=user_id,
+            mode=mode,
+            model=model,
+            prompt=prompt[:2000],  # Ограничиваем длину промпта
+            cost=cost,
+            used_bonus_credits=used_bonus_credits,
+            resolution=kwargs.get('resolution', '720p'),
+            duration=kwargs.get('duration', 5),
+            aspect_ratio=kwargs.get('aspect_ratio', '16:9'),
+            negative_prompt=kwargs.get('negative_prompt', '')[:500],  # Ограничиваем длину
+            image_url=kwargs.get('image_url'),
+            video_url=None,
+            video_file_id=None,
+            thumbnail_url=None,
+            seed=kwargs.get('seed', -1),
+            file_size=None,
+            generation_time=None,
+            queue_time=None,
+            status=GenerationStatusEnum.PENDING,
+            error_message=None,
+            error_code=None,
+            task_id=kwargs.get('task_id'),
+            queue_position=kwargs.get('queue_position'),
+            progress=0,
+            rating=None,
+            feedback=None
+        )
+        session.add(generation)
+        await session.flush()
+        await self._bump_user_stats(
+            session, user_id,
+            total_generations=1,
+            credits_consumed=cost,
+            last_generation_at=generation.created_at
         )
-        total_spent_on_generations = total_spent_result.scalar() or 0
+        return generation, first_generation
+    
+    async def _on_generation_created(self, user_id: int, first_generation: bool):
+        """Обновить счетчики после коммита новой генерации"""
+        await live_counters.record_generation_created()
+        if first_generation:
+            # Пользователь стал активным - сбрасываем сводку рефералов его реферера
+            user = await self.get_user_by_id(user_id)
+            if user and user.referrer_id:
+                await self._invalidate_referral_summary(user.referrer_id)
+    
+    async def _is_using_bonus_credits(self, session: AsyncSession, user_id: int, cost: int) -> bool:
+        """
+        Определяет, используются ли бонусные кредиты для генерации
+        
+        Бонусные кредиты расходуются первыми: генерация оплачена бонусами,
+        если вместе с уже занятыми кредитами (credits_consumed) она укладывается
+        в полученные бонусы (bonus_granted). Строка user_stats блокируется до
+        конца транзакции, поэтому параллельные генерации пользователя не
+        займут одни и те же бонусы. Вызывающий в той же транзакции
+        увеличивает credits_consumed на стоимость генерации.
+        """
+        # Первая генерация после появления user_stats строит строку по истории
+        stats = await self._ensure_user_stats(session, user_id, lock=True)
+        if stats is None:
+            return False
         
-        # Проверяем, хватает ли бонусных кредитов
-        # Если после этой генерации общие траты не превысят бонусные кредиты
-        return (total_spent_on_generations + cost) <= total_bonus_credits
+        return stats.credits_consumed + cost <= stats.bonus_granted
     
     async def update_generation_status(
         self,
@@ -499,7 +1047,7 @@ class DatabaseService:
         **kwargs
     ):
         """Обновить статус генерации"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             # Конвертируем строку в enum если нужно
             if isinstance(status, str):
                 status = GenerationStatusEnum(status)
@@ -527,12 +1075,10 @@ class DatabaseService:
             if 'queue_position' in kwargs:
                 values['queue_position'] = kwargs['queue_position']
             
-            await session.execute(
-                update(Generation)
-                .where(Generation.id == generation_id)
-                .values(**values)
-            )
+            pending_delta = await self._update_generation(session, generation_id, values)
             await session.commit()
+        
+        await self._after_commit(lambda: live_counters.record_pending_change(pending_delta))
     
     async def update_generation_progress(
         self,
@@ -544,21 +1090,59 @@ class DatabaseService:
         # Валидация progress
         progress = max(0, min(100, progress))
         
-        async with self.async_session() as session:
+        async with self.session() as session:
             values = {'progress': progress}
             if status:
                 values['status'] = GenerationStatusEnum(status)
             
-            await session.execute(
-                update(Generation)
+            pending_delta = await self._update_generation(session, generation_id, values)
+            await session.commit()
+        
+        await self._after_commit(lambda: live_counters.record_pending_change(pending_delta))
+    
+    async def _update_generation(self, session: AsyncSession, generation_id: int, values: Dict[str, Any]) -> int:
+        """
+        Обновить генерацию, учитывая смену статуса в счетчиках user_stats
+        
+        Returns:
+            Изменение числа ожидающих генераций для живых счетчиков (-1, 0 или 1)
+        """
+        previous = None
+        if 'status' in values:
+            result = await session.execute(
+                select(Generation.user_id, Generation.status, Generation.created_at, Generation.cost)
                 .where(Generation.id == generation_id)
-                .values(**values)
+                .with_for_update()
             )
-            await session.commit()
+            previous = result.one_or_none()
+        
+        await session.execute(
+            update(Generation)
+            .where(Generation.id == generation_id)
+            .values(**values)
+        )
+        
+        if previous is not None:
+            was_completed = previous.status == GenerationStatusEnum.COMPLETED
+            is_completed = values['status'] == GenerationStatusEnum.COMPLETED
+            was_consuming = previous.status in CREDIT_CONSUMING_STATUSES
+            is_consuming = values['status'] in CREDIT_CONSUMING_STATUSES
+            await self._bump_user_stats(
+                session, previous.user_id,
+                successful_generations=is_completed - was_completed,
+                credits_consumed=(is_consuming - was_consuming) * (previous.cost or 0)
+            )
+            if is_completed and not was_completed:
+                await self._record_active_day(session, previous.user_id, previous.created_at.date())
+            
+            was_pending = previous.status in PENDING_STATUSES
+            is_pending = values['status'] in PENDING_STATUSES
+            return is_pending - was_pending
+        return 0
     
     async def update_generation_video_file_id(self, generation_id: int, file_id: str):
         """Обновить Telegram file_id для видео"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             await session.execute(
                 update(Generation)
                 .where(Generation.id == generation_id)
@@ -568,7 +1152,7 @@ class DatabaseService:
     
     async def get_generation(self, generation_id: int) -> Optional[Generation]:
         """Получить генерацию по ID"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 select(Generation)
                 .where(Generation.id == generation_id)
@@ -580,18 +1164,25 @@ class DatabaseService:
         self,
         user_id: int,  # Внутренний ID
         limit: int = 10,
-        offset: int = 0
+        offset: int = 0,
+        after: Optional[str] = None,
+        before: Optional[str] = None
     ) -> List[Generation]:
-        """Получить генерации пользователя"""
-        async with self.async_session() as session:
+        """
+        Получить генерации пользователя (новые первыми)
+        
+        Для листания используйте курсоры (encode_cursor от крайней генерации
+        страницы) вместо offset.
+        """
+        async with self.session() as session:
             result = await session.execute(
-                select(Generation)
-                .where(Generation.user_id == user_id)
-                .order_by(Generation.created_at.desc())
-                .limit(limit)
-                .offset(offset)
+                self._paginate(
+                    select(Generation).where(Generation.user_id == user_id),
+                    Generation, limit, offset, after, before
+                )
             )
-            return result.scalars().all()
+            generations = result.scalars().all()
+            return generations[::-1] if before and not after else generations
     
     async def rate_generation(
         self,
@@ -604,12 +1195,27 @@ class DatabaseService:
         if rating < 1 or rating > 5:
             raise ValueError(f"Invalid rating: {rating}")
             
-        async with self.async_session() as session:
+        async with self.session() as session:
+            result = await session.execute(
+                select(Generation.user_id, Generation.rating)
+                .where(Generation.id == generation_id)
+                .with_for_update()
+            )
+            previous = result.one_or_none()
+            if previous is None:
+                return
+            
             await session.execute(
                 update(Generation)
                 .where(Generation.id == generation_id)
                 .values(rating=rating, feedback=feedback[:500] if feedback else None)
             )
+            # Повторная оценка заменяет прежнюю
+            await self._bump_user_stats(
+                session, previous.user_id,
+                rating_sum=rating - (previous.rating or 0),
+                rating_count=0 if previous.rating else 1
+            )
             await session.commit()
     
     # ========== Transaction методы ==========
@@ -622,7 +1228,7 @@ class DatabaseService:
         **kwargs
     ) -> Transaction:
         """Создать транзакцию"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             user = await session.get(User, user_id)
             if not user:
                 raise ValueError(f"User with id {user_id} not found")
@@ -659,7 +1265,7 @@ class DatabaseService:
         telegram_charge_id: Optional[str] = None
     ):
         """Завершить транзакцию"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             transaction = await session.get(Transaction, transaction_id)
             if not transaction:
                 raise ValueError(f"Transaction {transaction_id} not found")
@@ -689,11 +1295,24 @@ class DatabaseService:
                 if transaction.type in [TransactionTypeEnum.BONUS, TransactionTypeEnum.REFERRAL]:
                     user.total_bonuses = (user.total_bonuses or 0) + transaction.amount
             
+            if transaction.type in BONUS_TRANSACTION_TYPES:
+                await self._bump_user_stats(
+                    session, transaction.user_id,
+                    total_bonuses=transaction.amount,
+                    bonus_granted=max(transaction.amount, 0)
+                )
+            
             await session.commit()
+            self.invalidate_user_cache(user_id=transaction.user_id)
+        
+        if transaction.type == TransactionTypeEnum.PURCHASE:
+            await self._after_commit(
+                lambda: live_counters.record_revenue(transaction.stars_paid or 0, transaction.created_at.date())
+            )
     
     async def process_refund(self, transaction_id: int) -> bool:
         """Обработать возврат средств"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             transaction = await session.get(Transaction, transaction_id)
             if not transaction:
                 return False
@@ -704,6 +1323,12 @@ class DatabaseService:
             # Обновляем статус транзакции
             transaction.status = TransactionStatusEnum.REFUNDED
             transaction.refunded_at = datetime.utcnow()
+            if transaction.type in BONUS_TRANSACTION_TYPES:
+                await self._bump_user_stats(
+                    session, transaction.user_id,
+                    total_bonuses=-transaction.amount,
+                    bonus_granted=-max(transaction.amount, 0)
+                )
             
             # Списываем кредиты с баланса пользователя
             user = await session.get(User, transaction.user_id)
@@ -730,11 +1355,17 @@ class DatabaseService:
                 session.add(refund_transaction)
             
             await session.commit()
-            return True
+            self.invalidate_user_cache(user_id=transaction.user_id)
+        
+        if transaction.type == TransactionTypeEnum.PURCHASE:
+            await self._after_commit(
+                lambda: live_counters.record_revenue(-(transaction.stars_paid or 0), transaction.created_at.date())
+            )
+        return True
     
     async def get_transaction(self, transaction_id: int) -> Optional[Transaction]:
         """Получить транзакцию по ID"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             return await session.get(Transaction, transaction_id)
     
     async def get_user_transactions(
@@ -743,14 +1374,16 @@ class DatabaseService:
         limit: int = 10,
         offset: int = 0,
         type: Optional[TransactionTypeEnum] = None,
-        include_all_statuses: bool = False
+        include_all_statuses: bool = False,
+        after: Optional[str] = None,
+        before: Optional[str] = None
     ) -> List[Transaction]:
-        """Получить транзакции пользователя"""
+        """Получить транзакции пользователя (новые первыми, курсоры как в get_user_generations)"""
         user = await self.get_user(telegram_id)
         if not user:
             return []
         
-        async with self.async_session() as session:
+        async with self.session() as session:
             query = select(Transaction).where(Transaction.user_id == user.id)
             
             if type:
@@ -763,16 +1396,17 @@ class DatabaseService:
                     TransactionStatusEnum.REFUNDED  # Показываем возвращенные для прозрачности
                 ]))
             
-            query = query.order_by(Transaction.created_at.desc()).limit(limit).offset(offset)
+            query = self._paginate(query, Transaction, limit, offset, after, before)
             
             result = await session.execute(query)
-            return result.scalars().all()
+            transactions = result.scalars().all()
+            return transactions[::-1] if before and not after else transactions
     
     # ========== Referral методы ==========
     
     async def increment_referral_stats(self, referrer_id: int, bonus_amount: int):
         """Увеличить статистику рефералов"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             await session.execute(
                 update(User)
                 .where(User.id == referrer_id)
@@ -782,69 +1416,97 @@ class DatabaseService:
                 )
             )
             await session.commit()
+            self.invalidate_user_cache(user_id=referrer_id)
     
-    async def get_referral_statistics(self, user_id: int) -> Dict[str, Any]:
-        """Получить статистику рефералов"""
-        async with self.async_session() as session:
-            user = await session.get(User, user_id)
-            if not user:
-                return {}
-            
-            # Получаем рефералов
-            referrals = await session.execute(
-                select(User)
-                .where(User.referrer_id == user.id)
-                .order_by(User.created_at.desc())
-            )
-            referral_list = referrals.scalars().all()
-            
-            # Активные рефералы (сделали хотя бы одну генерацию)
-            active_referrals = 0
-            for ref in referral_list:
-                gen_count = await session.execute(
-                    select(func.count(Generation.id))
-                    .where(Generation.user_id == ref.id)
+    async def get_referral_statistics(
+        self,
+        user_id: int,
+        limit: int = 10,
+        offset: int = 0,
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """Получить статистику рефералов: сводку и страницу списка рефералов"""
+        summary = await self.get_referral_summary(user_id, use_cache=use_cache)
+        if not summary:
+            return {}
+        
+        return {
+            **summary,
+            'recent_referrals': await self.get_referrals(user_id, limit=limit, offset=offset)
+        }
+    
+    async def get_referral_summary(self, user_id: int, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Сводка по рефералам пользователя
+        
+        Считается одним сгруппированным запросом по рефералам; активным
+        считается реферал, сделавший хотя бы одну генерацию (по счетчику
+        user_stats). Результат кешируется в Redis и сбрасывается при
+        регистрации нового реферала и первой генерации реферала.
+        """
+        cache_key = REFERRAL_SUMMARY_CACHE_KEY.format(referrer_id=user_id)
+        if use_cache and cache.is_available:
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        user = await self.get_user_by_id(user_id)
+        if not user:
+            return {}
+        
+        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        async with self.read_session('referrals') as session:
+            result = await session.execute(
+                select(
+                    func.count(UserStats.user_id).filter(UserStats.total_generations > 0),
+                    func.count(User.id).filter(User.created_at >= month_start)
                 )
-                if gen_count.scalar() > 0:
-                    active_referrals += 1
-            
-            # Рефералы за текущий месяц
-            month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0)
-            monthly_referrals = await session.execute(
-                select(func.count(User.id))
-                .where(
-                    and_(
-                        User.referrer_id == user.id,
-                        User.created_at >= month_start
-                    )
+                .select_from(User)
+                .outerjoin(UserStats, UserStats.user_id == User.id)
+                .where(User.referrer_id == user_id)
+            )
+            active_referrals, this_month = result.one()
+        
+        summary = {
+            'total_referrals': user.referral_count,
+            'active_referrals': active_referrals or 0,
+            'total_earned': user.referral_earnings,
+            'this_month': this_month or 0
+        }
+        if use_cache and cache.is_available:
+            await cache.set(cache_key, summary, expire=settings.REFERRAL_SUMMARY_CACHE_TTL)
+        return summary
+    
+    async def get_referrals(self, user_id: int, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        """Страница рефералов пользователя (новые первыми) с признаком активности"""
+        async with self.read_session('referrals') as session:
+            result = await session.execute(
+                select(
+                    User.id,
+                    User.username,
+                    User.created_at,
+                    func.coalesce(UserStats.total_generations, 0) > 0
                 )
+                .outerjoin(UserStats, UserStats.user_id == User.id)
+                .where(User.referrer_id == user_id)
+                .order_by(User.created_at.desc(), User.id.desc())
+                .limit(limit)
+                .offset(offset)
             )
-            
-            # Последние рефералы
-            recent_referrals = []
-            for ref in referral_list[:10]:
-                recent_referrals.append({
-                    'id': ref.id,
-                    'username': ref.username,
-                    'date': ref.created_at,
-                    'is_active': await self._is_user_active(session, ref.id)
-                })
-            
-            return {
-                'total_referrals': user.referral_count,
-                'active_referrals': active_referrals,
-                'total_earned': user.referral_earnings,
-                'this_month': monthly_referrals.scalar() or 0,
-                'recent_referrals': recent_referrals
-            }
+            return [
+                {
+                    'id': referral_id,
+                    'username': username,
+                    'date': created_at,
+                    'is_active': bool(is_active)
+                }
+                for referral_id, username, created_at, is_active in result.all()
+            ]
     
-    async def _is_user_active(self, session: AsyncSession, user_id: int) -> bool:
-        """Проверить, активен ли пользователь"""
-        gen_count = await session.execute(
-            select(func.count(Generation.id))
-            .where(Generation.user_id == user_id)
-        )
-        return gen_count.scalar() > 0
+    async def _invalidate_referral_summary(self, referrer_id: int):
+        """Сбросить кешированную сводку по рефералам"""
+        if cache.is_available:
+            await cache.delete(REFERRAL_SUMMARY_CACHE_KEY.format(referrer_id=referrer_id))
     
     # ========== Search методы ==========
     
@@ -853,29 +1515,75 @@ class DatabaseService:
         query: str,
         limit: int = 10
     ) -> List[User]:
-        """Поиск пользователей"""
+        """
+        Поиск пользователей для админки
+        
+        Telegram ID ищется точным совпадением, "@username" - по префиксу
+        username, остальное - по подстроке и триграммному сходству username,
+        имени и фамилии (индексы pg_trgm, см. migrations/004) с сортировкой
+        по сходству.
+        """
         # Валидация query
+        query = (query or "").strip()
         if not query or len(query) > 100:
             return []
+        
+        async with self.session() as session:
+            if query.isdigit() and len(query) <= 18:
+                result = await session.execute(
+                    select(User).where(User.telegram_id == int(query))
+                )
+                user = result.scalar_one_or_none()
+                if user:
+                    return [user]
             
-        async with self.async_session() as session:
-            # Защита от SQL injection - используем параметризованные запросы
-            search_pattern = f"%{query}%"
-            
+            condition, rank = self._user_search_filter(query)
             result = await session.execute(
                 select(User)
-                .where(
-                    or_(
-                        User.username.ilike(search_pattern),
-                        User.first_name.ilike(search_pattern),
-                        User.last_name.ilike(search_pattern),
-                        cast(User.telegram_id, String).like(search_pattern)
-                    )
-                )
+                .where(condition)
+                .order_by(rank.desc(), User.id.desc())
                 .limit(min(limit, 100))  # Ограничиваем максимальный limit
             )
             return result.scalars().all()
     
+    def _user_search_filter(self, query: str):
+        """
+        Условие поиска пользователей и ранг совпадения для сортировки
+        
+        На PostgreSQL используется pg_trgm (оператор % и similarity), на
+        остальных БД (SQLite для разработки) - LIKE по подстроке, выше
+        точное совпадение и префикс username.
+        """
+        # Экранируем спецсимволы LIKE, параметры передаются привязкой
+        def escape(value: str) -> str:
+            return value.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+        
+        username = func.lower(User.username)
+        
+        if query.startswith('@'):
+            name = query[1:].lower()
+            condition = username.like(f"{escape(name)}%", escape='!')
+            # Точное совпадение первым, затем более короткие username
+            rank = case((username == name, 1000), else_=0) - func.length(User.username)
+            return condition, rank
+        
+        term = query.lower()
+        pattern = f"%{escape(term)}%"
+        columns = [username, func.lower(User.first_name), func.lower(User.last_name)]
+        matches = [column.like(pattern, escape='!') for column in columns]
+        
+        if self.engine.dialect.name == 'postgresql':
+            condition = or_(*matches, *[column.op('%')(term) for column in columns])
+            rank = func.greatest(*[func.similarity(column, term) for column in columns])
+        else:
+            condition = or_(*matches)
+            rank = case(
+                (username == term, 2),
+                (username.like(f"{escape(term)}%", escape='!'), 1),
+                else_=0
+            )
+        return condition, rank
+    
     # ========== Admin методы ==========
     
     async def get_all_users(
@@ -884,24 +1592,25 @@ class DatabaseService:
         offset: int = 0,
         search: Optional[str] = None,
         only_banned: bool = False,
-        only_premium: bool = False
+        only_premium: bool = False,
+        only_admins: bool = False,
+        active_since: Optional[datetime] = None,
+        after: Optional[str] = None,
+        before: Optional[str] = None
     ) -> List[User]:
-        """Получить всех пользователей (для админов)"""
+        """Получить всех пользователей (для админов; курсоры как в get_user_generations)"""
         # Валидация параметров
         limit = min(limit, 1000)  # Максимум 1000 пользователей за раз
         
-        async with self.async_session() as session:
+        async with self.session() as session:
             query = select(User)
             
             if search:
-                search_pattern = f"%{search[:100]}%"  # Ограничиваем длину search
-                query = query.where(
-                    or_(
-                        User.username.ilike(search_pattern),
-                        User.first_name.ilike(search_pattern),
-                        cast(User.telegram_id, String).like(search_pattern)
-                    )
-                )
+                search = search.strip()[:100]  # Ограничиваем длину search
+                if search.isdigit() and len(search) <= 18:
+                    query = query.where(User.telegram_id == int(search))
+                else:
+                    query = query.where(self._user_search_filter(search)[0])
             
             if only_banned:
                 query = query.where(User.is_banned == True)
@@ -909,10 +1618,17 @@ class DatabaseService:
             if only_premium:
                 query = query.where(User.is_premium == True)
             
-            query = query.order_by(User.created_at.desc()).limit(limit).offset(offset)
+            if only_admins:
+                query = query.where(User.is_admin == True)
+            
+            if active_since:
+                query = query.where(User.last_active >= active_since)
+            
+            query = self._paginate(query, User, limit, offset, after, before)
             
             result = await session.execute(query)
-            return result.scalars().all()
+            users = result.scalars().all()
+            return users[::-1] if before and not after else users
     
     async def ban_user(
         self, 
@@ -921,7 +1637,7 @@ class DatabaseService:
         reason: Optional[str] = None
     ) -> bool:
         """Забанить/разбанить пользователя"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 update(User)
                 .where(User.telegram_id == telegram_id)
@@ -932,11 +1648,12 @@ class DatabaseService:
                 )
             )
             await session.commit()
+            self.invalidate_user_cache(telegram_id=telegram_id)
             return result.rowcount > 0
 
     async def unban_user(self, user_id: int) -> bool:
         """Разбанить пользователя по внутреннему ID"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 update(User)
                 .where(User.id == user_id)
@@ -947,11 +1664,12 @@ class DatabaseService:
                 )
             )
             await session.commit()
+            self.invalidate_user_cache(user_id=user_id)
             return result.rowcount > 0
     
     async def ban_user_by_id(self, user_id: int, reason: Optional[str] = None) -> bool:
         """Забанить пользователя по внутреннему ID"""
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 update(User)
                 .where(User.id == user_id)
@@ -962,6 +1680,7 @@ class DatabaseService:
                 )
             )
             await session.commit()
+            self.invalidate_user_cache(user_id=user_id)
             return result.rowcount > 0
 
     async def add_credits_to_user(
@@ -981,7 +1700,7 @@ class DatabaseService:
         if not user:
             return False
         
-        async with self.async_session() as session:
+        async with self.session() as session:
             # Обновляем баланс
             await session.execute(
                 update(User)
@@ -1008,8 +1727,10 @@ class DatabaseService:
                 meta_data={"admin_id": admin_id}
             )
             session.add(transaction)
+            await self._bump_user_stats(session, user.id, total_bonuses=amount, bonus_granted=max(amount, 0))
             
             await session.commit()
+            self.invalidate_user_cache(user_id=user.id)
             return True
     
     async def add_credits(
@@ -1024,7 +1745,7 @@ class DatabaseService:
             logger.error(f"Attempt to add too many credits: {amount}")
             return False
             
-        async with self.async_session() as session:
+        async with self.session() as session:
             user = await session.get(User, user_id)
             if not user:
                 return False
@@ -1048,89 +1769,263 @@ class DatabaseService:
                 completed_at=datetime.utcnow()
             )
             session.add(transaction)
+            if amount > 0:
+                await self._bump_user_stats(session, user_id, total_bonuses=amount, bonus_granted=amount)
             
             await session.commit()
+            self.invalidate_user_cache(user_id=user_id)
             return True
     
     # ========== Statistics методы ==========
     
     async def get_bot_statistics(self) -> Dict[str, Any]:
-        """Получить общую статистику бота"""
-        async with self.async_session() as session:
-            # Пользователи
-            total_users = await session.execute(
-                select(func.count(User.id))
-            )
-            
-            active_today = await session.execute(
-                select(func.count(User.id))
-                .where(User.last_active >= datetime.utcnow() - timedelta(days=1))
-            )
-            
-            new_today = await session.execute(
-                select(func.count(User.id))
-                .where(User.created_at >= datetime.utcnow().replace(hour=0, minute=0, second=0))
-            )
-            
-            # Генерации
-            total_generations = await session.execute(
-                select(func.count(Generation.id))
-            )
-            
-            generations_today = await session.execute(
-                select(func.count(Generation.id))
-                .where(Generation.created_at >= datetime.utcnow().replace(hour=0, minute=0, second=0))
-            )
-            
-            pending_generations = await session.execute(
-                select(func.count(Generation.id))
-                .where(Generation.status.in_([
-                    GenerationStatusEnum.PENDING, 
-                    GenerationStatusEnum.PROCESSING
-                ]))
-            )
+        """
+        Получить общую статистику бота
+        
+        Берется из живых счетчиков в Redis; если их нет (Redis недоступен или
+        счетчики давно не пересчитывались), считается из БД и пересчитывает их.
+        """
+        stats = await live_counters.get()
+        if stats is None:
+            stats = await self.rebase_live_counters()
+        return stats
+    
+    async def rebase_live_counters(self) -> Dict[str, Any]:
+        """Пересчитать живые счетчики дашборда из БД"""
+        day_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        stats = await self._calculate_bot_statistics(day_start)
+        
+        if live_counters.is_available and await live_counters.rebase(stats, day_start.date()):
+            # Активных за день добавляем в HyperLogLog: повторные отметки не меняют счетчик
+            async with self.session() as session:
+                result = await session.stream_scalars(
+                    select(User.telegram_id)
+                    .where(User.last_active >= day_start)
+                    .execution_options(yield_per=5000)
+                )
+                async for telegram_ids in result.partitions():
+                    await live_counters.record_active_users(telegram_ids, day_start.date())
+        return stats
+    
+    async def _calculate_bot_statistics(self, day_start: datetime) -> Dict[str, Any]:
+        """Статистика бота из БД: по одному запросу на таблицу"""
+        async with self.session() as session:
+            users = (await session.execute(
+                select(
+                    func.count(User.id),
+                    func.count(User.id).filter(User.last_active >= day_start),
+                    func.count(User.id).filter(User.created_at >= day_start)
+                )
+            )).one()
             
-            # Финансы
-            revenue_today = await session.execute(
-                select(func.sum(Transaction.stars_paid))
-                .where(
-                    and_(
-                        Transaction.type == TransactionTypeEnum.PURCHASE,
-                        Transaction.status == TransactionStatusEnum.COMPLETED,
-                        Transaction.created_at >= datetime.utcnow().replace(hour=0, minute=0, second=0)
-                    )
+            generations = (await session.execute(
+                select(
+                    func.count(Generation.id),
+                    func.count(Generation.id).filter(Generation.created_at >= day_start),
+                    func.count(Generation.id).filter(Generation.status.in_(PENDING_STATUSES))
                 )
-            )
+            )).one()
             
-            total_revenue = await session.execute(
-                select(func.sum(Transaction.stars_paid))
+            revenue = (await session.execute(
+                select(
+                    func.sum(Transaction.stars_paid).filter(Transaction.created_at >= day_start),
+                    func.sum(Transaction.stars_paid)
+                )
                 .where(
                     and_(
                         Transaction.type == TransactionTypeEnum.PURCHASE,
                         Transaction.status == TransactionStatusEnum.COMPLETED
                     )
                 )
-            )
+            )).one()
             
             return {
                 "users": {
-                    "total": total_users.scalar() or 0,
-                    "active_today": active_today.scalar() or 0,
-                    "new_today": new_today.scalar() or 0
+                    "total": users[0] or 0,
+                    "active_today": users[1] or 0,
+                    "new_today": users[2] or 0
                 },
                 "generations": {
-                    "total": total_generations.scalar() or 0,
-                    "today": generations_today.scalar() or 0,
-                    "pending": pending_generations.scalar() or 0
+                    "total": generations[0] or 0,
+                    "today": generations[1] or 0,
+                    "pending": generations[2] or 0
                 },
                 "finance": {
-                    "revenue_today": revenue_today.scalar() or 0,
-                    "total_revenue": total_revenue.scalar() or 0
+                    "revenue_today": revenue[0] or 0,
+                    "total_revenue": revenue[1] or 0
                 }
             }
     
+    async def recalculate_daily_statistics(self, start: date, end: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Пересчитать ежедневную статистику за период [start, end] и сохранить ее
+        
+        Каждая таблица читается одним запросом по диапазону created_at
+        (используются индексы) с группировкой по дням; строки statistics
+        обновляются по дате, поэтому повторный пересчет безопасен.
+        """
+        rows = await self.calculate_daily_statistics(start, end)
+        await self._upsert_daily_statistics(rows)
+        return rows
+    
+    async def calculate_daily_statistics(self, start: date, end: Optional[date] = None) -> List[Dict[str, Any]]:
+        """Посчитать ежедневную статистику за период [start, end] (без сохранения)"""
+        end = end or start
+        range_start = datetime.combine(start, datetime.min.time())
+        range_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+        
+        days = {}
+        
+        def day_row(value) -> Dict[str, Any]:
+            # SQLite возвращает date() строкой
+            day = date.fromisoformat(value) if isinstance(value, str) else value
+            if day not in days:
+                days[day] = {
+                    'date': day,
+                    'new_users': 0,
+                    'active_users': 0,
+                    'paying_users': 0,
+                    'total_generations': 0,
+                    'successful_generations': 0,
+                    'failed_generations': 0,
+                    'cancelled_generations': 0,
+                    'revenue_stars': 0,
+                    'revenue_credits': 0,
+                    'refunds_count': 0,
+                    'refunds_amount': 0,
+                    'avg_generation_time': None,
+                    'avg_queue_time': None,
+                    'avg_purchase_amount': None
+                }
+            return days[day]
+        
+        async with self.read_session('daily_statistics') as session:
+            user_day = func.date(User.created_at)
+            result = await session.execute(
+                select(user_day, func.count(User.id))
+                .where(and_(User.created_at >= range_start, User.created_at < range_end))
+                .group_by(user_day)
+            )
+            for day, new_users in result.all():
+                day_row(day)['new_users'] = new_users
+            
+            completed = Generation.status == GenerationStatusEnum.COMPLETED
+            generation_day = func.date(Generation.created_at)
+            result = await session.execute(
+                select(
+                    generation_day,
+                    func.count(func.distinct(Generation.user_id)),
+                    func.count(Generation.id),
+                    func.count(Generation.id).filter(completed),
+                    func.count(Generation.id).filter(Generation.status == GenerationStatusEnum.FAILED),
+                    func.count(Generation.id).filter(Generation.status == GenerationStatusEnum.CANCELLED),
+                    func.avg(Generation.generation_time).filter(completed),
+                    func.avg(Generation.queue_time).filter(completed)
+                )
+                .where(and_(Generation.created_at >= range_start, Generation.created_at < range_end))
+                .group_by(generation_day)
+            )
+            for day, active, total, successful, failed, cancelled, avg_time, avg_queue in result.all():
+                row = day_row(day)
+                row.update(
+                    active_users=active,
+                    total_generations=total,
+                    successful_generations=successful,
+                    failed_generations=failed,
+                    cancelled_generations=cancelled,
+                    avg_generation_time=float(avg_time) if avg_time is not None else None,
+                    avg_queue_time=float(avg_queue) if avg_queue is not None else None
+                )
+            
+            purchase = and_(
+                Transaction.type == TransactionTypeEnum.PURCHASE,
+                Transaction.status == TransactionStatusEnum.COMPLETED
+            )
+            refund = and_(
+                Transaction.type == TransactionTypeEnum.REFUND,
+                Transaction.status == TransactionStatusEnum.COMPLETED
+            )
+            transaction_day = func.date(Transaction.created_at)
+            result = await session.execute(
+                select(
+                    transaction_day,
+                    func.count(func.distinct(Transaction.user_id)).filter(purchase),
+                    func.sum(Transaction.stars_paid).filter(purchase),
+                    func.sum(Transaction.amount).filter(purchase),
+                    func.avg(Transaction.stars_paid).filter(purchase),
+                    func.count(Transaction.id).filter(refund),
+                    func.sum(-Transaction.amount).filter(refund)
+                )
+                .where(and_(
+                    Transaction.created_at >= range_start,
+                    Transaction.created_at < range_end,
+                    Transaction.type.in_([TransactionTypeEnum.PURCHASE, TransactionTypeEnum.REFUND])
+                ))
+                .group_by(transaction_day)
+            )
+            for day, paying, stars, credits, avg_stars, refunds, refunded in result.all():
+                day_row(day).update(
+                    paying_users=paying,
+                    revenue_stars=stars or 0,
+                    revenue_credits=credits or 0,
+                    avg_purchase_amount=float(avg_stars) if avg_stars is not None else None,
+                    refunds_count=refunds,
+                    refunds_amount=refunded or 0
+                )
+        
+        # Дни без событий тоже сохраняем - с нулями
+        current = start
+        while current <= end:
+            day_row(current)
+            current += timedelta(days=1)
+        
+        return [days[day] for day in sorted(days)]
+    
+    async def _upsert_daily_statistics(self, rows: List[Dict[str, Any]]):
+        """Записать строки statistics, обновляя существующие по дате"""
+        if not rows:
+            return
+        
+        async with self.session() as session:
+            if session.bind.dialect.name == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            
+            values = [
+                {**row, 'date': datetime.combine(row['date'], datetime.min.time())}
+                for row in rows
+            ]
+            statement = insert(Statistics).values(values)
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[Statistics.date],
+                    set_={
+                        name: statement.excluded[name]
+                        for name in rows[0] if name != 'date'
+                    }
+                )
+            )
+            await session.commit()
+    
     # ========== Action logging ==========
     
+    async def insert_rows(self, model, rows: List[Dict[str, Any]]) -> int:
+        """Вставить строки одним многострочным INSERT"""
+        if not rows:
+            return 0
+        # Отдельная сессия: журнал аудита не откатывается вместе с единицей работы
+        async with self.async_session() as session:
+            await session.execute(insert(model.__table__), rows)
+            await session.commit()
+        return len(rows)
+    
+    async def _write_audit(self, model, row: Dict[str, Any]):
+        """Строка аудита в очередь; без фонового сброса (скрипты, Celery) - запись сразу"""
+        self.audit.write(model, row)
+        if not self.audit.is_running:
+            await self.audit.flush()
+    
     async def log_user_action(
         self,
         user_id: int,
@@ -1138,16 +2033,14 @@ class DatabaseService:
         category: Optional[str] = None,
         details: Optional[Dict[str, Any]] = None
     ):
-        """Логировать действие пользователя"""
-        async with self.async_session() as session:
-            action_log = UserAction(
-                user_id=user_id,
-                action=action[:100],  # Ограничиваем длину
-                category=category[:50] if category else None,
-                details=details
-            )
-            session.add(action_log)
-            await session.commit()
+        """Логировать действие пользователя (запись в БД - пачкой, в фоне)"""
+        await self._write_audit(UserAction, {
+            "user_id": user_id,
+            "action": action[:100],  # Ограничиваем длину
+            "category": category[:50] if category else None,
+            "details": details,
+            "created_at": datetime.utcnow()
+        })
     
     async def log_admin_action(
         self,
@@ -1156,16 +2049,14 @@ class DatabaseService:
         target_user_id: Optional[int] = None,
         details: Optional[Dict[str, Any]] = None
     ):
-        """Логировать действие администратора"""
-        async with self.async_session() as session:
-            log = AdminLog(
-                admin_id=admin_id,
-                action=action[:100],  # Ограничиваем длину
-                target_user_id=target_user_id,
-                details=details
-            )
-            session.add(log)
-            await session.commit()
+        """Логировать действие администратора (запись в БД - пачкой, в фоне)"""
+        await self._write_audit(AdminLog, {
+            "admin_id": admin_id,
+            "action": action[:100],  # Ограничиваем длину
+            "target_user_id": target_user_id,
+            "details": details,
+            "created_at": datetime.utcnow()
+        })
 
     async def get_failed_generations_with_task_id(self, hours_back: int = 24) -> List[Generation]:
         """
@@ -1177,7 +2068,7 @@ class DatabaseService:
         Returns:
             Список неудачных генераций с task_id
         """
-        async with self.async_session() as session:
+        async with self.session() as session:
             cutoff_time = datetime.utcnow() - timedelta(hours=hours_back)
             
             result = await session.execute(
@@ -1205,7 +2096,7 @@ class DatabaseService:
         if not task_ids:
             return []
             
-        async with self.async_session() as session:
+        async with self.session() as session:
             result = await session.execute(
                 select(Generation)
                 .where(Generation.task_id.in_(task_ids))
@@ -1213,6 +2104,10 @@ class DatabaseService:
             
             return result.scalars().all()
 
+# Запросы в статистике помечаются методом DatabaseService, из которого выполнены
+if settings.QUERY_STATS_ENABLED:
+    instrument_methods(DatabaseService)
+
 # Singleton экземпляр
 db = DatabaseService()
 
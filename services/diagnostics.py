@@ -0,0 +1,221 @@
+"""
+Диагностика живого процесса: семплирующий профайлер, дамп asyncio-задач
+и время запуска
+
+Профайлер из отдельного потока периодически снимает стек потока event loop
+через sys._current_frames() и копит стеки в формате collapsed stacks
+("a;b;c 42"), который понимают flamegraph.pl, speedscope и inferno.
+Профилируемый код не инструментируется, поэтому накладные расходы
+определяются только частотой семплирования.
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from types import FrameType
+from typing import Dict, Any, List, Optional, Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    """Семплирующий CPU-профайлер потока event loop"""
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 128):
+        """
+        Args:
+            interval: Интервал между семплами в секундах
+            max_depth: Максимальная глубина стека в семпле
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, seconds: float, thread_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Профилировать поток в течение заданного времени
+
+        Args:
+            seconds: Длительность профилирования
+            thread_id: Поток для профилирования (по умолчанию - текущий, т.е. event loop)
+
+        Returns:
+            Словарь со стеками ('folded') и сводкой
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Profiler is already running")
+
+        try:
+            target = thread_id or threading.get_ident()
+            stop = threading.Event()
+            result: Dict[str, Any] = {}
+
+            sampler = threading.Thread(
+                target=self._sample,
+                args=(target, stop, result),
+                name="diagnostics-profiler",
+                daemon=True
+            )
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+
+            return result
+        finally:
+            self._lock.release()
+
+    def _sample(self, target: int, stop: threading.Event, result: Dict[str, Any]):
+        stacks: Counter = Counter()
+        samples = 0
+        sampling_time = 0.0
+        started = time.perf_counter()
+
+        while not stop.wait(self.interval):
+            sample_start = time.perf_counter()
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                break
+
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.reverse()
+
+            stacks[';'.join(labels)] += 1
+            samples += 1
+            sampling_time += time.perf_counter() - sample_start
+
+        duration = time.perf_counter() - started
+        result.update({
+            'stacks': stacks,
+            'samples': samples,
+            'duration': duration,
+            # Доля времени, когда семплер держал GIL
+            'overhead_percent': round(sampling_time / duration * 100, 3) if duration else 0.0
+        })
+
+
+def format_folded(stacks: Counter) -> str:
+    """Стеки в формате collapsed stacks для flamegraph"""
+    return '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()) + '\n'
+
+
+def top_functions(stacks: Counter, limit: int = 10) -> List[tuple]:
+    """Функции с наибольшим собственным временем (по верхнему кадру стека)"""
+    own: Counter = Counter()
+    for stack, count in stacks.items():
+        leaf = stack.rsplit(';', 1)[-1]
+        # Номер строки не важен для сводки
+        own[leaf.rsplit(':', 1)[0]] += count
+    return own.most_common(limit)
+
+
+def _await_chain(coro: Any) -> List[str]:
+    """Цепочка await от корутины задачи до места ожидания"""
+    chain = []
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None) or getattr(coro, 'ag_frame', None)
+        if frame is not None:
+            chain.append(f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}")
+        coro = (
+            getattr(coro, 'cr_await', None)
+            or getattr(coro, 'gi_yieldfrom', None)
+            or getattr(coro, 'ag_await', None)
+        )
+    return chain
+
+
+def _coro_name(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    return getattr(coro, '__qualname__', None) or type(coro).__name__
+
+
+def dump_tasks(loop: Optional[asyncio.AbstractEventLoop] = None) -> Dict[str, Any]:
+    """
+    Снимок всех незавершенных asyncio-задач
+
+    Returns:
+        Словарь со сводкой по корутинам ('by_coroutine') и текстом дампа ('text')
+    """
+    tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
+    by_coroutine = Counter(_coro_name(task) for task in tasks)
+
+    lines = [f"Pending tasks: {len(tasks)}", ""]
+    for name, count in by_coroutine.most_common():
+        lines.append(f"{count:5d}  {name}")
+    lines.append("")
+
+    for task in sorted(tasks, key=_coro_name):
+        lines.append(f"=== {task.get_name()} ({_coro_name(task)})")
+        waiter = getattr(task, '_fut_waiter', None)
+        if waiter is not None:
+            lines.append(f"    waiting on: {waiter!r}"[:300])
+        for entry in _await_chain(task.get_coro()):
+            lines.append(f"    {entry}")
+        lines.append("")
+
+    return {
+        'total': len(tasks),
+        'by_coroutine': by_coroutine,
+        'text': '\n'.join(lines)
+    }
+
+
+class StartupTimer:
+    """Длительность шагов запуска и время до первого обработанного апдейта"""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started or time.monotonic()
+        self.steps: Dict[str, float] = {}
+        self.ready_after: Optional[float] = None
+        self.first_update_after: Optional[float] = None
+
+    async def timed(self, name: str, awaitable: Awaitable) -> Any:
+        """Выполнить шаг запуска и запомнить его длительность"""
+        step_start = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.steps[name] = time.monotonic() - step_start
+
+    def mark_ready(self):
+        self.ready_after = time.monotonic() - self.started
+        steps = ', '.join(f"{name} {duration * 1000:.0f} ms" for name, duration in self.steps.items())
+        logger.info(f"Startup finished in {self.ready_after:.2f}s ({steps})")
+
+    def mark_update_handled(self):
+        if self.first_update_after is None:
+            self.first_update_after = time.monotonic() - self.started
+            logger.info(f"First update handled {self.first_update_after:.2f}s after start")
+
+    def get_report(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            'ready_ms': ms(self.ready_after),
+            'first_update_ms': ms(self.first_update_after),
+            'steps_ms': {name: ms(duration) for name, duration in self.steps.items()}
+        }
+
+
+# Глобальные экземпляры
+profiler = SamplingProfiler()
+startup_timer = StartupTimer()
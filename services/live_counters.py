@@ -0,0 +1,216 @@
+"""
+Живые счетчики дашборда администратора в Redis
+
+Счетчики увеличиваются в местах записи (регистрация, генерации, покупки,
+сброс активности), а периодический пересчет из SQL (DatabaseService.rebase_live_counters)
+исправляет накопившийся дрейф. Пока счетчики не пересчитаны (например, Redis
+перезапустился) или Redis недоступен, get() возвращает None и статистика
+считается запросами к БД.
+"""
+
+import logging
+from datetime import datetime, date
+from typing import Optional, Dict, Any, Iterable
+
+from core.config import settings
+from services.cache_service import cache
+
+logger = logging.getLogger(__name__)
+
+DAY_KEY_TTL = 2 * 24 * 3600  # Дневные счетчики храним двое суток
+
+# KEYS: итоговые счетчики, затем дневные. ARGV[1] - число итоговых ключей,
+# ARGV[2] - TTL дневных ключей, дальше приращения в порядке KEYS.
+# Итоговые счетчики меняем, только если они уже заданы пересчетом,
+# дневные начинаются с нуля в начале суток.
+INCREMENT_SCRIPT = """
+local totals = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    if i > totals then
+        redis.call('INCRBY', key, ARGV[i + 2])
+        redis.call('EXPIRE', key, ARGV[2])
+    elseif redis.call('EXISTS', key) == 1 then
+        redis.call('INCRBY', key, ARGV[i + 2])
+    end
+end
+return 1
+"""
+
+# Активные за день пользователи - HyperLogLog (повторные отметки не учитываются)
+ACTIVE_USERS_SCRIPT = """
+redis.call('PFADD', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: счетчики для MGET, последний - HyperLogLog активных пользователей
+READ_SCRIPT = """
+local values = redis.call('MGET', unpack(KEYS, 1, #KEYS - 1))
+table.insert(values, redis.call('PFCOUNT', KEYS[#KEYS]))
+return values
+"""
+
+# KEYS: итоговые и дневные счетчики, последним - отметка пересчета. ARGV: значения
+# счетчиков, TTL дневных ключей, число итоговых ключей, значение и TTL отметки
+REBASE_SCRIPT = """
+local count = #KEYS - 1
+local totals = tonumber(ARGV[count + 2])
+for i = 1, count do
+    if i > totals then
+        redis.call('SET', KEYS[i], ARGV[i], 'EX', ARGV[count + 1])
+    else
+        redis.call('SET', KEYS[i], ARGV[i])
+    end
+end
+redis.call('SET', KEYS[#KEYS], ARGV[count + 3], 'EX', ARGV[count + 4])
+return 1
+"""
+
+
+class LiveCounters:
+    """Счетчики дашборда, обновляемые событиями записи"""
+
+    def __init__(self, prefix: str = "live", timeout: float = 0.25):
+        """
+        Args:
+            prefix: Префикс ключей счетчиков
+            timeout: Сколько ждать Redis при обновлении счетчика (секунды)
+        """
+        self.prefix = prefix
+        self.timeout = timeout
+        self.max_age = settings.LIVE_COUNTERS_MAX_AGE
+
+    @property
+    def is_available(self) -> bool:
+        return cache.is_available
+
+    def _key(self, name: str, day: Optional[date] = None) -> str:
+        if day is None:
+            return f"{self.prefix}:{name}"
+        return f"{self.prefix}:{name}:{day.isoformat()}"
+
+    async def _increment(self, totals: Dict[str, int], daily: Dict[str, int], day: Optional[date] = None):
+        day = day or datetime.utcnow().date()
+        keys = [self._key(name) for name in totals] + [self._key(name, day) for name in daily]
+        args = [len(totals), DAY_KEY_TTL, *totals.values(), *daily.values()]
+        await cache.run_script(INCREMENT_SCRIPT, keys, args, timeout=self.timeout)
+
+    # ========== События ==========
+
+    async def record_user_created(self):
+        """Зарегистрирован новый пользователь"""
+        await self._increment({'users:total': 1}, {'users:new': 1})
+
+    async def record_active_users(self, telegram_ids: Iterable[int], day: Optional[date] = None):
+        """Отметить пользователей активными за день"""
+        telegram_ids = list(telegram_ids)
+        if not telegram_ids:
+            return
+        key = self._key('users:active', day or datetime.utcnow().date())
+        # unpack в Lua ограничен размером стека - добавляем частями
+        for start in range(0, len(telegram_ids), 5000):
+            await cache.run_script(
+                ACTIVE_USERS_SCRIPT,
+                [key],
+                [DAY_KEY_TTL, *telegram_ids[start:start + 5000]],
+                timeout=self.timeout
+            )
+
+    async def record_generation_created(self):
+        """Создана генерация (она ожидает обработки)"""
+        await self._increment(
+            {'generations:total': 1, 'generations:pending': 1},
+            {'generations:today': 1}
+        )
+
+    async def record_pending_change(self, delta: int):
+        """Генерация вышла из ожидания/обработки (-1) или вернулась в него (+1)"""
+        if delta:
+            await self._increment({'generations:pending': delta}, {})
+
+    async def record_revenue(self, stars: int, day: Optional[date] = None):
+        """
+        Покупка завершена (или возвращена - отрицательная сумма)
+
+        Args:
+            day: Дата создания покупки; дневная выручка меняется, только если это сегодня
+        """
+        if not stars:
+            return
+        today = datetime.utcnow().date()
+        daily = {'revenue:today': stars} if day is None or day == today else {}
+        await self._increment({'revenue:total': stars}, daily, today)
+
+    # ========== Чтение и пересчет ==========
+
+    async def get(self) -> Optional[Dict[str, Any]]:
+        """Статистика из счетчиков или None, если их нужно пересчитать из SQL"""
+        if not self.is_available:
+            return None
+
+        today = datetime.utcnow().date()
+        keys = [
+            self._key('based_at'),
+            self._key('users:total'),
+            self._key('users:new', today),
+            self._key('generations:total'),
+            self._key('generations:today', today),
+            self._key('generations:pending'),
+            self._key('revenue:today', today),
+            self._key('revenue:total'),
+            self._key('users:active', today)
+        ]
+        values = await cache.run_script(READ_SCRIPT, keys, [], timeout=self.timeout)
+        if not values or values[0] is None:
+            return None
+
+        (users_total, users_new, generations_total, generations_today,
+         pending, revenue_today, revenue_total, active_today) = [int(value or 0) for value in values[1:]]
+        return {
+            "users": {
+                "total": users_total,
+                "active_today": active_today,
+                "new_today": users_new
+            },
+            "generations": {
+                "total": generations_total,
+                "today": generations_today,
+                "pending": max(pending, 0)
+            },
+            "finance": {
+                "revenue_today": revenue_today,
+                "total_revenue": revenue_total
+            }
+        }
+
+    async def rebase(self, stats: Dict[str, Any], day: date) -> bool:
+        """
+        Записать значения, посчитанные из SQL (активные пользователи
+        добавляются отдельно через record_active_users)
+        """
+        totals = {
+            'users:total': stats['users']['total'],
+            'generations:total': stats['generations']['total'],
+            'generations:pending': stats['generations']['pending'],
+            'revenue:total': stats['finance']['total_revenue']
+        }
+        daily = {
+            'users:new': stats['users']['new_today'],
+            'generations:today': stats['generations']['today'],
+            'revenue:today': stats['finance']['revenue_today']
+        }
+        keys = (
+            [self._key(name) for name in totals]
+            + [self._key(name, day) for name in daily]
+            + [self._key('based_at')]
+        )
+        args = [
+            *totals.values(), *daily.values(),
+            DAY_KEY_TTL, len(totals), datetime.utcnow().isoformat(), self.max_age
+        ]
+        result = await cache.run_script(REBASE_SCRIPT, keys, args, timeout=self.timeout * 4)
+        return result is not None
+
+
+# Глобальный экземпляр
+live_counters = LiveCounters()
@@ -0,0 +1,247 @@
+"""
+Статистика SQL-запросов по отпечаткам и журнал медленных запросов
+
+Обработчики событий движка SQLAlchemy замеряют каждый запрос, приводят его
+текст к отпечатку (литералы и параметры заменены на ?, списки IN свернуты)
+и копят по отпечатку число вызовов, время, перцентили и число строк. Запрос
+помечается методом DatabaseService, из которого он выполнен (contextvar,
+который выставляют обертки instrument_methods). Запросы медленнее порога
+пишутся в лог с обезличенными параметрами - только типы значений.
+
+Пул соединений отдельно учитывает ожидание при выдаче соединения.
+Статистика своя в каждом процессе (воркере).
+"""
+
+import re
+import time
+import hashlib
+import inspect
+import logging
+import functools
+import contextvars
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Метод DatabaseService, выполняющий запрос
+current_method: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('db_method', default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+|\?")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """Текст запроса без литералов и параметров"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _VALUE_LIST.sub("(...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def redact(parameters: Any, executemany: bool = False) -> str:
+    """Параметры запроса без значений: только типы"""
+    if executemany:
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class TimingSeries:
+    """Счетчики и последние замеры (для перцентилей) одной серии"""
+
+    def __init__(self, sample_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=sample_size)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        samples = list(self.samples)
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 1),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+            'max_ms': round(self.max * 1000, 2)
+        }
+
+
+class QueryStats:
+    """Статистика запросов движка и ожидания пула"""
+
+    def __init__(
+        self,
+        slow_threshold_ms: float = 500.0,
+        sample_size: int = 512,
+        max_fingerprints: int = 500
+    ):
+        """
+        Args:
+            slow_threshold_ms: Запросы дольше этого пишутся в журнал медленных
+            sample_size: Сколько последних замеров хранить для перцентилей
+            max_fingerprints: Предел числа отпечатков; остальные копятся в "(other)"
+        """
+        self.slow_threshold = slow_threshold_ms / 1000
+        self.sample_size = sample_size
+        self.max_fingerprints = max_fingerprints
+        self.reset()
+
+    def reset(self):
+        """Обнулить накопленную статистику"""
+        self._queries: Dict[tuple, Dict[str, Any]] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self.pool_wait = TimingSeries(self.sample_size)
+        self.slow_total = 0
+        self.started_at = time.time()
+
+    # ========== Подключение к движку ==========
+
+    def install(self, engine):
+        """Подписаться на события движка (AsyncEngine или Engine) и его пула"""
+        sync_engine = getattr(engine, 'sync_engine', engine)
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_execute)
+        event.listen(sync_engine, "handle_error", self._on_error)
+        self._instrument_pool(sync_engine.pool)
+
+    def _instrument_pool(self, pool):
+        """Замер ожидания соединения: вокруг выдачи соединения из пула"""
+        do_get = pool._do_get
+
+        def timed_do_get():
+            start = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                self.pool_wait.add(time.perf_counter() - start)
+
+        pool._do_get = timed_do_get
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _on_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_start'):
+            connection.info['query_start'].pop()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        method = current_method.get() or '(direct)'
+        self.record(statement, elapsed, method, cursor.rowcount)
+
+        if elapsed >= self.slow_threshold:
+            self.slow_total += 1
+            logger.warning(
+                f"Slow query {elapsed * 1000:.0f}ms in {method}: "
+                f"{_WHITESPACE.sub(' ', statement)[:1000]} params={redact(parameters, executemany)}"
+            )
+
+    # ========== Учет ==========
+
+    def record(self, statement: str, elapsed: float, method: str, rows: int = -1):
+        """Учесть выполненный запрос"""
+        normalized = self._fingerprints.get(statement)
+        if normalized is None:
+            normalized = fingerprint(statement)
+            # Кеш нормализации по исходному тексту (его немного - запросы строит ORM)
+            if len(self._fingerprints) < self.max_fingerprints * 4:
+                self._fingerprints[statement] = normalized
+
+        key = (method, normalized)
+        entry = self._queries.get(key)
+        if entry is None:
+            if len(self._queries) >= self.max_fingerprints:
+                key = ('(other)', '(other)')
+                entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = {'timing': TimingSeries(self.sample_size), 'rows': 0}
+
+        entry['timing'].add(elapsed)
+        if rows is not None and rows >= 0:
+            entry['rows'] += rows
+
+    def get_report(self, limit: int = 20, order_by: str = 'total_ms') -> Dict[str, Any]:
+        """Сводка по отпечаткам (по убыванию order_by) и ожиданию пула"""
+        queries = []
+        for (method, normalized), entry in self._queries.items():
+            summary = entry['timing'].summary()
+            summary.update(
+                method=method,
+                fingerprint=normalized,
+                id=hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:8],
+                rows=entry['rows'],
+                avg_rows=round(entry['rows'] / summary['count'], 1) if summary['count'] else 0.0
+            )
+            queries.append(summary)
+        queries.sort(key=lambda item: item[order_by], reverse=True)
+
+        return {
+            'since': self.started_at,
+            'statements': sum(item['count'] for item in queries),
+            'total_ms': round(sum(item['total_ms'] for item in queries), 1),
+            'slow_total': self.slow_total,
+            'slow_threshold_ms': self.slow_threshold * 1000,
+            'queries': queries[:limit],
+            'pool_wait': self.pool_wait.summary()
+        }
+
+
+def instrument_methods(cls):
+    """
+    Обернуть корутины класса: запросы внутри помечаются именем метода
+    (вложенные вызовы - самым внутренним методом)
+    """
+    for name, function in list(vars(cls).items()):
+        if not inspect.iscoroutinefunction(function):
+            continue
+
+        def wrap(function, label):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                token = current_method.set(label)
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    current_method.reset(token)
+            return wrapper
+
+        setattr(cls, name, wrap(function, f"{cls.__name__}.{name}"))
+    return cls
+
+
+# Глобальный экземпляр
+query_stats = QueryStats(
+    slow_threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+    sample_size=settings.QUERY_STATS_SAMPLE_SIZE,
+    max_fingerprints=settings.QUERY_STATS_MAX_FINGERPRINTS
+)
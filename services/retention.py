@@ -0,0 +1,291 @@
+"""
+Хранение истории: месячные партиции журналов и удаление устаревших строк порциями
+
+user_actions и utm_events в PostgreSQL разбиты на месячные партиции (миграция 006):
+устаревший месяц отключается и удаляется целиком, без DELETE, раздувания таблицы
+и последующего VACUUM. Строки из партиции DEFAULT (история до миграции), а также
+generations и utm_clicks, на которые ссылаются другие таблицы, удаляются порциями
+по первичному ключу - каждая порция в своей короткой транзакции, с паузой между ними.
+"""
+
+import re
+import asyncio
+import logging
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Dict, Any
+
+from sqlalchemy import select, update, delete, text
+
+from core.config import settings
+from models.models import (
+    Generation, GenerationStatusEnum, Transaction, UserAction, UTMClick, UTMEvent
+)
+from services.database import db
+
+logger = logging.getLogger(__name__)
+
+# Партиционированные таблицы и их ключ партиционирования
+PARTITIONED_TABLES = {
+    'user_actions': 'created_at',
+    'utm_events': 'event_at'
+}
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class RetentionService:
+    """Создание партиций и удаление истории старше срока хранения"""
+
+    def __init__(self, batch_size: Optional[int] = None, pause: Optional[float] = None):
+        """
+        Args:
+            batch_size: Строк в одной порции DELETE
+            pause: Пауза между порциями (секунды)
+        """
+        self.batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+        self.pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+
+    @staticmethod
+    def partition_name(table: str, month: date) -> str:
+        return f"{table}_p{month:%Y%m}"
+
+    async def _is_partitioned(self, session, table: str) -> bool:
+        if db.engine.dialect.name != 'postgresql':
+            return False
+        result = await session.execute(
+            text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+            {"table": table}
+        )
+        return bool(result.scalar())
+
+    async def _average_row_bytes(self, session, relation: str) -> Optional[float]:
+        """Средний размер строки с индексами (оценка по статистике PostgreSQL)"""
+        if db.engine.dialect.name != 'postgresql':
+            return None
+        result = await session.execute(
+            text(
+                "SELECT pg_total_relation_size(oid) / GREATEST(reltuples, 1) "
+                "FROM pg_class WHERE oid = to_regclass(:relation)"
+            ),
+            {"relation": relation}
+        )
+        return result.scalar()
+
+    # ========== Партиции ==========
+
+    async def ensure_partitions(self, months_ahead: Optional[int] = None) -> List[str]:
+        """
+        Создать месячные партиции с текущего месяца на months_ahead вперед
+
+        Месяц, строки которого уже попали в DEFAULT, пропускается: PostgreSQL не
+        даст создать партицию поверх них, они удалятся по сроку хранения порциями.
+
+        Returns:
+            Имена созданных партиций
+        """
+        if months_ahead is None:
+            months_ahead = settings.PARTITION_MONTHS_AHEAD
+        current = month_start(datetime.utcnow().date())
+        created = []
+
+        for table, column in PARTITIONED_TABLES.items():
+            async with db.async_session() as session:
+                if not await self._is_partitioned(session, table):
+                    continue
+
+                for offset in range(months_ahead + 1):
+                    start, end = add_months(current, offset), add_months(current, offset + 1)
+                    name = self.partition_name(table, start)
+                    exists = await session.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+                    if exists.scalar():
+                        continue
+
+                    in_default = await session.execute(
+                        text(
+                            f"SELECT EXISTS (SELECT 1 FROM {table}_default "
+                            f"WHERE {column} >= :start AND {column} < :end)"
+                        ),
+                        {"start": start, "end": end}
+                    )
+                    if in_default.scalar():
+                        logger.warning(f"Rows for {start:%Y-%m} are already in {table}_default, partition {name} skipped")
+                        continue
+
+                    await session.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    ))
+                    created.append(name)
+
+                await session.commit()
+
+        if created:
+            logger.info(f"Created partitions: {', '.join(created)}")
+        return created
+
+    async def _drop_expired_partitions(self, table: str, cutoff: datetime) -> Dict[str, Any]:
+        """Отключить и удалить месячные партиции, целиком лежащие до cutoff"""
+        pattern = re.compile(rf"^{table}_p(\d{{4}})(\d{{2}})$")
+        report = {"rows": 0, "bytes": 0, "partitions": []}
+
+        async with db.async_session() as session:
+            result = await session.execute(
+                text(
+                    "SELECT c.relname, pg_total_relation_size(c.oid) FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+                ),
+                {"table": table}
+            )
+            partitions = result.all()
+
+        for name, size in partitions:
+            match = pattern.match(name)
+            if not match:
+                continue
+            end = add_months(date(int(match.group(1)), int(match.group(2)), 1), 1)
+            if end > cutoff.date():
+                continue
+
+            async with db.async_session() as session:
+                rows = await session.execute(text(f"SELECT count(*) FROM {name}"))
+                report["rows"] += rows.scalar()
+                await session.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                await session.execute(text(f"DROP TABLE {name}"))
+                await session.commit()
+
+            report["bytes"] += size
+            report["partitions"].append(name)
+            logger.info(f"Dropped partition {name} ({size} bytes)")
+
+        return report
+
+    # ========== Удаление порциями ==========
+
+    async def _delete_in_batches(self, model, conditions: list, relation: str, before_delete=None) -> Dict[str, Any]:
+        """
+        Удалять строки порциями по batch_size, каждую в отдельной транзакции
+
+        Args:
+            relation: Таблица или партиция, по которой оценивается объем строки
+            before_delete: async (session, ids) - отвязать ссылки на удаляемые строки
+
+        Returns:
+            Число строк и оценка освобожденного объема (место становится
+            доступным для новых строк после автоочистки, файл не сжимается)
+        """
+        deleted = 0
+        async with db.async_session() as session:
+            row_bytes = await self._average_row_bytes(session, relation)
+
+        while True:
+            async with db.async_session() as session:
+                result = await session.execute(
+                    select(model.id).where(*conditions).order_by(model.id).limit(self.batch_size)
+                )
+                ids = result.scalars().all()
+                if not ids:
+                    break
+
+                if before_delete:
+                    await before_delete(session, ids)
+                # Условия повторяются, чтобы PostgreSQL отсек лишние партиции
+                await session.execute(delete(model).where(model.id.in_(ids), *conditions))
+                await session.commit()
+
+            deleted += len(ids)
+            if len(ids) < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+
+        return {
+            "rows": deleted,
+            "bytes": int(deleted * row_bytes) if row_bytes is not None else None,
+            "partitions": []
+        }
+
+    @staticmethod
+    async def _detach_transactions(session, generation_ids: List[int]):
+        """Транзакции остаются в истории платежей, теряя ссылку на удаленную генерацию"""
+        await session.execute(
+            update(Transaction)
+            .where(Transaction.generation_id.in_(generation_ids))
+            .values(generation_id=None)
+        )
+
+    @staticmethod
+    async def _detach_utm_events(session, click_ids: List[int]):
+        await session.execute(
+            update(UTMEvent)
+            .where(UTMEvent.click_id.in_(click_ids))
+            .values(click_id=None)
+        )
+
+    async def _expire_journal(self, model, table: str, column, cutoff: datetime) -> Dict[str, Any]:
+        """Журнал: целые месяцы - удалением партиций, остальное - порциями"""
+        async with db.async_session() as session:
+            partitioned = await self._is_partitioned(session, table)
+        if not partitioned:
+            return await self._delete_in_batches(model, [column < cutoff], table)
+
+        report = await self._drop_expired_partitions(table, cutoff)
+        # Месячные партиции живут до конца своего месяца; порциями удаляются только
+        # строки DEFAULT, которые старше самой старой оставшейся партиции
+        batches = await self._delete_in_batches(
+            model, [column < datetime.combine(month_start(cutoff.date()), datetime.min.time())],
+            f"{table}_default"
+        )
+        report["rows"] += batches["rows"]
+        report["bytes"] += batches["bytes"] or 0
+        return report
+
+    async def apply_retention(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Удалить историю старше сроков хранения из настроек
+
+        Returns:
+            Отчет по таблицам: table, cutoff, rows, bytes (оценка), partitions
+        """
+        now = now or datetime.utcnow()
+        reports = []
+
+        async def run(table: str, days: int, expire):
+            cutoff = now - timedelta(days=days)
+            report = await expire(cutoff)
+            report.update(table=table, cutoff=cutoff)
+            reports.append(report)
+            logger.info(
+                f"Retention {table}: {report['rows']} rows, {report['bytes']} bytes, "
+                f"partitions dropped: {len(report['partitions'])}"
+            )
+
+        await run('user_actions', settings.USER_ACTIONS_RETENTION_DAYS,
+                  lambda cutoff: self._expire_journal(UserAction, 'user_actions', UserAction.created_at, cutoff))
+        await run('utm_events', settings.UTM_RETENTION_DAYS,
+                  lambda cutoff: self._expire_journal(UTMEvent, 'utm_events', UTMEvent.event_at, cutoff))
+        # События ссылаются на клики, поэтому клики удаляются после них
+        await run('utm_clicks', settings.UTM_RETENTION_DAYS, lambda cutoff: self._delete_in_batches(
+            UTMClick, [UTMClick.clicked_at < cutoff], 'utm_clicks', self._detach_utm_events
+        ))
+        await run('generations', settings.GENERATIONS_RETENTION_DAYS, lambda cutoff: self._delete_in_batches(
+            Generation,
+            [
+                Generation.created_at < cutoff,
+                Generation.status.in_([GenerationStatusEnum.COMPLETED, GenerationStatusEnum.FAILED])
+            ],
+            'generations',
+            self._detach_transactions
+        ))
+
+        return reports
+
+
+# Глобальный экземпляр
+retention = RetentionService()
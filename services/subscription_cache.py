@@ -0,0 +1,157 @@
+"""
+Кеш результатов проверки подписки на обязательный канал
+
+Вместо вызова getChatMember на каждое сообщение и callback храним результат
+проверки в Redis (общий для всех воркеров) с разным временем жизни для
+"подписан" и "не подписан". Положительные результаты дополнительно держим
+в памяти процесса, чтобы попадание в кеш не добавляло сетевых задержек.
+"""
+
+import asyncio
+import time
+import logging
+from typing import Optional, Dict, Tuple, Any
+
+from core.config import settings
+from services.cache_service import cache
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionCache:
+    """Двухуровневый кеш статуса подписки пользователей"""
+
+    def __init__(
+        self,
+        positive_ttl: int = 3600,
+        negative_ttl: int = 60,
+        local_ttl: int = 60,
+        redis_timeout: float = 0.5,
+        max_local_size: int = 50000
+    ):
+        """
+        Args:
+            positive_ttl: Время жизни результата "подписан" в секундах
+            negative_ttl: Время жизни результата "не подписан" в секундах
+            local_ttl: Время жизни положительного результата в памяти процесса
+            redis_timeout: Максимальное ожидание ответа Redis
+            max_local_size: Максимальный размер локального кеша
+        """
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.local_ttl = min(local_ttl, positive_ttl)
+        self.redis_timeout = redis_timeout
+        self.max_local_size = max_local_size
+        self._local: Dict[Tuple[str, int], float] = {}  # (канал, user_id) -> истекает
+
+        # Метрики
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(channel: str, user_id: int) -> str:
+        return f"subscription:{channel.lower()}:{user_id}"
+
+    async def get(self, channel: str, user_id: int) -> Optional[bool]:
+        """
+        Получить закешированный статус подписки
+
+        Returns:
+            True/False или None, если результата в кеше нет
+        """
+        local_key = (channel.lower(), user_id)
+        expires_at = self._local.get(local_key)
+        if expires_at is not None:
+            if expires_at >= time.monotonic():
+                self.local_hits += 1
+                return True
+            self._local.pop(local_key, None)
+
+        value = None
+        if cache.is_available:
+            try:
+                value = await asyncio.wait_for(
+                    cache.get(self._key(channel, user_id)),
+                    timeout=self.redis_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Subscription cache lookup timed out for user {user_id}")
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.redis_hits += 1
+        is_member = bool(value)
+        if is_member:
+            self._remember_local(local_key)
+        return is_member
+
+    async def set(self, channel: str, user_id: int, is_member: bool):
+        """Сохранить результат проверки подписки"""
+        local_key = (channel.lower(), user_id)
+        if is_member:
+            self._remember_local(local_key)
+        else:
+            self._local.pop(local_key, None)
+
+        if not cache.is_available:
+            return
+        try:
+            await asyncio.wait_for(
+                cache.set(
+                    self._key(channel, user_id),
+                    1 if is_member else 0,
+                    expire=self.positive_ttl if is_member else self.negative_ttl
+                ),
+                timeout=self.redis_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Subscription cache store timed out for user {user_id}")
+
+    async def invalidate(self, channel: str, user_id: int):
+        """Сбросить закешированный статус пользователя"""
+        self.invalidations += 1
+        self._local.pop((channel.lower(), user_id), None)
+
+        if not cache.is_available:
+            return
+        try:
+            await asyncio.wait_for(
+                cache.delete(self._key(channel, user_id)),
+                timeout=self.redis_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Subscription cache invalidation timed out for user {user_id}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        total = self.local_hits + self.redis_hits + self.misses
+        return {
+            'local_size': len(self._local),
+            'local_hits': self.local_hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round((self.local_hits + self.redis_hits) / total, 3) if total else 0.0
+        }
+
+    def _remember_local(self, local_key: Tuple[str, int]):
+        if self.local_ttl <= 0:
+            return
+        if len(self._local) >= self.max_local_size:
+            now = time.monotonic()
+            self._local = {k: exp for k, exp in self._local.items() if exp >= now}
+            if len(self._local) >= self.max_local_size:
+                self._local.pop(next(iter(self._local)))
+        self._local[local_key] = time.monotonic() + self.local_ttl
+
+
+# Глобальный экземпляр
+subscription_cache = SubscriptionCache(
+    positive_ttl=settings.SUBSCRIPTION_CACHE_POSITIVE_TTL,
+    negative_ttl=settings.SUBSCRIPTION_CACHE_NEGATIVE_TTL,
+    local_ttl=settings.SUBSCRIPTION_LOCAL_CACHE_TTL
+)
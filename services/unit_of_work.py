@@ -0,0 +1,96 @@
+"""
+Единица работы: одно соединение и одна транзакция на обработчик
+
+    async with db.uow():
+        await db.complete_transaction(transaction_id)
+        user = await db.get_user(telegram_id)
+        transaction = await db.get_transaction(transaction_id)
+
+Методы DatabaseService, вызванные внутри блока из той же задачи, получают
+общую сессию (db.session()): соединение берется из пула один раз, commit()
+методов только сбрасывает изменения (flush), а фиксация одна - при выходе из
+блока; исключение откатывает все. Действия после фиксации (живые счетчики,
+кеши в Redis) откладываются до нее. Вне блока методы работают как раньше.
+
+Внутри блока не запускайте вызовы БД параллельно (asyncio.gather):
+AsyncSession не поддерживает конкурентное использование. Задачи, созданные
+внутри блока, к нему не присоединяются и открывают свои сессии.
+"""
+
+import asyncio
+import inspect
+import logging
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+current_uow: ContextVar[Optional['UnitOfWork']] = ContextVar('db_uow', default=None)
+
+
+class UnitOfWorkRolledBack(Exception):
+    """Метод внутри единицы работы откатил ее транзакцию - изменения блока потеряны"""
+
+
+class UnitOfWork:
+    """Общая сессия и отложенные до фиксации действия"""
+
+    def __init__(self, database: Any, session: AsyncSession):
+        self.database = database
+        self.session = session
+        self.task = asyncio.current_task()
+        self.after_commit: List[Callable[[], Any]] = []
+        self.rolled_back = False
+        self.closed = False
+
+    def joins(self, database: Any) -> bool:
+        """Присоединяется ли к этой единице работы вызов database из текущей задачи"""
+        return not self.closed and self.database is database and self.task is asyncio.current_task()
+
+    async def rollback(self):
+        """Откатить транзакцию целиком (вызывается из метода при ошибке записи)"""
+        self.rolled_back = True
+        self.after_commit.clear()
+        await self.session.rollback()
+
+    async def run_after_commit(self):
+        """Выполнить действия, отложенные до фиксации"""
+        actions, self.after_commit = self.after_commit, []
+        for action in actions:
+            try:
+                result = action()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"After-commit action failed: {e}")
+
+
+class JoinedSession:
+    """
+    Сессия единицы работы, выданная методу: commit() - только flush,
+    закрытие не завершает транзакцию, остальное - как у AsyncSession
+    """
+
+    def __init__(self, uow: UnitOfWork):
+        self._uow = uow
+        self._session = uow.session
+
+    def __getattr__(self, name: str):
+        return getattr(self._session, name)
+
+    async def __aenter__(self) -> 'JoinedSession':
+        return self
+
+    async def __aexit__(self, *exc_info) -> bool:
+        return False
+
+    async def commit(self):
+        await self._session.flush()
+
+    async def rollback(self):
+        await self._uow.rollback()
+
+    async def close(self):
+        pass
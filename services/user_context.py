@@ -0,0 +1,158 @@
+"""
+Контекст пользователя в рамках одного апдейта и короткоживущий кеш пользователей
+
+AuthMiddleware загружает пользователя один раз и кладет его в контекст запроса,
+после чего все вызовы db.get_user() в хендлерах этого апдейта получают тот же
+объект без повторного SELECT.
+"""
+
+import time
+import logging
+from contextvars import ContextVar, Token
+from typing import Optional, Dict, List, Tuple, Any
+
+from models.models import User
+
+logger = logging.getLogger(__name__)
+
+# Пользователь текущего апдейта (устанавливается в AuthMiddleware).
+# Храним изменяемый слот, а не сам объект: фоновые задачи, запущенные из
+# хендлера, копируют контекст, и после завершения апдейта слот у них тоже пустеет
+_current_user: ContextVar[Optional[List[Optional[User]]]] = ContextVar("current_user", default=None)
+
+
+def bind_current_user(user: Optional[User]) -> Token:
+    """Привязать пользователя к текущему апдейту"""
+    return _current_user.set([user])
+
+
+def reset_current_user(token: Token):
+    """Сбросить пользователя апдейта (в конце обработки)"""
+    slot = _current_user.get()
+    if slot:
+        slot[0] = None
+    try:
+        _current_user.reset(token)
+    except ValueError:
+        # Токен создан в другом контексте
+        _current_user.set(None)
+
+
+def get_current_user(
+    telegram_id: Optional[int] = None,
+    user_id: Optional[int] = None
+) -> Optional[User]:
+    """Получить пользователя апдейта, если он совпадает с запрошенным"""
+    slot = _current_user.get()
+    user = slot[0] if slot else None
+    if user is None:
+        return None
+    if telegram_id is not None and user.telegram_id != telegram_id:
+        return None
+    if user_id is not None and user.id != user_id:
+        return None
+    return user
+
+
+def forget_current_user(
+    telegram_id: Optional[int] = None,
+    user_id: Optional[int] = None
+):
+    """Убрать пользователя из контекста после записи в БД"""
+    slot = _current_user.get()
+    user = slot[0] if slot else None
+    if user is None:
+        return
+    if (telegram_id is not None and user.telegram_id == telegram_id) or \
+       (user_id is not None and user.id == user_id):
+        slot[0] = None
+
+
+class UserCache:
+    """In-process кеш пользователей с коротким TTL"""
+
+    def __init__(self, ttl: float = 5.0, max_size: int = 10000):
+        """
+        Args:
+            ttl: Время жизни записи в секундах (0 - кеш отключен)
+            max_size: Максимальное количество записей
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._by_telegram_id: Dict[int, Tuple[float, User]] = {}
+        self._telegram_ids: Dict[int, int] = {}  # внутренний id -> telegram_id
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int) -> Optional[User]:
+        """Получить пользователя по telegram_id"""
+        entry = self._by_telegram_id.get(telegram_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self._drop(telegram_id)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return user
+
+    def get_by_id(self, user_id: int) -> Optional[User]:
+        """Получить пользователя по внутреннему ID"""
+        telegram_id = self._telegram_ids.get(user_id)
+        if telegram_id is None:
+            self.misses += 1
+            return None
+        return self.get(telegram_id)
+
+    def set(self, user: Optional[User]):
+        """Сохранить пользователя"""
+        if user is None or self.ttl <= 0:
+            return
+
+        if len(self._by_telegram_id) >= self.max_size:
+            self._evict_expired()
+            if len(self._by_telegram_id) >= self.max_size:
+                # Удаляем самую старую запись (dict сохраняет порядок вставки)
+                oldest = next(iter(self._by_telegram_id))
+                self._drop(oldest)
+
+        self._by_telegram_id.pop(user.telegram_id, None)
+        self._by_telegram_id[user.telegram_id] = (time.monotonic() + self.ttl, user)
+        self._telegram_ids[user.id] = user.telegram_id
+
+    def invalidate(self, telegram_id: Optional[int] = None, user_id: Optional[int] = None):
+        """Инвалидировать запись по telegram_id или внутреннему ID"""
+        if telegram_id is None and user_id is not None:
+            telegram_id = self._telegram_ids.get(user_id)
+        if telegram_id is not None:
+            self._drop(telegram_id)
+
+    def clear(self):
+        """Очистить кеш"""
+        self._by_telegram_id.clear()
+        self._telegram_ids.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._by_telegram_id),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+    def _drop(self, telegram_id: int):
+        entry = self._by_telegram_id.pop(telegram_id, None)
+        if entry is not None:
+            self._telegram_ids.pop(entry[1].id, None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [tid for tid, (expires_at, _) in self._by_telegram_id.items() if expires_at < now]
+        for telegram_id in expired:
+            self._drop(telegram_id)
@@ -245,7 +245,7 @@ class UTMAnalyticsService:
     ) -> Dict:
         """Получает аналитику по конкретной кампании"""
         
-        async with db.async_session() as session:
+        async with db.read_session('utm_analytics') as session:
             # Получаем кампанию
             result = await session.execute(
                 select(UTMCampaign).where(UTMCampaign.id == campaign_id)
@@ -452,7 +452,7 @@ class UTMAnalyticsService:
     ) -> List[Dict]:
         """Экспортирует данные кампании для CSV/Excel"""
         
-        async with db.async_session() as session:
+        async with db.read_session('utm_export') as session:
             # Получаем информацию о кампании
             campaign_result = await session.execute(
                 select(UTMCampaign).where(UTMCampaign.id == campaign_id)
@@ -567,7 +567,7 @@ class UTMAnalyticsService:
     ) -> List[Dict]:
         """Получает аналитику по топ источникам трафика"""
         
-        async with db.async_session() as session:
+        async with db.read_session('utm_analytics') as session:
             filters = []
             
             if start_date:
@@ -657,7 +657,7 @@ class UTMAnalyticsService:
     async def get_campaign_credit_analytics(self, campaign_id: int) -> Dict:
         """Получает детальную аналитику по кредитам для кампании"""
         
-        async with db.async_session() as session:
+        async with db.read_session('utm_analytics') as session:
             # Получаем общую статистику по кредитам
             summary_result = await session.execute(
                 select(
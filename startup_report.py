@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Отчет о времени импорта при запуске бота
+
+Запускает "python -X importtime -c 'import main'" в чистом процессе и
+показывает, сколько времени занимает импорт каждого пакета и модуля
+проекта. Шаги on_startup и время до первого апдейта смотрите в /health
+(раздел "startup") и в логе запуска.
+
+Примеры:
+    python startup_report.py
+    python startup_report.py --module bot.handlers --top 30
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+
+FIRST_PARTY = ('bot', 'services', 'core', 'models', 'main')
+
+
+def collect_import_times(module: str, runs: int):
+    """Время импорта модулей (мкс): self и cumulative, лучшее из нескольких запусков"""
+    best = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '0'}
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            times = (int(self_us), int(cumulative_us))
+            if name not in best or times[1] < best[name][1]:
+                best[name] = times
+    return best
+
+
+def print_table(title: str, rows, total_us: int):
+    print(f"\n{title}")
+    for name, value in rows:
+        print(f"  {value / 1000:9.1f} ms  {value / total_us * 100:5.1f}%  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time breakdown of the bot startup")
+    parser.add_argument('--module', default='main', help="Module to import (default: main)")
+    parser.add_argument('--runs', type=int, default=3, help="Runs, the best one is reported")
+    parser.add_argument('--top', type=int, default=15, help="Rows per table")
+    args = parser.parse_args()
+
+    times = collect_import_times(args.module, args.runs)
+    total_us = times[args.module][1]
+
+    packages = defaultdict(int)
+    for name, (self_us, _) in times.items():
+        packages[name.split('.')[0]] += self_us
+
+    first_party = [
+        (name, cumulative_us) for name, (_, cumulative_us) in times.items()
+        if name.split('.')[0] in FIRST_PARTY
+    ]
+
+    print(f"import {args.module}: {total_us / 1000:.1f} ms (best of {args.runs})")
+    print_table(
+        "By package (self time):",
+        sorted(packages.items(), key=lambda item: -item[1])[:args.top],
+        total_us
+    )
+    print_table(
+        "Project modules (cumulative, includes their dependencies):",
+        sorted(first_party, key=lambda item: -item[1])[:args.top],
+        total_us
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,25 @@
+"""
+Общие фикстуры тестов
+"""
+
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.database import DatabaseService
+
+
+@pytest_asyncio.fixture
+async def database(tmp_path):
+    """DatabaseService поверх временной SQLite базы"""
+    service = DatabaseService()
+    await service.engine.dispose()
+    service.engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    service.async_session = async_sessionmaker(service.engine, class_=AsyncSession, expire_on_commit=False)
+    await service.create_tables()
+    yield service
+    await service.engine.dispose()
@@ -0,0 +1,42 @@
+"""
+Тесты буфера отметок активности
+"""
+
+import pytest
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.activity_recorder import ActivityRecorder
+from services.database import db
+
+
+class TestActivityRecorder:
+    """Буфер не растет сверх предела, пока сбросы не проходят"""
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_is_bounded(self, monkeypatch):
+        recorder = ActivityRecorder(max_buffer_size=2, buffer_limit=3)
+
+        async def failing(batch):
+            # Пока идет сброс, приходят новые пользователи
+            recorder.touch(4)
+            recorder.touch(5)
+            raise ConnectionError("database is down")
+        monkeypatch.setattr(db, "bulk_update_user_activity", failing)
+
+        for telegram_id in (1, 2, 3):
+            recorder.touch(telegram_id)
+        assert await recorder.flush() == 0
+
+        # Из неудачной пачки вернулась одна отметка, две отброшены
+        assert len(recorder._buffer) == 3 and {4, 5} <= recorder._buffer.keys()
+        assert recorder.dropped_total == 2
+
+        # Отметка уже известного пользователя обновляется, нового - отбрасывается
+        recorder.touch(4)
+        recorder.touch(6)
+        stats = recorder.get_stats()
+        assert (stats['buffer_depth'], stats['dropped_total'], stats['flush_errors']) == (3, 3, 1)
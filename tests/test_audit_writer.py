@@ -0,0 +1,69 @@
+"""
+Тесты пакетной записи журналов аудита
+"""
+
+import pytest
+from sqlalchemy import select, func
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.models import UserAction, AdminLog
+from services.audit_writer import AuditWriter
+
+
+class TestAuditWriter:
+    """Журналы аудита пишутся пачками через очередь"""
+
+    @pytest.mark.asyncio
+    async def test_batches_overflow_and_drain(self, database):
+        user = await database.create_user(telegram_id=1)
+        database.audit.batch_size = 3
+        database.audit.max_queue_size = 5
+        database.audit.flush_interval = 60
+        database.audit.start()
+
+        for i in range(6):
+            await database.log_user_action(user.id, f"action_{i}", details={"i": i})
+        await database.log_admin_action(99, "ban", target_user_id=1)
+        # Обработчик не ждет БД: строки в очереди, лишние отброшены
+        stats = database.audit.get_stats()
+        assert (stats["written_total"], stats["dropped_total"]) == (5, 2)
+
+        await database.audit.stop()
+        assert database.audit.get_stats()["queue_depth"] == 0
+        async with database.async_session() as session:
+            actions = (await session.execute(select(UserAction.action).order_by(UserAction.id))).scalars().all()
+        assert actions == [f"action_{i}" for i in range(5)]
+
+        # Без фонового сброса (скрипты, Celery) строка пишется сразу
+        await database.log_admin_action(99, "unban", target_user_id=1)
+        async with database.async_session() as session:
+            assert (await session.execute(select(func.count(AdminLog.id)))).scalar() == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_insert_requeues_unwritten_rows(self):
+        written = []
+        failures = [ConnectionError("database is down")]
+
+        async def insert_rows(model, rows):
+            if model is AdminLog and failures:
+                raise failures.pop()
+            written.extend((model, row["n"]) for row in rows)
+            return len(rows)
+
+        writer = AuditWriter(insert_rows, batch_size=10, max_queue_size=10)
+        for n, model in enumerate([UserAction, AdminLog, UserAction, AdminLog]):
+            writer.write(model, {"n": n})
+
+        # Строки user_actions записаны, строки admin_logs вернулись в очередь по порядку
+        assert await writer.flush() == 2
+        assert written == [(UserAction, 0), (UserAction, 2)]
+        assert [row["n"] for _, row in writer._queue] == [1, 3]
+
+        assert await writer.flush() == 2
+        assert written[2:] == [(AdminLog, 1), (AdminLog, 3)]
+        stats = writer.get_stats()
+        assert (stats["queue_depth"], stats["flush_errors"], stats["rows_flushed_total"]) == (0, 1, 4)
@@ -0,0 +1,61 @@
+"""
+Тесты пересчета ежедневной статистики
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import select
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.models import GenerationStatusEnum, Statistics, TransactionTypeEnum
+
+
+class TestDailyStatistics:
+    """Ежедневная статистика: один проход по таблицам и повторяемый пересчет"""
+
+    @pytest.mark.asyncio
+    async def test_recalculate_is_idempotent(self, database):
+        user = await database.create_user(telegram_id=1)
+        today = datetime.utcnow().date()
+
+        done = await database.create_generation(user.id, "t2v", "model", "prompt", cost=10)
+        await database.update_generation_status(done.id, GenerationStatusEnum.COMPLETED, generation_time=30)
+        failed = await database.create_generation(user.id, "t2v", "model", "prompt", cost=10)
+        await database.update_generation_status(failed.id, GenerationStatusEnum.FAILED)
+        purchase = await database.create_transaction(user.id, TransactionTypeEnum.PURCHASE, 100, stars_paid=150)
+        await database.complete_transaction(purchase.id)
+
+        first = await database.recalculate_daily_statistics(today - timedelta(days=1), today)
+        second = await database.recalculate_daily_statistics(today - timedelta(days=1), today)
+        assert first == second
+        assert [row["date"] for row in second] == [today - timedelta(days=1), today]
+
+        row = second[1]
+        assert (row["new_users"], row["active_users"], row["paying_users"]) == (1, 1, 1)
+        assert (row["total_generations"], row["successful_generations"], row["failed_generations"]) == (2, 1, 1)
+        assert (row["revenue_stars"], row["revenue_credits"], row["avg_generation_time"]) == (150, 100, 30.0)
+        assert second[0]["total_generations"] == 0
+
+    @pytest.mark.asyncio
+    async def test_dry_run_and_overwrite(self, database):
+        await database.create_user(telegram_id=1)
+        today = datetime.utcnow().date()
+
+        # Расчет без записи (daily_stats_tool.py --dry-run)
+        rows = await database.calculate_daily_statistics(today)
+        assert [row["new_users"] for row in rows] == [1]
+        async with database.async_session() as session:
+            assert (await session.execute(select(Statistics))).scalars().all() == []
+
+        await database.recalculate_daily_statistics(today)
+        await database.create_user(telegram_id=2)
+        await database.recalculate_daily_statistics(today)
+
+        # Устаревшая строка дня перезаписана, а не продублирована
+        async with database.async_session() as session:
+            stored = (await session.execute(select(Statistics))).scalars().all()
+        assert [(row.date.date(), row.new_users) for row in stored] == [(today, 2)]
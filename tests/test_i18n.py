@@ -0,0 +1,143 @@
+"""
+Тесты плоских каталогов переводов (микробенчмарк I18n.get - i18n_benchmark.py)
+"""
+
+import pytest
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.middlewares.i18n import FormatTemplate, I18n, I18nMiddleware, i18n as shared_i18n
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'locales')
+
+
+class LegacyI18n(I18n):
+    """Прежняя реализация get: обход вложенных словарей на каждый вызов"""
+
+    def get(self, key: str, lang: str = None, default: str = None, **kwargs):
+        lang = lang or self.default_lang
+        translations = self.translations.get(lang) or self.translations.get(self.default_lang, {})
+
+        keys = key.split('.')
+        value = translations
+        for k in keys:
+            if isinstance(value, dict):
+                value = value.get(k)
+            else:
+                value = None
+                break
+
+        if value is None and lang != self.default_lang:
+            value = self.translations.get(self.default_lang, {})
+            for k in keys:
+                if isinstance(value, dict):
+                    value = value.get(k)
+                else:
+                    value = None
+                    break
+
+        if value is None:
+            return default if default is not None else key
+
+        if isinstance(value, str) and kwargs:
+            try:
+                return value.format(**kwargs)
+            except KeyError:
+                return value
+        return value
+
+
+def all_keys(data, prefix=''):
+    for key, value in data.items():
+        yield f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from all_keys(value, f"{prefix}{key}.")
+
+
+# Ключи экрана подтверждения генерации - один из самых "тяжелых" по переводам
+SCREEN_KEYS = [
+    "generation.beautiful.divider",
+    "generation.beautiful.create_title",
+    "generation.beautiful.ai_magic",
+    "generation.beautiful.mode_selection",
+    "generation.beautiful.processing_title",
+    "generation.beautiful.ai_working",
+    "generation.beautiful.progress_processing",
+    "generation.beautiful.progress_bar",
+    "generation.beautiful.please_wait",
+    "generation.beautiful.eta",
+    "menu.balance",
+    "common.back",
+    "common.cancel",
+    "missing.key.for.fallback",
+] * 2
+
+
+class TestI18nCatalog:
+    """Тесты плоских каталогов"""
+
+    @pytest.fixture
+    def i18n(self):
+        return I18n(default_lang='ru', locales_dir=LOCALES_DIR)
+
+    @pytest.fixture
+    def legacy(self):
+        return LegacyI18n(default_lang='ru', locales_dir=LOCALES_DIR)
+
+    def test_matches_legacy_lookup(self, i18n, legacy):
+        """Каталог возвращает то же, что и прежний обход словарей"""
+        keys = set()
+        for data in i18n.translations.values():
+            keys.update(all_keys(data))
+        keys.update(SCREEN_KEYS)
+
+        for lang in list(i18n.translations) + ['de', None]:
+            for key in keys:
+                assert i18n.get(key, lang) == legacy.get(key, lang), (lang, key)
+
+    def test_fallback_and_formatting(self, i18n):
+        """Фолбэк на язык по умолчанию и форматирование"""
+        i18n._catalogs['xx'] = I18n._flatten({'menu': {'balance': 'Credits: {balance}'}})
+        i18n._catalogs['xx'] = {**i18n._catalogs['ru'], **i18n._catalogs['xx']}
+
+        assert i18n.get('menu.balance', 'xx', balance=5) == 'Credits: 5'
+        assert i18n.get('common.back', 'xx') == i18n.get('common.back', 'ru')
+        assert i18n.get('menu.balance', 'xx', wrong=1) == 'Credits: {balance}'
+        assert i18n.get('no.such.key', 'xx', default='dflt') == 'dflt'
+        assert i18n.get('no.such.key', 'xx') == 'no.such.key'
+
+    def test_templates_match_str_format(self):
+        """Разобранные шаблоны дают то же, что str.format; сложные остаются str.format"""
+        cases = [
+            ('{name}: {balance:,} {{credits}}', {'name': 'Ann', 'balance': 1234567}),
+            ('{name!r:>8}|', {'name': 'x'}),
+            ('{{escaped}} only', {'name': 'x'}),
+        ]
+        for value, kwargs in cases:
+            template = FormatTemplate.compile(value)
+            assert isinstance(template, FormatTemplate)
+            assert template(**kwargs) == value.format(**kwargs)
+
+        with pytest.raises(KeyError):
+            FormatTemplate.compile('{balance}')(count=1)
+        for value in ('{}', '{user.name}', '{value:{width}}', 'unbalanced }'):
+            assert not isinstance(FormatTemplate.compile(value), FormatTemplate)
+
+    def test_reload_swaps_catalogs(self, i18n):
+        """Перезагрузка подменяет каталоги целиком"""
+        old_catalogs = i18n._catalogs
+        i18n.reload()
+        assert i18n._catalogs is not old_catalogs
+        assert i18n._catalogs.keys() == old_catalogs.keys()
+
+    def test_middleware_shares_module_catalog(self):
+        """Middleware и обработчики читают один каталог, перезагрузка видна обоим"""
+        middleware = I18nMiddleware()
+        assert middleware.i18n is shared_i18n
+
+        version = shared_i18n.version
+        shared_i18n.reload()
+        assert middleware.i18n.version == version + 1
@@ -0,0 +1,98 @@
+"""
+Тесты курсорной пагинации и поиска пользователей
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.handlers import admin
+from core.config import settings
+from services.database import encode_cursor, decode_cursor
+
+
+class TestPagination:
+    """Курсорная пагинация списков"""
+
+    @pytest.mark.asyncio
+    async def test_cursor_pages(self, database):
+        user = await database.create_user(telegram_id=1)
+        created = [
+            await database.create_generation(user.id, "t2v", "model", "prompt", cost=1)
+            for _ in range(5)
+        ]
+        newest_first = [generation.id for generation in reversed(created)]
+
+        first = await database.get_user_generations(user.id, limit=2)
+        second = await database.get_user_generations(user.id, limit=2, after=encode_cursor(first[-1]))
+        third = await database.get_user_generations(user.id, limit=2, after=encode_cursor(second[-1]))
+        assert [g.id for g in first + second + third] == newest_first
+
+        back = await database.get_user_generations(user.id, limit=2, before=encode_cursor(third[0]))
+        assert [g.id for g in back] == [g.id for g in second]
+
+        users = await database.get_all_users(limit=10, after=encode_cursor(user))
+        assert users == []
+        assert decode_cursor(encode_cursor(user)) == (user.created_at, user.id)
+
+
+    @pytest.mark.asyncio
+    async def test_admin_user_list_arrows(self, database, monkeypatch):
+        monkeypatch.setattr(admin, "db", database)
+        monkeypatch.setattr(settings, "ADMIN_IDS", [1])
+        for telegram_id in range(1, 22):
+            await database.create_user(telegram_id=telegram_id)
+
+        async def open_page(data):
+            callback = MagicMock()
+            callback.data = data
+            callback.from_user.id = 1
+            callback.answer = AsyncMock()
+            callback.message.edit_text = AsyncMock()
+            await admin.users_list(callback)
+            text = callback.message.edit_text.call_args.args[0]
+            markup = callback.message.edit_text.call_args.kwargs["reply_markup"]
+            arrows = {
+                button.text: button.callback_data
+                for row in markup.inline_keyboard for button in row if button.text in ("◀️", "▶️")
+            }
+            return text.count("ID: "), arrows
+
+        # Стрелка показывается, только если соседняя страница не пуста
+        count, arrows = await open_page("users_list_all")
+        assert (count, set(arrows)) == (10, {"▶️"})
+        count, arrows = await open_page(arrows["▶️"])
+        assert (count, set(arrows)) == (10, {"◀️", "▶️"})
+        second = arrows
+        count, arrows = await open_page(second["▶️"])
+        assert (count, set(arrows)) == (1, {"◀️"})
+
+        count, arrows = await open_page(arrows["◀️"])
+        assert (count, arrows) == (10, second)
+        # Возврат на первую страницу по курсору - без стрелки назад
+        count, arrows = await open_page(arrows["◀️"])
+        assert (count, set(arrows)) == (10, {"▶️"})
+
+
+class TestUserSearch:
+    """Поиск пользователей (на SQLite - запасной вариант через LIKE)"""
+
+    @pytest.mark.asyncio
+    async def test_search_paths(self, database):
+        await database.create_user(telegram_id=1001, username="magic_frame", first_name="Anna")
+        await database.create_user(telegram_id=1002, username="magic", first_name="Boris")
+        await database.create_user(telegram_id=1003, username="frame100", first_name="Magic")
+
+        assert [u.telegram_id for u in await database.search_users("1002")] == [1002]
+        # Префикс username: точное совпадение первым
+        assert [u.telegram_id for u in await database.search_users("@magic")] == [1002, 1001]
+        # Спецсимволы LIKE не работают как шаблон
+        assert [u.telegram_id for u in await database.search_users("@magic_")] == [1001]
+        # Подстрока в username или имени, точный username выше
+        assert [u.telegram_id for u in await database.search_users("MAGIC")][0] == 1002
+        assert {u.telegram_id for u in await database.search_users("magic")} == {1001, 1002, 1003}
+        assert [u.telegram_id for u in await database.get_all_users(search="frame")] == [1003, 1001]
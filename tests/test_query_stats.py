@@ -0,0 +1,57 @@
+"""
+Тесты статистики SQL-запросов
+"""
+
+import pytest
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.query_stats import QueryStats, fingerprint, redact
+
+
+class TestQueryStats:
+    """Статистика запросов по отпечаткам и методам DatabaseService"""
+
+    @pytest.mark.asyncio
+    async def test_statements_are_tagged(self, database, caplog):
+        stats = QueryStats(slow_threshold_ms=0)
+        stats.install(database.engine)
+
+        user = await database.create_user(telegram_id=1)
+        for _ in range(3):
+            await database.create_generation(user.id, "t2v", "model", "secret sunset", cost=1)
+        await database.get_user_generations(user.id, limit=10)
+
+        report = stats.get_report(limit=100)
+        listing = [item for item in report['queries'] if item['method'] == "DatabaseService.get_user_generations"]
+        assert len(listing) == 1
+        assert "LIMIT ?" in listing[0]['fingerprint'] and listing[0]['count'] == 1
+        # Три вставки - один отпечаток, помеченный самым внутренним методом
+        inserts = [
+            item for item in report['queries']
+            if item['method'] == "DatabaseService._add_generation" and item['fingerprint'].startswith("INSERT INTO generations")
+        ]
+        assert [item['count'] for item in inserts] == [3]
+        assert report['pool_wait']['count'] > 0
+        # Значения параметров не попадают в журнал медленных запросов
+        assert "secret sunset" not in "\n".join(r.getMessage() for r in caplog.records if "Slow query" in r.getMessage())
+
+    def test_fingerprints_and_overflow(self):
+        assert fingerprint("SELECT * FROM users WHERE name = 'O''Hara' AND id IN (1, 2, 3) LIMIT 10") == \
+            "SELECT * FROM users WHERE name = ? AND id IN (...) LIMIT ?"
+        assert fingerprint("SELECT t1.id FROM t1 WHERE id = $1 AND x = :x") == "SELECT t1.id FROM t1 WHERE id = ? AND x = ?"
+        assert redact({"name": "secret", "id": 7}) == "{name: str, id: int}"
+
+        # Сверх предела отпечатков статистика копится в "(other)"
+        stats = QueryStats(max_fingerprints=2)
+        for table in ("a", "b", "c", "d"):
+            stats.record(f"SELECT * FROM {table} WHERE id = 1", 0.002, "m", rows=1)
+        stats.record("SELECT * FROM a WHERE id = 2", 0.001, "m", rows=1)
+        counts = {item['fingerprint']: item['count'] for item in stats.get_report(order_by='count')['queries']}
+        assert counts == {"SELECT * FROM a WHERE id = ?": 2, "SELECT * FROM b WHERE id = ?": 1, "(other)": 2}
+
+        stats.reset()
+        assert stats.get_report()['statements'] == 0
@@ -0,0 +1,68 @@
+"""
+Тесты маршрутизации чтения на реплику
+"""
+
+import time
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestReadReplica:
+    """Маршрутизация тяжелого чтения на реплику с fallback на основную БД"""
+
+    @pytest.mark.asyncio
+    async def test_routes_and_fallbacks(self, database, tmp_path):
+        referrer = await database.create_user(telegram_id=1)
+        await database.create_user(telegram_id=2, referrer_telegram_id=1)
+
+        # Реплика не задана - чтение с основной
+        assert len(await database.get_referrals(referrer.id)) == 1
+        # Реплика - та же база (на SQLite отставание не проверяется)
+        database.replica_engine = database.engine
+        database.replica_session = database.async_session
+        assert len(await database.get_referrals(referrer.id)) == 1
+        async with database.read_session('referrals', max_lag=-1) as session:
+            assert session.bind is database.engine
+
+        # Недоступная реплика: fallback и пауза перед следующей попыткой
+        broken = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+        database.replica_engine = broken
+        database.replica_session = async_sessionmaker(broken, class_=AsyncSession, expire_on_commit=False)
+        database._replica_lag = None
+        for _ in range(2):
+            assert len(await database.get_referrals(referrer.id)) == 1
+        await broken.dispose()
+
+        routing = database.get_read_routing_stats()
+        assert routing['replica_down'] is True
+        assert routing['routes']['referrals'] == {'replica': 1, 'primary': 1, 'lagging': 1, 'unavailable': 2}
+
+    @pytest.mark.asyncio
+    async def test_lag_is_cached_and_replica_recovers(self, database):
+        database.replica_engine = database.engine
+        database.replica_session = database.async_session
+
+        # Замер отставания кешируется на DB_REPLICA_LAG_CHECK_INTERVAL
+        database._replica_lag, database._replica_lag_checked = 5.0, time.monotonic()
+        async with database.read_session('exports', max_lag=1):
+            pass
+        database._replica_lag_checked = 0.0
+        async with database.read_session('exports', max_lag=1):
+            pass
+        assert database._replica_lag == 0.0
+
+        # После паузы REPLICA_RETRY_AFTER реплика снова используется
+        database._replica_down_until = time.monotonic() + 60
+        async with database.read_session('exports'):
+            pass
+        database._replica_down_until = 0.0
+        async with database.read_session('exports'):
+            pass
+
+        routes = database.get_read_routing_stats()['routes']
+        assert routes['exports'] == {'replica': 2, 'primary': 0, 'lagging': 1, 'unavailable': 1}
@@ -0,0 +1,69 @@
+"""
+Тесты удаления истории по срокам хранения
+"""
+
+import pytest
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, update
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.retention import RetentionService, add_months
+from models.models import Generation, GenerationStatusEnum, TransactionTypeEnum, UserAction
+
+
+class TestRetention:
+    """Удаление истории порциями (на SQLite партиций нет)"""
+
+    @pytest.mark.asyncio
+    async def test_generations_are_deleted_in_batches(self, database, monkeypatch):
+        monkeypatch.setattr("services.retention.db", database)
+        user = await database.create_user(telegram_id=1)
+        await database.update_user_balance(user.id, 100)
+
+        old = [await database.start_generation(user.id, "t2v", "model", "prompt", cost=1) for _ in range(3)]
+        stuck = await database.create_generation(user.id, "t2v", "model", "prompt", cost=1)
+        fresh = await database.create_generation(user.id, "t2v", "model", "prompt", cost=1)
+        for generation in old + [fresh]:
+            await database.update_generation_status(generation.id, GenerationStatusEnum.COMPLETED)
+        async with database.async_session() as session:
+            await session.execute(
+                update(Generation)
+                .where(Generation.id.in_([g.id for g in old] + [stuck.id]))
+                .values(created_at=datetime.utcnow() - timedelta(days=40))
+            )
+            await session.commit()
+
+        reports = await RetentionService(batch_size=2, pause=0).apply_retention()
+        assert {report["table"]: report["rows"] for report in reports}["generations"] == 3
+
+        remaining = await database.get_user_generations(user.id, limit=10)
+        assert {g.id for g in remaining} == {stuck.id, fresh.id}
+        # Списания остаются в истории без ссылки на удаленную генерацию
+        debits = [t for t in await database.get_user_transactions(1) if t.type == TransactionTypeEnum.GENERATION]
+        assert [t.generation_id for t in debits] == [None, None, None]
+
+    @pytest.mark.asyncio
+    async def test_journal_without_partitions(self, database, monkeypatch):
+        monkeypatch.setattr("services.retention.db", database)
+        user = await database.create_user(telegram_id=1)
+        now = datetime(2024, 6, 15)
+        async with database.async_session() as session:
+            session.add_all([
+                UserAction(user_id=user.id, action=f"old_{i}", created_at=now - timedelta(days=91 + i))
+                for i in range(5)
+            ] + [UserAction(user_id=user.id, action="recent", created_at=now - timedelta(days=89))])
+            await session.commit()
+
+        reports = await RetentionService(batch_size=2, pause=0).apply_retention(now=now)
+        report = {report["table"]: report for report in reports}["user_actions"]
+        assert (report["rows"], report["partitions"], report["cutoff"]) == (5, [], now - timedelta(days=90))
+        async with database.async_session() as session:
+            assert (await session.execute(select(UserAction.action))).scalars().all() == ["recent"]
+
+    def test_add_months(self):
+        assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+        assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
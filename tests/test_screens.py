@@ -0,0 +1,65 @@
+"""
+Тесты скомпилированных шаблонов экранов
+"""
+
+import pytest
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.middlewares.i18n import I18n, i18n
+from bot.utils import screens
+from bot.utils.screens import ScreenTemplate
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'locales')
+
+
+class TestScreenTemplate:
+    """Переводы подставляются при компиляции, значения - при рендере"""
+
+    @pytest.fixture
+    def catalogs(self, monkeypatch):
+        catalogs = dict(i18n._catalogs)
+        catalogs['xx'] = {**catalogs.get(i18n.default_lang, {}), **I18n._flatten({
+            'screen': {
+                'title': 'Balance {not a field}',
+                'greeting': 'Hello, {name}!'
+            }
+        })}
+        monkeypatch.setattr(i18n, '_catalogs', catalogs)
+        return catalogs
+
+    def test_render(self, catalogs):
+        screen = ScreenTemplate("[[screen.title]]\n[[=screen.greeting]] {balance:,} {unknown}\n[[screen.missing|Default]]")
+
+        # Фигурные скобки обычного перевода не становятся полями, [[=...]] - становятся
+        assert screen.render('xx', name="Ann", balance=1500) == "Balance {not a field}\nHello, Ann! 1,500 {unknown}\nDefault"
+
+    def test_recompiles_after_reload(self, catalogs, monkeypatch):
+        screen = ScreenTemplate("[[screen.title]]")
+        assert screen.render('xx') == "Balance {not a field}"
+
+        catalogs['xx'] = {**catalogs['xx'], **I18n._flatten({'screen': {'title': 'Updated'}})}
+        # Пока версия переводов та же, используется скомпилированный шаблон
+        assert screen.render('xx') == "Balance {not a field}"
+
+        monkeypatch.setattr(i18n, 'version', i18n.version + 1)
+        assert screen.render('xx') == "Updated"
+
+    def test_module_screens_compile_for_every_language(self, monkeypatch):
+        """Экраны модуля компилируются на всех языках, ключи без default есть в каталогах"""
+        translator = I18n(locales_dir=LOCALES_DIR)
+        monkeypatch.setattr(screens, 'i18n', translator)
+        templates = [value for value in vars(screens).values() if isinstance(value, ScreenTemplate)]
+        assert templates
+
+        for lang in translator.translations:
+            for template in templates:
+                for _, key, default in screens._MARKER.findall(template.source):
+                    if not default:
+                        assert translator.get(key, lang) != key, (lang, key)
+                compiled = template.compile(lang)
+                assert "[[" not in compiled
+                assert screens._is_format_string(compiled), lang
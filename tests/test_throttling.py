@@ -0,0 +1,92 @@
+"""
+Тесты лимитов генерации и выполнения Lua-скриптов в Redis
+"""
+
+import asyncio
+import pytest
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis.asyncio as redis
+
+from bot.middlewares.throttling import UserThrottling
+from services.cache_service import CacheService, cache
+
+
+class StubRedis:
+    """Клиент Redis, скрипты которого зависают или теряют соединение"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.closed = False
+
+    def register_script(self, script):
+        async def call(keys, args, client):
+            if self.error:
+                raise self.error
+            await asyncio.sleep(10)
+        return call
+
+    async def close(self):
+        self.closed = True
+
+
+class TestGenerationRollback:
+    """Откат снимает ровно ту запись, которую добавил acquire"""
+
+    WINDOWS = [('per_minute', 2, 60), ('per_hour', 5, 3600)]
+
+    @pytest.fixture
+    def throttling(self, monkeypatch):
+        # Redis недоступен - лимиты считаются локально
+        async def unavailable(*args, **kwargs):
+            return None
+        monkeypatch.setattr(cache, "run_script", unavailable)
+        return UserThrottling()
+
+    @pytest.mark.asyncio
+    async def test_rollback_removes_own_reservation(self, throttling):
+        allowed, _, _, first = await throttling.acquire(1, self.WINDOWS)
+        assert allowed and first
+        await asyncio.sleep(0.01)
+        allowed, _, _, second = await throttling.acquire(1, self.WINDOWS)
+        assert allowed and second != first
+
+        # Минутный лимит исчерпан, отказ без id для отката
+        allowed, failed_index, _, reservation = await throttling.acquire(1, self.WINDOWS)
+        assert (allowed, failed_index, reservation) == (False, 0, None)
+
+        # Откат первой (не последней) записи
+        assert await throttling.rollback(1, self.WINDOWS, first) is True
+        assert await throttling.rollback(1, self.WINDOWS, first) is False
+        remaining = throttling.limits['per_minute'][1]
+        assert len(remaining) == 1 and remaining[0] == throttling._reservations[second]
+
+        allowed, _, _, third = await throttling.acquire(1, self.WINDOWS)
+        assert allowed and third not in (first, second)
+
+
+class TestRunScript:
+    """Таймаут скрипта не отключает Redis, обрыв соединения закрывает клиент"""
+
+    @pytest.mark.asyncio
+    async def test_timeout_falls_back_for_one_call(self):
+        service = CacheService(redis_url="redis://stub")
+        client = service._redis = StubRedis()
+
+        assert await service.run_script("return 1", keys=["key"], args=[], timeout=0.01) is None
+        assert service._redis is client and not client.closed
+        assert service.is_available
+
+    @pytest.mark.asyncio
+    async def test_connection_error_closes_client(self):
+        service = CacheService(redis_url="redis://stub")
+        client = service._redis = StubRedis(error=redis.ConnectionError("gone"))
+
+        assert await service.run_script("return 1", keys=["key"], args=[], timeout=1) is None
+        assert service._redis is None and client.closed
+        # Cooldown: следующие вызовы сразу уходят в fallback
+        assert not service.is_available
@@ -0,0 +1,68 @@
+"""
+Тесты единицы работы (db.uow())
+"""
+
+import pytest
+from sqlalchemy import event
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.models import TransactionTypeEnum, TransactionStatusEnum
+
+
+class TestUnitOfWork:
+    """Методы DatabaseService внутри db.uow() делят одно соединение и одну транзакцию"""
+
+    @pytest.mark.asyncio
+    async def test_shared_connection_and_rollback(self, database):
+        user = await database.create_user(telegram_id=1)
+        purchase = await database.create_transaction(user.id, TransactionTypeEnum.PURCHASE, 100, stars_paid=150)
+
+        checkouts = []
+        event.listen(database.engine.sync_engine.pool, "checkout", lambda *args: checkouts.append(1))
+
+        async with database.uow():
+            await database.complete_transaction(purchase.id, telegram_charge_id="charge")
+            refreshed = await database.get_user(1, use_cache=False)
+            transaction = await database.get_transaction(purchase.id)
+        assert len(checkouts) == 1
+        assert refreshed.balance == user.balance + 100
+        assert transaction.status == TransactionStatusEnum.COMPLETED
+
+        # Исключение откатывает все изменения блока
+        with pytest.raises(RuntimeError):
+            async with database.uow():
+                await database.update_user_balance(user.id, 50)
+                await database.add_credits(user.id, 30, "bonus")
+                raise RuntimeError("handler failed")
+        assert (await database.get_user(1, use_cache=False)).balance == refreshed.balance
+        assert await database.check_user_stats() == []
+
+        # Вне блока методы работают как раньше
+        await database.update_user_balance(user.id, 50)
+        assert (await database.get_user(1, use_cache=False)).balance == refreshed.balance + 50
+
+    @pytest.mark.asyncio
+    async def test_cache_is_filled_after_commit(self, database):
+        user = await database.create_user(telegram_id=1)
+        database.user_cache.invalidate(telegram_id=1)
+
+        # Прочитанный в откаченном блоке пользователь не попадает в кеш
+        with pytest.raises(RuntimeError):
+            async with database.uow():
+                await database.update_user_balance(user.id, 50)
+                assert (await database.get_user(1)).balance == user.balance + 50
+                raise RuntimeError("handler failed")
+        assert database.user_cache.get(1) is None
+        assert (await database.get_user(1)).balance == user.balance
+        assert (await database.get_user_by_id(user.id)).balance == user.balance
+
+        # После фиксации кешируется отсоединенный объект с загруженными полями
+        database.user_cache.invalidate(telegram_id=1)
+        async with database.uow():
+            await database.get_user(1)
+            assert database.user_cache.get(1) is None
+        assert database.user_cache.get(1).balance == user.balance
@@ -0,0 +1,211 @@
+"""
+Тесты материализованной статистики пользователя (user_stats)
+"""
+
+import asyncio
+import pytest
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, update, func
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.database import DatabaseService
+from models.models import Generation, GenerationStatusEnum, TransactionTypeEnum, UserStats
+
+
+async def aggregate(database, user_id):
+    async with database.async_session() as session:
+        return await database._aggregate_user_stats(session, user_id)
+
+
+class TestUserStats:
+    """Счетчики user_stats совпадают с агрегатами по исходным таблицам"""
+
+    @pytest.mark.asyncio
+    async def test_counters_follow_writes(self, database):
+        referrer = await database.create_user(telegram_id=1, first_name="Referrer")
+        # Строка статистики создается при первом чтении
+        assert (await database.get_user_statistics(1))["total_generations"] == 0
+
+        await database.create_user(telegram_id=2, referrer_telegram_id=1)
+
+        first = await database.create_generation(referrer.id, "t2v", "model", "prompt", cost=10)
+        second = await database.create_generation(referrer.id, "t2v", "model", "prompt", cost=10)
+        await database.update_generation_progress(first.id, 50, status="processing")
+        await database.update_generation_status(first.id, GenerationStatusEnum.COMPLETED)
+        # Повторное завершение не считается дважды
+        await database.update_generation_progress(first.id, 100, status="completed")
+        await database.update_generation_status(first.id, GenerationStatusEnum.COMPLETED)
+        await database.update_generation_status(second.id, GenerationStatusEnum.FAILED)
+
+        await database.rate_generation(first.id, 4)
+        await database.rate_generation(first.id, 5)
+        await database.rate_generation(second.id, 2)
+
+        await database.add_credits(referrer.id, 30, "bonus")
+        await database.add_credits_to_user(1, 7, admin_id=99)
+        gift = await database.create_transaction(referrer.id, TransactionTypeEnum.BONUS, 5)
+        await database.complete_transaction(gift.id)
+        await database.process_refund(gift.id)
+
+        stats = await database.get_user_statistics(1)
+        expected = await aggregate(database, referrer.id)
+
+        assert stats["total_generations"] == expected["total_generations"] == 2
+        assert stats["successful_generations"] == expected["successful_generations"] == 1
+        assert stats["average_rating"] == 3.5
+        assert stats["total_bonuses"] == expected["total_bonuses"]
+        assert stats["last_generation"] == expected["last_generation_at"]
+        assert await database.check_user_stats() == []
+
+    @pytest.mark.asyncio
+    async def test_check_and_rebuild(self, database):
+        user = await database.create_user(telegram_id=1)
+        await database.get_user_statistics(1)
+        await database.create_generation(user.id, "t2v", "model", "prompt", cost=10)
+
+        # Имитируем расхождение
+        async with database.async_session() as session:
+            await database._bump_user_stats(session, user.id, total_generations=-1, total_bonuses=3)
+            await session.commit()
+
+        fields = {mismatch["field"] for mismatch in await database.check_user_stats()}
+        assert fields == {"total_generations", "total_bonuses"}
+
+        stats = await database.rebuild_user_stats(user.id)
+        assert stats.total_generations == 1
+        assert await database.check_user_stats() == []
+
+    @pytest.mark.asyncio
+    async def test_streaks_are_incremental(self, database):
+        user = await database.create_user(telegram_id=1)
+        await database.get_user_statistics(1)
+        today = datetime.utcnow()
+
+        async def complete_on(days_ago):
+            generation = await database.create_generation(user.id, "t2v", "model", "prompt", cost=10)
+            async with database.async_session() as session:
+                await session.execute(
+                    update(Generation)
+                    .where(Generation.id == generation.id)
+                    .values(created_at=today - timedelta(days=days_ago))
+                )
+                await session.commit()
+            await database.update_generation_status(generation.id, GenerationStatusEnum.COMPLETED)
+
+        # Серия из трех дней, разрыв, затем серия из двух дней до сегодня
+        for days_ago in (10, 9, 8, 1, 0, 0):
+            await complete_on(days_ago)
+        stats = await database.get_user_statistics(1)
+        assert (stats["current_streak"], stats["max_streak"]) == (2, 3)
+
+        # Завершение генерации, созданной за день до начала текущей серии
+        await complete_on(2)
+        stats = await database.get_user_statistics(1)
+        assert (stats["current_streak"], stats["max_streak"]) == (3, 3)
+
+        expected = await aggregate(database, user.id)
+        assert (expected["current_streak"], expected["max_streak"]) == (3, 3)
+        assert await database.check_user_stats() == []
+
+    def test_streaks_from_days(self):
+        day = date(2024, 3, 1)
+        days = [day, day + timedelta(days=1), day + timedelta(days=5), (day + timedelta(days=6)).isoformat()]
+        assert DatabaseService._streaks_from_days(days) == (day + timedelta(days=6), 2, 2)
+        assert DatabaseService._streaks_from_days([]) == (None, 0, 0)
+
+    @pytest.mark.asyncio
+    async def test_bonus_credits_ledger(self, database):
+        user = await database.create_user(telegram_id=1)
+        await database.add_credits(user.id, 30, "bonus")
+
+        first = await database.create_generation(user.id, "t2v", "model", "prompt", cost=20)
+        # Бонусы уже заняты первой генерацией, хотя она еще не завершена
+        second = await database.create_generation(user.id, "t2v", "model", "prompt", cost=20)
+        assert first.used_bonus_credits is True
+        assert second.used_bonus_credits is False
+
+        # Неудачная генерация освобождает кредиты
+        await database.update_generation_status(first.id, GenerationStatusEnum.FAILED)
+        await database.update_generation_status(second.id, GenerationStatusEnum.FAILED)
+        third = await database.create_generation(user.id, "t2v", "model", "prompt", cost=20)
+        assert third.used_bonus_credits is True
+
+        expected = await aggregate(database, user.id)
+        assert (expected["bonus_granted"], expected["credits_consumed"]) == (30, 20)
+        assert await database.check_user_stats() == []
+
+    @pytest.mark.asyncio
+    async def test_referral_statistics(self, database):
+        referrer = await database.create_user(telegram_id=1)
+        for telegram_id in range(2, 6):
+            await database.create_user(telegram_id=telegram_id, referrer_telegram_id=1)
+        await database.create_user(telegram_id=6)
+
+        # Активны рефералы с генерациями, в том числе неудачными
+        active = await database.get_user(2)
+        await database.create_generation(active.id, "t2v", "model", "prompt", cost=10)
+        failed = await database.create_generation((await database.get_user(3)).id, "t2v", "model", "prompt", cost=10)
+        await database.update_generation_status(failed.id, GenerationStatusEnum.FAILED)
+
+        stats = await database.get_referral_statistics(referrer.id, limit=3, use_cache=False)
+        assert (stats["total_referrals"], stats["active_referrals"], stats["this_month"]) == (4, 2, 4)
+        assert len(stats["recent_referrals"]) == 3
+
+        page = await database.get_referrals(referrer.id, limit=3, offset=3)
+        assert [(referral["id"], referral["is_active"]) for referral in page] == [(active.id, True)]
+        assert await database.get_referral_statistics(999, use_cache=False) == {}
+
+    @pytest.mark.asyncio
+    async def test_start_generation_debits_once(self, database):
+        user = await database.create_user(telegram_id=1)
+        await database.update_user_balance(user.id, 100)
+        cost = user.balance + 100 - 5
+
+        # Двойное нажатие: хватает кредитов только на одну генерацию
+        results = await asyncio.gather(*[
+            database.start_generation(user.id, "t2v", "model", "prompt", cost=cost)
+            for _ in range(2)
+        ])
+        started = [generation for generation in results if generation is not None]
+        assert len(started) == 1
+
+        assert (await database.get_user_by_id(user.id)).balance == 5
+        transactions = await database.get_user_transactions(1)
+        debit = [t for t in transactions if t.type == TransactionTypeEnum.GENERATION]
+        assert [(t.amount, t.balance_after, t.generation_id) for t in debit] == [(-cost, 5, started[0].id)]
+        assert await database.check_user_stats() == []
+
+    @pytest.mark.asyncio
+    async def test_first_generation_without_stats_row(self, database):
+        user = await database.create_user(telegram_id=1)
+        other = await database.create_user(telegram_id=2)
+        async with database.async_session() as session:
+            assert await session.get(UserStats, user.id) is None
+
+        # Строка строится в транзакции списания и фиксируется вместе с ним
+        generation = await database.start_generation(user.id, "t2v", "model", "prompt", cost=10)
+        assert (await database.get_user_by_id(user.id)).balance == user.balance - 10
+        debit = [t for t in await database.get_user_transactions(1) if t.type == TransactionTypeEnum.GENERATION]
+        assert [(t.amount, t.generation_id) for t in debit] == [(-10, generation.id)]
+        async with database.async_session() as session:
+            stats = await session.get(UserStats, user.id)
+            assert (stats.total_generations, stats.credits_consumed) == (1, 10)
+
+        # Построение строки не фиксирует транзакцию вызывающего
+        async with database.async_session() as session:
+            await database._is_using_bonus_credits(session, other.id, 10)
+            await session.rollback()
+        with pytest.raises(RuntimeError):
+            async with database.uow():
+                await database.start_generation(other.id, "t2v", "model", "prompt", cost=10)
+                raise RuntimeError("handler failed")
+        assert (await database.get_user_by_id(other.id)).balance == other.balance
+        async with database.async_session() as session:
+            assert await session.get(UserStats, other.id) is None
+            generations = await session.execute(select(func.count(Generation.id)).where(Generation.user_id == other.id))
+            assert generations.scalar() == 0
+        assert await database.check_user_stats() == []
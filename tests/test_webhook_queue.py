@@ -0,0 +1,123 @@
+"""
+Тесты очереди апдейтов вебхука
+"""
+
+import asyncio
+import pytest
+from aiogram import Bot, Dispatcher
+
+# Импортируем тестируемые функции
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.webhook import QueuedRequestHandler, get_update_user_id
+
+
+class FakeRequest:
+    """Запрос вебхука с готовым апдейтом"""
+
+    def __init__(self, update):
+        self.update = update
+
+    async def json(self, loads=None):
+        return self.update
+
+
+def message_update(update_id, user_id):
+    return {'update_id': update_id, 'message': {'from': {'id': user_id}, 'chat': {'id': user_id}}}
+
+
+def make_handler(feed_raw_update, **kwargs):
+    dispatcher = Dispatcher()
+    dispatcher.feed_raw_update = feed_raw_update
+    bot = Bot(token="42:TEST")
+    return QueuedRequestHandler(dispatcher=dispatcher, bot=bot, **kwargs), bot
+
+
+class TestQueuedRequestHandler:
+    """Апдейты пользователя идут по порядку, переполнение очереди - отказ 503"""
+
+    @pytest.mark.asyncio
+    async def test_per_user_order(self):
+        handled = []
+
+        async def feed_raw_update(bot, update, **kwargs):
+            # Нечетные апдейты обрабатываются дольше - порядок пользователя не должен меняться
+            await asyncio.sleep(0.01 if update['update_id'] % 2 else 0)
+            handled.append((get_update_user_id(update), update['update_id']))
+
+        handler, bot = make_handler(feed_raw_update, workers=2, max_queue_size=100)
+        for update_id in range(10):
+            response = await handler._handle_request_background(bot, FakeRequest(message_update(update_id, 1 + update_id % 3)))
+            assert response.status == 200
+        await handler.close()
+
+        for user_id in (1, 2, 3):
+            ids = [update_id for user, update_id in handled if user == user_id]
+            assert ids == sorted(ids) and ids
+        stats = handler.get_stats()
+        assert (stats['enqueued_total'], stats['processed_total'], stats['depth']) == (10, 10, 0)
+
+    @pytest.mark.asyncio
+    async def test_slow_user_does_not_block_others(self):
+        release = asyncio.Event()
+        handled = []
+
+        async def feed_raw_update(bot, update, **kwargs):
+            user_id = get_update_user_id(update)
+            if user_id == 1:
+                await release.wait()
+            handled.append(user_id)
+
+        handler, bot = make_handler(feed_raw_update, workers=2, max_queue_size=100)
+        # Пользователи 1 и 3 попали бы в один шард при шардировании по ID
+        for update_id, user_id in enumerate((1, 1, 3, 3, 5)):
+            await handler._handle_request_background(bot, FakeRequest(message_update(update_id, user_id)))
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        assert handled == [3, 3, 5]
+        stats = handler.get_stats()
+        assert (stats['in_flight'], stats['depth'], stats['busiest_user_depth']) == (1, 1, 1)
+
+        release.set()
+        await handler.close()
+        assert handled == [3, 3, 5, 1, 1]
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_capped(self):
+        async def feed_raw_update(bot, update, **kwargs):
+            await asyncio.sleep(0.01)
+
+        handler, bot = make_handler(feed_raw_update, workers=2, max_queue_size=100)
+        for update_id in range(6):
+            await handler._handle_request_background(bot, FakeRequest(message_update(update_id, update_id)))
+        await handler.close()
+
+        stats = handler.get_stats()
+        assert (stats['processed_total'], stats['max_in_flight'], stats['active_users']) == (6, 2, 0)
+
+    @pytest.mark.asyncio
+    async def test_overflow_is_rejected(self):
+        release = asyncio.Event()
+
+        async def feed_raw_update(bot, update, **kwargs):
+            await release.wait()
+
+        handler, bot = make_handler(feed_raw_update, workers=1, max_queue_size=2, put_timeout=0.05)
+        statuses = [
+            (await handler._handle_request_background(bot, FakeRequest(message_update(update_id, 1 + update_id)))).status
+            for update_id in range(3)
+        ]
+        # Два апдейта приняты (один в работе, второй ждет слота), третьему места нет
+        assert statuses == [200, 200, 503]
+        stats = handler.get_stats()
+        assert (stats['rejected_total'], stats['backpressure_waits']) == (1, 1)
+        assert (stats['in_flight'], stats['depth']) == (1, 1)
+
+        release.set()
+        await handler.close()
+        assert handler.get_stats()['processed_total'] == 2
+        # После остановки новые апдейты не принимаются
+        assert (await handler._handle_request_background(bot, FakeRequest(message_update(3, 1)))).status == 503
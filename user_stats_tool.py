@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Сверка и пересчет материализованной статистики пользователей (user_stats):
+счетчиков генераций и оценок, серий активности и учета бонусных кредитов
+
+Примеры:
+    python user_stats_tool.py --check              # найти расхождения
+    python user_stats_tool.py --check --fix        # пересчитать пользователей с расхождениями
+    python user_stats_tool.py --rebuild 12 345     # пересчитать конкретных пользователей (внутренние ID)
+    python user_stats_tool.py --rebuild-all        # разовое заполнение для всех пользователей
+"""
+
+import sys
+import asyncio
+import argparse
+
+from sqlalchemy import select
+
+from services.database import db
+from models.models import User
+
+
+async def run(args) -> int:
+    try:
+        if args.rebuild_all:
+            async with db.async_session() as session:
+                result = await session.execute(select(User.id).order_by(User.id))
+                user_ids = list(result.scalars().all())
+            for index, user_id in enumerate(user_ids, 1):
+                await db.rebuild_user_stats(user_id)
+                if index % 1000 == 0:
+                    print(f"Rebuilt {index}/{len(user_ids)}")
+            print(f"Rebuilt: {len(user_ids)} users")
+            return 0
+
+        if args.rebuild:
+            for user_id in args.rebuild:
+                stats = await db.rebuild_user_stats(user_id)
+                print(
+                    f"user {user_id}: generations {stats.total_generations} "
+                    f"(successful {stats.successful_generations}), bonuses {stats.total_bonuses}, "
+                    f"streak {stats.current_streak}/{stats.max_streak}"
+                )
+            return 0
+
+        mismatches = await db.check_user_stats()
+        for mismatch in mismatches:
+            print(
+                f"user {mismatch['user_id']}: {mismatch['field']} "
+                f"stored={mismatch['stored']} expected={mismatch['expected']}"
+            )
+        print(f"Mismatches: {len(mismatches)}")
+
+        if args.fix and mismatches:
+            user_ids = sorted({mismatch['user_id'] for mismatch in mismatches})
+            for user_id in user_ids:
+                await db.rebuild_user_stats(user_id)
+            print(f"Rebuilt: {len(user_ids)} users")
+
+        return 1 if mismatches and not args.fix else 0
+    finally:
+        await db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or rebuild the user_stats table")
+    parser.add_argument('--check', action='store_true', help="Compare user_stats with the source tables")
+    parser.add_argument('--fix', action='store_true', help="Rebuild users with mismatches (with --check)")
+    parser.add_argument('--rebuild', type=int, nargs='+', metavar='USER_ID', help="Rebuild the given users")
+    parser.add_argument('--rebuild-all', action='store_true', help="Rebuild every user (one-off backfill)")
+    args = parser.parse_args()
+
+    if not args.check and not args.rebuild and not args.rebuild_all:
+        parser.error("use --check, --rebuild or --rebuild-all")
+
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())